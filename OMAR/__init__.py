@@ -1,3 +1,15 @@
-from jaxtyping import install_import_hook
-with install_import_hook("omar", "beartype.beartype"):
-    from .omar import OMAR
\ No newline at end of file
+import os
+
+from beartype import beartype
+from jaxtyping import install_import_hook, jaxtyped
+
+# Production mode checks the types and shapes at the public interface only, the private routines run uninstrumented
+if os.environ.get("OMAR_PRODUCTION", "0") == "1":
+    from .omar import OMAR, BasisCache, FrozenOMAR, Workspace, row_chunks
+
+    OMAR.find_bases = jaxtyped(typechecker=beartype)(OMAR.find_bases)
+    OMAR.__call__ = jaxtyped(typechecker=beartype)(OMAR.__call__)
+    FrozenOMAR.__call__ = jaxtyped(typechecker=beartype)(FrozenOMAR.__call__)
+else:
+    with install_import_hook("omar", "beartype.beartype"):
+        from .omar import OMAR, BasisCache, FrozenOMAR, Workspace, row_chunks
@@ -1,86 +1,281 @@
 module backend
     use omp_lib
     implicit none
+    ! Pointer and assumed-shape output arguments can't be wrapped by f2py
+    private :: carve_vector, carve_matrix, basis_function, normal_equations
+    ! Rows per tile of the fused fit kernel, small enough for a tile of the data matrix to stay in cache
+    integer, parameter :: row_tile = 256
 contains
+    subroutine workspace_shape(n_samples, max_nbases, nresponses, nrows, ncols)
+        integer, intent(in) :: n_samples
+        integer, intent(in) :: max_nbases
+        integer, intent(in) :: nresponses
+
+        integer, intent(out) :: nrows
+        integer, intent(out) :: ncols
+
+        ! Per thread: data matrix, normal equations, eligible roots, knots and sweep sums. The right hand side, the
+        ! coefficients and the sums of the response variables have one column per response variable. The first column
+        ! is shared and holds the fit of the model selected in the previous iteration, which is smaller.
+        nrows = n_samples * (max_nbases + 1) + 2 * (max_nbases - 1) ** 2 + (2 * nresponses + 4) * (max_nbases - 1) &
+                + 2 * nresponses + 2
+        ncols = omp_get_max_threads() + 1
+    end subroutine workspace_shape
+
+    subroutine get_max_threads(nthreads)
+        integer, intent(out) :: nthreads
+
+        nthreads = omp_get_max_threads()
+    end subroutine get_max_threads
+
+    subroutine set_num_threads(nthreads)
+        integer, intent(in) :: nthreads
+
+        ! The limit only applies to the parallel regions started by the calling thread, so fits on several Python
+        ! threads can split the cores between them
+        call omp_set_num_threads(nthreads)
+    end subroutine set_num_threads
+
+    subroutine carve_vector(buffer, offset, n, vector)
+        real(8), intent(inout), target, contiguous :: buffer(:)
+        integer, intent(inout) :: offset
+        integer, intent(in) :: n
+
+        real(8), pointer, contiguous, intent(out) :: vector(:)
+
+        vector(1:n) => buffer(offset + 1:offset + n)
+        offset = offset + n
+    end subroutine carve_vector
+
+    subroutine carve_matrix(buffer, offset, nrows, ncols, matrix)
+        real(8), intent(inout), target, contiguous :: buffer(:)
+        integer, intent(inout) :: offset
+        integer, intent(in) :: nrows
+        integer, intent(in) :: ncols
+
+        real(8), pointer, contiguous, intent(out) :: matrix(:, :)
+
+        matrix(1:nrows, 1:ncols) => buffer(offset + 1:offset + nrows * ncols)
+        offset = offset + nrows * ncols
+    end subroutine carve_matrix
+
     subroutine active_base_indices(mask, nbases, result)
-        logical, intent(in) :: mask(:, :)
+        logical, intent(in) :: mask(:)
         integer, intent(in) :: nbases
 
         integer, intent(out) :: result(nbases - 1)
 
         integer :: j
-        logical :: active_base_mask(size(mask, 2))
 
-        active_base_mask = any(mask, dim = 1)
-
-        result = pack([(j, j = 1, size(mask, 2))], active_base_mask)
+        result = pack([(j, j = 1, size(mask))], mask)
 
     end subroutine active_base_indices
 
-    subroutine data_matrix(x, basis_indices, mask, truncated, cov, root, data_matrix_out, data_matrix_mean)
+    subroutine data_matrix(x, basis_indices, parent, truncated, cov, root, data_matrix_out, data_matrix_mean)
         real(8), intent(in) :: x(:, :)
         integer, intent(in) :: basis_indices(:)
-        logical, intent(in) :: mask(:, :)
-        logical, intent(in) :: truncated(:, :)
-        integer, intent(in) :: cov(:, :)
-        real(8), intent(in) :: root(:, :)
+        integer, intent(in) :: parent(:)
+        logical, intent(in) :: truncated(:)
+        integer, intent(in) :: cov(:)
+        real(8), intent(in) :: root(:)
 
         real(8), intent(out) :: data_matrix_out(size(x, 1), size(basis_indices))
         real(8), intent(out) :: data_matrix_mean(size(basis_indices))
 
-        integer :: i, basis_idx, func_idx
-        real(8) :: intermediate_result(size(x, 1))
-
-        data_matrix_out = 1.0d0
+        integer :: i
 
+        ! Columns are independent, without an intermediate result no per-thread buffer of size N is needed
+        !$OMP PARALLEL DO
         do i = 1, size(basis_indices)
-            basis_idx = basis_indices(i)
-            do func_idx = 1, size(mask, 1)
-                if (mask(func_idx, basis_idx)) then
-                    intermediate_result = x(:, cov(func_idx, basis_idx)) - root(func_idx, basis_idx)
-                    if (truncated(func_idx, basis_idx)) then
-                        intermediate_result = max(0.0d0, intermediate_result)
-                    end if
-                    data_matrix_out(:, i) = data_matrix_out(:, i) * intermediate_result
-                end if
-            end do
+            call basis_function(x, basis_indices(i), parent, truncated, cov, root, data_matrix_out(:, i))
             data_matrix_mean(i) = sum(data_matrix_out(:, i)) / size(x, 1)
             data_matrix_out(:, i) = data_matrix_out(:, i) - data_matrix_mean(i)
         end do
+        !$OMP END PARALLEL DO
     end subroutine data_matrix
 
+    subroutine basis_function(x, basis_idx, parent, truncated, cov, root, values)
+        real(8), intent(in) :: x(:, :)
+        integer, intent(in) :: basis_idx
+        integer, intent(in) :: parent(:)
+        logical, intent(in) :: truncated(:)
+        integer, intent(in) :: cov(:)
+        real(8), intent(in) :: root(:)
+
+        real(8), intent(out) :: values(:)
+
+        integer :: chain(size(parent))
+        integer :: depth
+        integer :: func_idx
+
+        ! Collect the parent chain, so the hinges are multiplied from the first one on
+        depth = 0
+        func_idx = basis_idx
+        do while (func_idx > 1)
+            depth = depth + 1
+            chain(depth) = func_idx
+            func_idx = parent(func_idx)
+        end do
+
+        values = 1.0d0
+        do depth = depth, 1, -1
+            func_idx = chain(depth)
+            if (truncated(func_idx)) then
+                values = values * max(0.0d0, x(:, cov(func_idx)) - root(func_idx))
+            else
+                values = values * (x(:, cov(func_idx)) - root(func_idx))
+            end if
+        end do
+    end subroutine basis_function
+
+    subroutine normal_equations(x, y, y_mean, basis_indices, parent, truncated, cov, root, &
+            data_matrix_mean, covariance_matrix_out, rhs_out, y_centred_sq, data_matrix_out)
+        real(8), intent(in) :: x(:, :)
+        real(8), intent(in) :: y(:, :)
+        real(8), intent(in) :: y_mean(:)
+        integer, intent(in) :: basis_indices(:)
+        integer, intent(in) :: parent(:)
+        logical, intent(in) :: truncated(:)
+        integer, intent(in) :: cov(:)
+        real(8), intent(in) :: root(:)
+
+        real(8), intent(out) :: data_matrix_mean(size(basis_indices))
+        real(8), intent(out) :: covariance_matrix_out(size(basis_indices), size(basis_indices))
+        real(8), intent(out) :: rhs_out(size(basis_indices), size(y, 2))
+        real(8), intent(out) :: y_centred_sq
+        real(8), intent(out), optional :: data_matrix_out(size(x, 1), size(basis_indices))
+
+        real(8) :: shift(size(basis_indices))
+        real(8), allocatable :: tile(:, :)
+        real(8), allocatable :: y_centred(:, :)
+        real(8), allocatable :: thread_covariance(:, :, :)
+        real(8), allocatable :: thread_rhs(:, :, :)
+        real(8), allocatable :: thread_column_sum(:, :)
+        real(8), allocatable :: thread_y_centred_sq(:)
+        real(8), allocatable :: thread_y_centred_sum(:, :)
+        real(8) :: y_centred_sum(size(y, 2))
+        integer :: nrows, ncols, nresponses, ntile, nthreads, thread
+        integer :: first, i, j
+
+        nrows = size(x, 1)
+        ncols = size(basis_indices)
+        nresponses = size(y, 2)
+        nthreads = omp_get_max_threads()
+
+        ! The first row shifts the columns, so the centring of the sums below does not cancel
+        do i = 1, ncols
+            call basis_function(x(1:1, :), basis_indices(i), parent, truncated, cov, root, shift(i:i))
+        end do
+
+        ! Every thread evaluates the bases on its row tiles and accumulates the lower triangle of the covariance
+        ! matrix, the rhs and the sums while the tile is in cache. The partial sums are reduced in the order of
+        ! the threads, which keeps the result independent of the scheduling.
+        allocate(thread_covariance(ncols, ncols, nthreads), thread_rhs(ncols, nresponses, nthreads), &
+                thread_column_sum(ncols, nthreads), thread_y_centred_sq(nthreads), &
+                thread_y_centred_sum(nresponses, nthreads))
+        thread_covariance = 0.0d0
+        thread_rhs = 0.0d0
+        thread_column_sum = 0.0d0
+        thread_y_centred_sq = 0.0d0
+        thread_y_centred_sum = 0.0d0
+        !$OMP PARALLEL PRIVATE(tile, y_centred, ntile, thread, i, j) IF(nrows > row_tile)
+        thread = omp_get_thread_num() + 1
+        allocate(tile(row_tile, ncols), y_centred(row_tile, nresponses))
+        !$OMP DO SCHEDULE(static)
+        do first = 1, nrows, row_tile
+            ntile = min(row_tile, nrows - first + 1)
+            do i = 1, ncols
+                call basis_function(x(first:first + ntile - 1, :), basis_indices(i), parent, truncated, cov, root, &
+                        tile(1:ntile, i))
+                tile(1:ntile, i) = tile(1:ntile, i) - shift(i)
+                thread_column_sum(i, thread) = thread_column_sum(i, thread) + sum(tile(1:ntile, i))
+            end do
+            do j = 1, nresponses
+                y_centred(1:ntile, j) = y(first:first + ntile - 1, j) - y_mean(j)
+                thread_y_centred_sum(j, thread) = thread_y_centred_sum(j, thread) + sum(y_centred(1:ntile, j))
+            end do
+            thread_y_centred_sq(thread) = thread_y_centred_sq(thread) + sum(y_centred(1:ntile, :) ** 2)
+
+            if (ncols > 0) then
+                call dsyrk('L', 'T', ncols, ntile, 1.0d0, tile, row_tile, 1.0d0, thread_covariance(1, 1, thread), &
+                        ncols)
+                call dgemm('T', 'N', ncols, nresponses, ntile, 1.0d0, tile, row_tile, y_centred, row_tile, 1.0d0, &
+                        thread_rhs(1, 1, thread), ncols)
+                if (present(data_matrix_out)) then
+                    data_matrix_out(first:first + ntile - 1, :) = tile(1:ntile, :)
+                end if
+            end if
+        end do
+        !$OMP END DO
+        deallocate(tile, y_centred)
+        !$OMP END PARALLEL
+
+        covariance_matrix_out = sum(thread_covariance, dim = 3)
+        rhs_out = sum(thread_rhs, dim = 3)
+        data_matrix_mean = sum(thread_column_sum, dim = 2) / nrows
+        y_centred_sq = sum(thread_y_centred_sq)
+        y_centred_sum = sum(thread_y_centred_sum, dim = 2)
+
+        ! Centre the sums instead of the columns, C - N mu mu^T, mirror the lower triangle and add epsilon to the
+        ! diagonal
+        do j = 1, ncols
+            do i = j, ncols
+                covariance_matrix_out(i, j) = covariance_matrix_out(i, j) &
+                        - nrows * data_matrix_mean(i) * data_matrix_mean(j)
+                covariance_matrix_out(j, i) = covariance_matrix_out(i, j)
+            end do
+            covariance_matrix_out(j, j) = covariance_matrix_out(j, j) + 1.0d-8
+            rhs_out(j, :) = rhs_out(j, :) - data_matrix_mean(j) * y_centred_sum
+        end do
+
+        ! Only a requested data matrix is centred, the normal equations do not need it
+        if (present(data_matrix_out)) then
+            !$OMP PARALLEL DO IF(nrows > row_tile)
+            do j = 1, ncols
+                data_matrix_out(:, j) = data_matrix_out(:, j) - data_matrix_mean(j)
+            end do
+            !$OMP END PARALLEL DO
+        end if
+        data_matrix_mean = data_matrix_mean + shift
+    end subroutine normal_equations
+
     subroutine covariance_matrix(data_matrix, covariance_matrix_out)
         real(8), intent(in) :: data_matrix(:, :)
         real(8), intent(out) :: covariance_matrix_out(size(data_matrix, 2), size(data_matrix, 2))
 
-        integer :: i
-
-        covariance_matrix_out = matmul(transpose(data_matrix), data_matrix)
+        integer :: i, j
 
-        ! Add epsilon to the diagonal
-        do i = 1, size(data_matrix, 2)
-            covariance_matrix_out(i, i) = covariance_matrix_out(i, i) + 1.0d-8
+        ! Only the lower triangle is computed and mirrored, the columns shrink, hence dynamic scheduling
+        !$OMP PARALLEL DO PRIVATE(i) SCHEDULE(dynamic)
+        do j = 1, size(data_matrix, 2)
+            do i = j, size(data_matrix, 2)
+                covariance_matrix_out(i, j) = dot_product(data_matrix(:, i), data_matrix(:, j))
+                covariance_matrix_out(j, i) = covariance_matrix_out(i, j)
+            end do
+            ! Add epsilon to the diagonal
+            covariance_matrix_out(j, j) = covariance_matrix_out(j, j) + 1.0d-8
         end do
+        !$OMP END PARALLEL DO
     end subroutine covariance_matrix
 
     subroutine rhs(y, y_mean, data_matrix_in, rhs_out)
-        real(8), intent(in) :: y(:)
-        real(8), intent(in) :: y_mean
+        real(8), intent(in) :: y(:, :)
+        real(8), intent(in) :: y_mean(:)
         real(8), intent(in) :: data_matrix_in(:, :)
 
-        real(8), intent(out) :: rhs_out(size(data_matrix_in, 2))
-        real(8) :: y_centred(size(y))
+        real(8), intent(out) :: rhs_out(size(data_matrix_in, 2), size(y, 2))
+        real(8) :: y_centred(size(y, 1), size(y, 2))
 
-        y_centred = y - y_mean
+        y_centred = y - spread(y_mean, 1, size(y, 1))
         rhs_out = matmul(transpose(data_matrix_in), y_centred)
 
     end subroutine rhs
 
     subroutine coefficients(covariance_matrix, rhs, coefficients_out, chol)
         real(8), intent(in) :: covariance_matrix(:, :)
-        real(8), intent(in) :: rhs(:)
+        real(8), intent(in) :: rhs(:, :)
 
-        real(8), intent(out) :: coefficients_out(size(rhs))
+        real(8), intent(out) :: coefficients_out(size(rhs, 1), size(rhs, 2))
         real(8), intent(out) :: chol(size(covariance_matrix, 1), size(covariance_matrix, 2))
 
         integer :: info
@@ -88,15 +283,17 @@ contains
 
         ! Use LAPACK DPOTRF to compute the Cholesky decomposition
         chol = covariance_matrix
-        call dpotrf('L', size(chol, 1), chol, size(chol, 1), info)  ! 'L' for lower triangular
+        ! The leading dimension must be positive, even for the empty model
+        call dpotrf('L', size(chol, 1), chol, max(1, size(chol, 1)), info)  ! 'L' for lower triangular
         if (info /= 0) then
             print *, "Error during Cholesky decomposition, info = ", info
             stop
         end if
 
-        ! Solve the system using LAPACK's dpotrs
+        ! Solve the system using LAPACK's dpotrs, one right hand side per response variable
         coefficients_out = rhs
-        call dpotrs('L', size(chol, 1), 1, chol, size(chol, 1), coefficients_out, size(chol, 1), info)
+        call dpotrs('L', size(chol, 1), size(rhs, 2), chol, max(1, size(chol, 1)), coefficients_out, &
+                max(1, size(chol, 1)), info)
         if (info /= 0) then
             print *, "Error during solving linear system with dpotrs, info = ", info
             stop
@@ -104,76 +301,201 @@ contains
     end subroutine coefficients
 
     subroutine generalised_cross_validation(y, y_mean, data_matrix_in, chol, coefficients_in, penalty, lof)
-        real(8), intent(in) :: y(:)
-        real(8), intent(in) :: y_mean
+        real(8), intent(in) :: y(:, :)
+        real(8), intent(in) :: y_mean(:)
         real(8), intent(in) :: data_matrix_in(:, :)
         real(8), intent(in) :: chol(:, :)
-        real(8), intent(in) :: coefficients_in(:)
+        real(8), intent(in) :: coefficients_in(:, :)
         integer, intent(in) :: penalty
 
         real(8), intent(out) :: lof
 
-        real(8) :: y_pred(size(y))
-        real(8) :: mse
+        real(8) :: y_pred(size(y, 1), size(y, 2))
         integer :: rank
         integer :: i
-        real(8) :: c_m
 
         if (size(data_matrix_in, 2) /= 0) then
-            y_pred = matmul(data_matrix_in, coefficients_in) + y_mean
+            y_pred = matmul(data_matrix_in, coefficients_in) + spread(y_mean, 1, size(y, 1))
             rank = 0
             do i = 1, size(chol, 1)
                 if (chol(i, i) /= 0.0d0) then
                     rank = rank + 1
                 end if
             end do
-            c_m = rank * (1 + penalty) + 1 - penalty
-
         else
-            y_pred = y_mean
-            c_m = 1 - penalty
+            y_pred = spread(y_mean, 1, size(y, 1))
+            rank = 0
         end if
-        mse = sum((y - y_pred) ** 2) / real(size(y, 1))
 
-        if (c_m /= size(y)) then
-            lof = mse / (1 - c_m / size(y)) ** 2
+        ! Summed over the response variables
+        call lack_of_fit(sum((y - y_pred) ** 2), rank, size(y, 1), penalty, lof)
+
+    end subroutine generalised_cross_validation
+
+    subroutine fast_generalised_cross_validation(y_centred_sq, n_samples, rhs_in, chol, coefficients_in, penalty, lof)
+        real(8), intent(in) :: y_centred_sq
+        integer, intent(in) :: n_samples
+        real(8), intent(in) :: rhs_in(:, :)
+        real(8), intent(in) :: chol(:, :)
+        real(8), intent(in) :: coefficients_in(:, :)
+        integer, intent(in) :: penalty
+
+        real(8), intent(out) :: lof
+
+        real(8) :: rss
+        integer :: rank
+        integer :: i
+
+        ! The coefficients solve the normal equations, so the residual sum of squares follows from the rhs alone.
+        ! The last term removes the contribution of the regularisation on the covariance diagonal. Both are summed
+        ! over the response variables.
+        rss = y_centred_sq - sum(coefficients_in * rhs_in) - 1.0d-8 * sum(coefficients_in ** 2)
+        rss = max(0.0d0, rss)
+
+        rank = 0
+        do i = 1, size(chol, 1)
+            if (chol(i, i) /= 0.0d0) then
+                rank = rank + 1
+            end if
+        end do
+
+        call lack_of_fit(rss, rank, n_samples, penalty, lof)
+
+    end subroutine fast_generalised_cross_validation
+
+    subroutine lack_of_fit(rss, rank, n_samples, penalty, lof)
+        real(8), intent(in) :: rss
+        integer, intent(in) :: rank
+        integer, intent(in) :: n_samples
+        integer, intent(in) :: penalty
+
+        real(8), intent(out) :: lof
+
+        real(8) :: mse
+        real(8) :: c_m
+
+        c_m = rank * (1 + penalty) + 1 - penalty
+        mse = rss / real(n_samples)
+
+        if (c_m /= n_samples) then
+            lof = mse / (1 - c_m / n_samples) ** 2
         else
             lof = 10d20
         end if
 
-    end subroutine generalised_cross_validation
+    end subroutine lack_of_fit
 
-    subroutine fit(x, y, y_mean, nbases, mask, truncated, cov, root, penalty, &
+    subroutine fit(x, y, y_mean, nbases, mask, parent, truncated, cov, root, penalty, &
             data_matrix_out, data_matrix_mean, covariance_matrix_out, rhs_out, chol, coefficients_out, lof)
         real(8), intent(in) :: x(:, :)
-        real(8), intent(in) :: y(:)
-        real(8), intent(in) :: y_mean
+        real(8), intent(in) :: y(:, :)
+        real(8), intent(in) :: y_mean(:)
         integer, intent(in) :: nbases
-        logical, intent(in) :: mask(:, :)
-        logical, intent(in) :: truncated(:, :)
-        integer, intent(in) :: cov(:, :)
-        real(8), intent(in) :: root(:, :)
+        logical, intent(in) :: mask(:)
+        integer, intent(in) :: parent(:)
+        logical, intent(in) :: truncated(:)
+        integer, intent(in) :: cov(:)
+        real(8), intent(in) :: root(:)
         integer, intent(in) :: penalty
 
         real(8), intent(out) :: data_matrix_out(size(x, 1), nbases - 1)
         real(8), intent(out) :: data_matrix_mean(nbases - 1)
         real(8), intent(out) :: covariance_matrix_out(nbases - 1, nbases - 1)
-        real(8), intent(out) :: rhs_out(nbases - 1)
+        real(8), intent(out) :: rhs_out(nbases - 1, size(y, 2))
         real(8), intent(out) :: chol(nbases - 1, nbases - 1)
-        real(8), intent(out) :: coefficients_out(nbases - 1)
+        real(8), intent(out) :: coefficients_out(nbases - 1, size(y, 2))
         real(8), intent(out) :: lof
 
         integer :: indices(nbases - 1)
+        real(8) :: y_centred_sq
 
         call active_base_indices(mask, nbases, indices)
-        call data_matrix(x, indices, mask, truncated, cov, root, data_matrix_out, data_matrix_mean)
-        call covariance_matrix(data_matrix_out, covariance_matrix_out)
-        call rhs(y, y_mean, data_matrix_out, rhs_out)
+        call normal_equations(x, y, y_mean, indices, parent, truncated, cov, root, &
+                data_matrix_mean, covariance_matrix_out, rhs_out, y_centred_sq, data_matrix_out)
         call coefficients(covariance_matrix_out, rhs_out, coefficients_out, chol)
-        call generalised_cross_validation(y, y_mean, data_matrix_out, chol, coefficients_out, penalty, lof)
+        call fast_generalised_cross_validation(y_centred_sq, size(y, 1), rhs_out, chol, coefficients_out, penalty, &
+                lof)
     end subroutine fit
 
-    subroutine update_init(x, data_matrix_in, data_matrix_mean, prev_root, parent_idx, nbases, mask, cov, root, &
+    subroutine append_fit(data_matrix_prev, data_matrix_mean_prev, covariance_matrix_prev, rhs_prev, chol_prev, &
+            x, y, y_centred_sq, nbases, parent, truncated, cov, root, penalty, &
+            data_matrix_out, data_matrix_mean, covariance_matrix_out, rhs_out, chol, coefficients_out, lof)
+        real(8), intent(in) :: data_matrix_prev(:, :)
+        real(8), intent(in) :: data_matrix_mean_prev(:)
+        real(8), intent(in) :: covariance_matrix_prev(:, :)
+        real(8), intent(in) :: rhs_prev(:, :)
+        real(8), intent(in) :: chol_prev(:, :)
+        real(8), intent(in) :: x(:, :)
+        real(8), intent(in) :: y(:, :)
+        real(8), intent(in) :: y_centred_sq
+        integer, intent(in) :: nbases
+        integer, intent(in) :: parent(:)
+        logical, intent(in) :: truncated(:)
+        integer, intent(in) :: cov(:)
+        real(8), intent(in) :: root(:)
+        integer, intent(in) :: penalty
+
+        real(8), intent(out) :: data_matrix_out(size(x, 1), nbases - 1)
+        real(8), intent(out) :: data_matrix_mean(nbases - 1)
+        real(8), intent(out) :: covariance_matrix_out(nbases - 1, nbases - 1)
+        real(8), intent(out) :: rhs_out(nbases - 1, size(y, 2))
+        real(8), intent(out) :: chol(nbases - 1, nbases - 1)
+        real(8), intent(out) :: coefficients_out(nbases - 1, size(y, 2))
+        real(8), intent(out) :: lof
+
+        integer :: nprev
+        integer :: info
+
+        ! The previous model lacks the last two bases, only their columns are evaluated
+        nprev = nbases - 3
+        data_matrix_out(:, 1:nprev) = data_matrix_prev
+        data_matrix_mean(1:nprev) = data_matrix_mean_prev
+        call data_matrix(x, [nbases - 1, nbases], parent, truncated, cov, root, &
+                data_matrix_out(:, nprev + 1:nprev + 2), data_matrix_mean(nprev + 1:nprev + 2))
+
+        ! Border the covariance matrix with the products of the new columns and all columns
+        covariance_matrix_out(1:nprev, 1:nprev) = covariance_matrix_prev
+        call dgemm('T', 'N', nprev + 2, 2, size(x, 1), 1.0d0, data_matrix_out, size(x, 1), &
+                data_matrix_out(1, nprev + 1), size(x, 1), 0.0d0, covariance_matrix_out(1, nprev + 1), nprev + 2)
+        covariance_matrix_out(nprev + 1:nprev + 2, 1:nprev) = &
+                transpose(covariance_matrix_out(1:nprev, nprev + 1:nprev + 2))
+        covariance_matrix_out(nprev + 1, nprev + 1) = covariance_matrix_out(nprev + 1, nprev + 1) + 1.0d-8
+        covariance_matrix_out(nprev + 2, nprev + 2) = covariance_matrix_out(nprev + 2, nprev + 2) + 1.0d-8
+
+        ! The new columns are centred, so the response does not need to be
+        rhs_out(1:nprev, :) = rhs_prev
+        call dgemm('T', 'N', 2, size(y, 2), size(x, 1), 1.0d0, data_matrix_out(1, nprev + 1), size(x, 1), y, &
+                size(y, 1), 0.0d0, rhs_out(nprev + 1, 1), nbases - 1)
+
+        ! Bordered Cholesky decomposition: the new rows solve a triangular system against the previous factor,
+        ! and only the 2 x 2 Schur complement is factorised
+        chol(1:nprev, 1:nprev) = chol_prev
+        chol(1:nprev, nprev + 1:nprev + 2) = 0.0d0
+        chol(nprev + 1:nprev + 2, 1:nprev) = transpose(covariance_matrix_out(1:nprev, nprev + 1:nprev + 2))
+        if (nprev > 0) then
+            call dtrsm('R', 'L', 'T', 'N', 2, nprev, 1.0d0, chol_prev, nprev, chol(nprev + 1, 1), nbases - 1)
+        end if
+        chol(nprev + 1:nprev + 2, nprev + 1:nprev + 2) = &
+                covariance_matrix_out(nprev + 1:nprev + 2, nprev + 1:nprev + 2) &
+                - matmul(chol(nprev + 1:nprev + 2, 1:nprev), transpose(chol(nprev + 1:nprev + 2, 1:nprev)))
+        call dpotrf('L', 2, chol(nprev + 1, nprev + 1), nbases - 1, info)
+        if (info /= 0) then
+            print *, "Error during Cholesky decomposition, info = ", info
+            stop
+        end if
+
+        coefficients_out = rhs_out
+        call dpotrs('L', nbases - 1, size(y, 2), chol, nbases - 1, coefficients_out, nbases - 1, info)
+        if (info /= 0) then
+            print *, "Error during solving linear system with dpotrs, info = ", info
+            stop
+        end if
+
+        call fast_generalised_cross_validation(y_centred_sq, size(y, 1), rhs_out, chol, coefficients_out, penalty, &
+                lof)
+    end subroutine append_fit
+
+    subroutine update_init(x, data_matrix_in, data_matrix_mean, prev_root, parent_idx, nbases, cov, root, &
             update, update_mean)
         real(8), intent(in) :: x(:, :)
         real(8), intent(in) :: data_matrix_in(:, :)
@@ -181,20 +503,17 @@ contains
         real(8), intent(in) :: prev_root
         integer, intent(in) :: parent_idx
         integer, intent(in) :: nbases
-        logical, intent(in) :: mask(:, :)
-        integer, intent(in) :: cov(:, :)
-        real(8), intent(in) :: root(:, :)
+        integer, intent(in) :: cov(:)
+        real(8), intent(in) :: root(:)
 
         real(8), intent(out) :: update(size(data_matrix_in, 1))
         real(8), intent(out) :: update_mean
 
-        integer :: prod_idx
         integer :: new_cov
         real(8) :: new_root
 
-        prod_idx = count(mask(:, nbases)) + 1
-        new_root = root(prod_idx, nbases)
-        new_cov = cov(prod_idx, nbases)
+        new_root = root(nbases)
+        new_cov = cov(nbases)
 
         update = x(:, new_cov) - new_root
         where (x(:, new_cov) >= prev_root)
@@ -246,15 +565,16 @@ contains
     end subroutine update_covariance_matrix
 
     subroutine update_rhs(rhs_in, update, y, y_mean)
-        real(8), intent(inout) :: rhs_in(:)
+        real(8), intent(inout) :: rhs_in(:, :)
         real(8), intent(in) :: update(:)
-        real(8), intent(in) :: y(:)
-        real(8), intent(in) :: y_mean
+        real(8), intent(in) :: y(:, :)
+        real(8), intent(in) :: y_mean(:)
 
-        real(8) :: y_centred(size(y))
+        integer :: j
 
-        y_centred = y - y_mean
-        rhs_in(size(rhs_in)) = rhs_in(size(rhs_in)) + sum(update * y_centred)
+        do j = 1, size(y, 2)
+            rhs_in(size(rhs_in, 1), j) = rhs_in(size(rhs_in, 1), j) + sum(update * (y(:, j) - y_mean(j)))
+        end do
 
     end subroutine update_rhs
 
@@ -320,10 +640,10 @@ contains
     end subroutine update_cholesky
 
     subroutine update_coefficients(coefficients_in, chol, covariance_addition, rhs_in)
-        real(8), intent(inout) :: coefficients_in(:)
+        real(8), intent(inout) :: coefficients_in(:, :)
         real(8), intent(inout) :: chol(:, :)
         real(8), intent(in) :: covariance_addition(:)
-        real(8), intent(in) :: rhs_in(:)
+        real(8), intent(in) :: rhs_in(:, :)
 
         real(8) :: eigenvalues(2)
         real(8) :: eigenvectors(2, size(covariance_addition))
@@ -337,7 +657,7 @@ contains
         end if
 
         coefficients_in = rhs_in
-        call dpotrs('L', size(chol, 1), 1, chol, size(chol, 1), coefficients_in, size(chol, 1), info)
+        call dpotrs('L', size(chol, 1), size(rhs_in, 2), chol, size(chol, 1), coefficients_in, size(chol, 1), info)
         if (info /= 0) then
             print *, "Error during solving linear system with dpotrs, info = ", info
             stop
@@ -345,24 +665,24 @@ contains
     end subroutine update_coefficients
 
     subroutine update_fit(data_matrix_in, data_matrix_mean, covariance_matrix_in, rhs_in, chol, coefficients_in, &
-            x, y, prev_root, parent_idx, y_mean, nbases, penalty, mask, cov, root, lof)
+            x, y, prev_root, parent_idx, y_mean, y_centred_sq, nbases, penalty, cov, root, lof)
         real(8), intent(inout) :: data_matrix_in(:, :)
         real(8), intent(inout) :: data_matrix_mean(:)
         real(8), intent(inout) :: covariance_matrix_in(:, :)
-        real(8), intent(inout) :: rhs_in(:)
+        real(8), intent(inout) :: rhs_in(:, :)
         real(8), intent(inout) :: chol(:, :)
-        real(8), intent(inout) :: coefficients_in(:)
+        real(8), intent(inout) :: coefficients_in(:, :)
 
         real(8), intent(in) :: x(:, :)
-        real(8), intent(in) :: y(:)
+        real(8), intent(in) :: y(:, :)
         real(8), intent(in) :: prev_root
         integer, intent(in) :: parent_idx
-        real(8), intent(in) :: y_mean
+        real(8), intent(in) :: y_mean(:)
+        real(8), intent(in) :: y_centred_sq
         integer, intent(in) :: nbases
         integer, intent(in) :: penalty
-        logical, intent(in) :: mask(:, :)
-        integer, intent(in) :: cov(:, :)
-        real(8), intent(in) :: root(:, :)
+        integer, intent(in) :: cov(:)
+        real(8), intent(in) :: root(:)
 
         real(8), intent(out) :: lof
 
@@ -370,212 +690,472 @@ contains
         real(8) :: update_mean
         real(8) :: covariance_addition(size(chol, 1))
 
-        call update_init(x, data_matrix_in, data_matrix_mean, prev_root, parent_idx, nbases, mask, cov, root, &
+        call update_init(x, data_matrix_in, data_matrix_mean, prev_root, parent_idx, nbases, cov, root, &
                 update, update_mean)
         call update_data_matrix(data_matrix_in, data_matrix_mean, update, update_mean)
         call update_covariance_matrix(covariance_matrix_in, data_matrix_in, update, covariance_addition)
         call update_rhs(rhs_in, update, y, y_mean)
         call update_coefficients(coefficients_in, chol, covariance_addition, rhs_in)
 
-        call generalised_cross_validation(y, y_mean, data_matrix_in, chol, coefficients_in, penalty, lof)
+        call fast_generalised_cross_validation(y_centred_sq, size(y, 1), rhs_in, chol, coefficients_in, penalty, lof)
     end subroutine update_fit
 
+    subroutine sweep_fit(data_matrix_in, data_matrix_mean, covariance_matrix_in, rhs_in, chol, coefficients_in, &
+            sweep_sums, sweep_position, x, y, sorted_indices, parent_idx, y_mean, y_centred_sq, nbases, penalty, &
+            cov, root, lof)
+        real(8), intent(in) :: data_matrix_in(:, :)
+        real(8), intent(in) :: data_matrix_mean(:)
+        real(8), intent(inout) :: covariance_matrix_in(:, :)
+        real(8), intent(inout) :: rhs_in(:, :)
+        real(8), intent(inout) :: chol(:, :)
+        real(8), intent(inout) :: coefficients_in(:, :)
+        real(8), intent(inout) :: sweep_sums(:)
+        integer, intent(inout) :: sweep_position
+
+        real(8), intent(in) :: x(:, :)
+        real(8), intent(in) :: y(:, :)
+        integer, intent(in) :: sorted_indices(:)
+        integer, intent(in) :: parent_idx
+        real(8), intent(in) :: y_mean(:)
+        real(8), intent(in) :: y_centred_sq
+        integer, intent(in) :: nbases
+        integer, intent(in) :: penalty
+        integer, intent(in) :: cov(:)
+        real(8), intent(in) :: root(:)
+
+        real(8), intent(out) :: lof
+
+        integer :: new_cov
+        real(8) :: new_root
+        integer :: ncols
+        integer :: nresponses
+        integer :: row
+        real(8) :: parent_value
+        real(8) :: parent_x
+        real(8) :: y_centred(size(y, 2))
+        real(8) :: column_mean
+        real(8) :: covariance_addition(size(chol, 1))
+
+        new_root = root(nbases)
+        new_cov = cov(nbases)
+        ncols = size(covariance_matrix_in, 1) - 1
+        nresponses = size(y, 2)
+
+        ! The columns of the data matrix sum to zero only up to rounding
+        if (sweep_position == 0) then
+            sweep_sums(2 * ncols + 1:3 * ncols) = sum(data_matrix_in(:, 1:ncols), dim=1)
+        end if
+
+        ! Accumulate the rows crossed since the previous root, the rows above it only shift by a constant
+        do while (sweep_position < size(sorted_indices))
+            row = sorted_indices(sweep_position + 1)
+            if (x(row, new_cov) < new_root) exit
+            sweep_position = sweep_position + 1
+
+            if (parent_idx == 1) then
+                parent_value = 1.0d0
+            else
+                parent_value = data_matrix_in(row, parent_idx - 1) + data_matrix_mean(parent_idx - 1)
+            end if
+            if (parent_value == 0.0d0) cycle
+            parent_x = parent_value * x(row, new_cov)
+            y_centred = y(row, :) - y_mean
+
+            sweep_sums(1:ncols) = sweep_sums(1:ncols) + parent_x * data_matrix_in(row, 1:ncols)
+            sweep_sums(ncols + 1:2 * ncols) = sweep_sums(ncols + 1:2 * ncols) &
+                    + parent_value * data_matrix_in(row, 1:ncols)
+            sweep_sums(3 * ncols + 1) = sweep_sums(3 * ncols + 1) + parent_x ** 2
+            sweep_sums(3 * ncols + 2) = sweep_sums(3 * ncols + 2) + parent_value * parent_x
+            sweep_sums(3 * ncols + 3) = sweep_sums(3 * ncols + 3) + parent_value ** 2
+            sweep_sums(3 * ncols + 4) = sweep_sums(3 * ncols + 4) + parent_x
+            sweep_sums(3 * ncols + 5) = sweep_sums(3 * ncols + 5) + parent_value
+            ! One sum per response variable for each of the two products
+            sweep_sums(3 * ncols + 6:3 * ncols + 5 + nresponses) = &
+                    sweep_sums(3 * ncols + 6:3 * ncols + 5 + nresponses) + parent_x * y_centred
+            sweep_sums(3 * ncols + 6 + nresponses:3 * ncols + 5 + 2 * nresponses) = &
+                    sweep_sums(3 * ncols + 6 + nresponses:3 * ncols + 5 + 2 * nresponses) + parent_value * y_centred
+        end do
+
+        ! Last column of the normal equations from the sums over the rows above the root
+        column_mean = (sweep_sums(3 * ncols + 4) - new_root * sweep_sums(3 * ncols + 5)) / size(x, 1)
+        covariance_addition(1:ncols) = sweep_sums(1:ncols) - new_root * sweep_sums(ncols + 1:2 * ncols) &
+                - column_mean * sweep_sums(2 * ncols + 1:3 * ncols)
+        covariance_addition(ncols + 1) = sweep_sums(3 * ncols + 1) - 2 * new_root * sweep_sums(3 * ncols + 2) &
+                + new_root ** 2 * sweep_sums(3 * ncols + 3) - size(x, 1) * column_mean ** 2 + 1.0d-8
+        covariance_addition = covariance_addition - covariance_matrix_in(:, ncols + 1)
+
+        covariance_matrix_in(ncols + 1, 1:ncols) = covariance_matrix_in(ncols + 1, 1:ncols) &
+                + covariance_addition(1:ncols)
+        covariance_matrix_in(:, ncols + 1) = covariance_matrix_in(:, ncols + 1) + covariance_addition
+        rhs_in(ncols + 1, :) = sweep_sums(3 * ncols + 6:3 * ncols + 5 + nresponses) &
+                - new_root * sweep_sums(3 * ncols + 6 + nresponses:3 * ncols + 5 + 2 * nresponses)
+
+        call update_coefficients(coefficients_in, chol, covariance_addition, rhs_in)
+
+        call fast_generalised_cross_validation(y_centred_sq, size(y, 1), rhs_in, chol, coefficients_in, penalty, lof)
+    end subroutine sweep_fit
+
     subroutine argsort(array, indices)
         real(8), intent(in) :: array(:)
         integer, intent(out) :: indices(size(array))
-        integer :: i, j, n
-        integer :: temp_idx
+
+        integer, allocatable :: buffer(:)
+        integer :: i, j, k, n
+        integer :: width, left, middle, right
 
         n = size(array)
         indices = [(i, i = 1, n)]
-
-        do i = 1, n - 1
-            do j = 1, n - i
-                if (array(indices(j)) > array(indices(j + 1))) then
-                    temp_idx = indices(j)
-                    indices(j) = indices(j + 1)
-                    indices(j + 1) = temp_idx
-                end if
+        allocate(buffer(n))
+
+        ! Stable bottom-up merge sort
+        width = 1
+        do while (width < n)
+            do left = 1, n, 2 * width
+                middle = min(left + width - 1, n)
+                right = min(left + 2 * width - 1, n)
+                i = left
+                j = middle + 1
+                do k = left, right
+                    if (j > right) then
+                        buffer(k) = indices(i)
+                        i = i + 1
+                    else if (i > middle) then
+                        buffer(k) = indices(j)
+                        j = j + 1
+                    else if (array(indices(j)) < array(indices(i))) then
+                        buffer(k) = indices(j)
+                        j = j + 1
+                    else
+                        buffer(k) = indices(i)
+                        i = i + 1
+                    end if
+                end do
             end do
+            indices = buffer
+            width = 2 * width
         end do
+
+        deallocate(buffer)
     end subroutine argsort
 
-    subroutine add_bases(parent, cov_in, root_in, nbases, mask, truncated, cov, root)
-        integer, intent(in) :: parent
-        integer, intent(in) :: cov_in
-        real(8), intent(in) :: root_in
-        integer, intent(in) :: nbases
-        logical, intent(inout) :: mask(:, :)
-        logical, intent(inout) :: truncated(:, :)
-        integer, intent(inout) :: cov(:, :)
-        real(8), intent(inout) :: root(:, :)
+    subroutine sort_predictors(x, sorted_indices)
+        real(8), intent(in) :: x(:, :)
 
-        integer :: parent_depth
+        integer, intent(out) :: sorted_indices(size(x, 1), size(x, 2))
 
-        parent_depth = count(mask(:, parent))
+        integer :: cov_idx
 
-        mask(:, nbases - 1) = mask(:, parent)
-        mask(:, nbases) = mask(:, parent)
-        mask(parent_depth + 2, nbases - 1:nbases) = .true.
+        ! Descending order, as the roots are swept from the largest to the smallest value
+        !$OMP PARALLEL DO
+        do cov_idx = 1, size(x, 2)
+            call argsort(x(:, cov_idx), sorted_indices(:, cov_idx))
+            sorted_indices(:, cov_idx) = sorted_indices(size(x, 1):1:-1, cov_idx)
+        end do
+        !$OMP END PARALLEL DO
+    end subroutine sort_predictors
 
-        truncated(:, nbases - 1) = truncated(:, parent)
-        truncated(:, nbases) = truncated(:, parent)
-        truncated(parent_depth + 2, nbases) = .true.
+    subroutine select_roots(sorted_roots, endspan, minspan, max_nknots, selected_roots, nselected)
+        real(8), intent(in) :: sorted_roots(:)
+        integer, intent(in) :: endspan
+        integer, intent(in) :: minspan
+        integer, intent(in) :: max_nknots
 
-        cov(:, nbases - 1) = cov(:, parent)
-        cov(:, nbases) = cov(:, parent)
-        cov(parent_depth + 2, nbases - 1:nbases) = cov_in
+        real(8), intent(out) :: selected_roots(size(sorted_roots))
+        integer, intent(out) :: nselected
 
-        root(:, nbases - 1) = root(:, parent)
-        root(:, nbases) = root(:, parent)
-        root(parent_depth + 2, nbases) = root_in
+        integer :: i
+        integer :: nunique
+
+        ! Skip the ends, step by minspan and drop repeated values, since they yield the same fit
+        nselected = 0
+        do i = endspan + 1, size(sorted_roots) - endspan, minspan
+            if (nselected /= 0) then
+                if (sorted_roots(i) == selected_roots(nselected)) cycle
+            end if
+            nselected = nselected + 1
+            selected_roots(nselected) = sorted_roots(i)
+        end do
+
+        ! Centres of max_nknots equally populated bins, the source index never lags behind the target index
+        if (max_nknots > 0 .and. nselected > max_nknots) then
+            nunique = nselected
+            do i = 1, max_nknots
+                selected_roots(i) = selected_roots(((2 * i - 1) * nunique) / (2 * max_nknots) + 1)
+            end do
+            nselected = max_nknots
+        end if
+    end subroutine select_roots
+
+    subroutine add_bases(parent_in, cov_in, root_in, nbases, mask, parent, truncated, cov, root)
+        integer, intent(in) :: parent_in
+        integer, intent(in) :: cov_in
+        real(8), intent(in) :: root_in
+        integer, intent(in) :: nbases
+        logical, intent(inout) :: mask(:)
+        integer, intent(inout) :: parent(:)
+        logical, intent(inout) :: truncated(:)
+        integer, intent(inout) :: cov(:)
+        real(8), intent(inout) :: root(:)
+
+        mask(nbases - 1:nbases) = .true.
+        parent(nbases - 1:nbases) = parent_in
+        cov(nbases - 1:nbases) = cov_in
+
+        ! The linear basis function has its root at zero, the truncated one at the given root
+        truncated(nbases - 1) = .false.
+        truncated(nbases) = .true.
+        root(nbases - 1) = 0d0
+        root(nbases) = root_in
     end subroutine add_bases
 
-    subroutine expand_bases(x, y, y_mean, max_nbases, max_ncandidates, aging_factor, penalty, &
-            lof, nbases, mask, truncated, cov, root, coefficients_out)
+    subroutine expand_bases(x, y, sorted_indices, y_mean, max_nbases, max_ncandidates, aging_factor, penalty, &
+            minspan, endspan, max_nknots, work, nbases_in, parent_in, truncated_in, cov_in, root_in, &
+            lof, nbases, mask, parent, truncated, cov, root, coefficients_out)
         real(8), intent(in) :: x(:, :)
-        real(8), intent(in) :: y(:)
-        real(8), intent(in) :: y_mean
+        real(8), intent(in) :: y(:, :)
+        integer, intent(in) :: sorted_indices(:, :)
+        real(8), intent(in) :: y_mean(:)
         integer, intent(in) :: max_nbases
         integer, intent(in) :: max_ncandidates
         real(8), intent(in) :: aging_factor
         integer, intent(in) :: penalty
+        integer, intent(in) :: minspan
+        integer, intent(in) :: endspan
+        integer, intent(in) :: max_nknots
+        real(8), intent(inout), target, contiguous :: work(:, :)
+        integer, intent(in) :: nbases_in
+        integer, intent(in) :: parent_in(max_nbases)
+        logical, intent(in) :: truncated_in(max_nbases)
+        integer, intent(in) :: cov_in(max_nbases)
+        real(8), intent(in) :: root_in(max_nbases)
 
         real(8), intent(out) :: lof
         integer, intent(out) :: nbases
-        logical, intent(out) :: mask(max_nbases, max_nbases)
-        logical, intent(out) :: truncated(max_nbases, max_nbases)
-        integer, intent(out) :: cov(max_nbases, max_nbases)
-        real(8), intent(out) :: root(max_nbases, max_nbases)
-        real(8), intent(out) :: coefficients_out(max_nbases - 1)
-
-        real(8), allocatable :: candidate_queue(:)
+        logical, intent(out) :: mask(max_nbases)
+        integer, intent(out) :: parent(max_nbases)
+        logical, intent(out) :: truncated(max_nbases)
+        integer, intent(out) :: cov(max_nbases)
+        real(8), intent(out) :: root(max_nbases)
+        real(8), intent(out) :: coefficients_out(max_nbases - 1, size(y, 2))
+
+        real(8) :: candidate_queue(max_nbases)
         integer :: iteration
         real(8) :: best_lof
         integer :: best_cov
         real(8) :: best_root
         integer :: best_parent
-        integer, allocatable :: parents(:)
+        integer :: parents(max_nbases)
+        integer :: nparents
         integer :: num_pairs
         integer :: pairs(max_ncandidates * size(x, 2), 2)
-        integer :: parent
+        integer :: parent_idx
+        integer :: func_idx
         integer :: cov_idx
-        real(8), allocatable :: basis_lofs(:)
-        integer :: parent_depth
-        integer, allocatable :: indices(:)
-        real(8), allocatable :: eligible_roots(:)
-        real(8), allocatable :: a_data_matrix_prev(:, :)
+        real(8) :: basis_lofs(max_ncandidates)
+        real(8) :: pair_lofs(max_ncandidates * size(x, 2))
+        real(8) :: pair_roots(max_ncandidates * size(x, 2))
+        real(8) :: pair_lof
+        real(8) :: pair_root
+        real(8) :: pair_costs(max_ncandidates * size(x, 2))
+        integer :: pair_order(max_ncandidates * size(x, 2))
+        integer :: support_sizes(max_ncandidates)
+        integer :: k
+        integer :: neligible
+        integer :: nknots
         integer :: i, j
-        integer :: info
         integer :: root_idx
-        real(8), allocatable :: a_data_matrix(:, :)
-        real(8), allocatable :: a_data_matrix_mean(:)
-        real(8), allocatable :: a_covariance_matrix(:, :)
-        real(8), allocatable :: a_rhs(:)
-        real(8), allocatable :: a_chol(:, :)
-        real(8), allocatable :: a_coefficients(:)
-        real(8), allocatable :: candidate_queue_buffer(:)
-
-        nbases = 1
+        integer :: offset
+        integer :: nrows, ncols
+        real(8), pointer, contiguous :: a_data_matrix_prev(:, :)
+        real(8), pointer, contiguous :: a_data_matrix_mean_prev(:)
+        real(8), pointer, contiguous :: a_covariance_matrix_prev(:, :)
+        real(8), pointer, contiguous :: a_rhs_prev(:, :)
+        real(8), pointer, contiguous :: a_chol_prev(:, :)
+        real(8), pointer, contiguous :: a_coefficients_prev(:, :)
+        real(8) :: lof_prev
+        real(8), pointer, contiguous :: a_data_matrix(:, :)
+        real(8), pointer, contiguous :: a_data_matrix_mean(:)
+        real(8), pointer, contiguous :: a_covariance_matrix(:, :)
+        real(8), pointer, contiguous :: a_rhs(:, :)
+        real(8), pointer, contiguous :: a_chol(:, :)
+        real(8), pointer, contiguous :: a_coefficients(:, :)
+        real(8), pointer, contiguous :: eligible_roots(:)
+        real(8), pointer, contiguous :: knots(:)
+        real(8), pointer, contiguous :: sweep_sums(:)
+        integer :: sweep_position
+        real(8) :: y_centred_sq
+        integer :: nresponses
+
+        nresponses = size(y, 2)
+        call workspace_shape(size(x, 1), max_nbases, nresponses, nrows, ncols)
+        if (size(work, 1) < nrows .or. size(work, 2) < 2) then
+            print *, "Workspace too small, shape: ", shape(work)
+            stop
+        end if
+
+        ! The search continues from the given model, all of its basis functions are active
+        nbases = nbases_in
         mask = .false.
-        truncated = .false.
-        cov = 0
-        root = 0d0
+        mask(2:nbases) = .true.
+        parent = parent_in
+        truncated = truncated_in
+        cov = cov_in
+        root = root_in
+
+        y_centred_sq = sum((y - spread(y_mean, 1, size(y, 1))) ** 2)
+
+        ! The shared column of the workspace holds the fit of the current model, which every pair extends. It starts
+        ! with the given model and is extended by the selected pair in every iteration, so every basis is evaluated
+        ! once.
+        offset = 0
+        call carve_matrix(work(:, 1), offset, size(x, 1), nbases - 1, a_data_matrix_prev)
+        call carve_vector(work(:, 1), offset, nbases - 1, a_data_matrix_mean_prev)
+        call carve_matrix(work(:, 1), offset, nbases - 1, nbases - 1, a_covariance_matrix_prev)
+        call carve_matrix(work(:, 1), offset, nbases - 1, nresponses, a_rhs_prev)
+        call carve_matrix(work(:, 1), offset, nbases - 1, nbases - 1, a_chol_prev)
+        call carve_matrix(work(:, 1), offset, nbases - 1, nresponses, a_coefficients_prev)
+        if (nbases > 1) then
+            call fit(x, y, y_mean, nbases, mask, parent, truncated, cov, root, penalty, a_data_matrix_prev, &
+                    a_data_matrix_mean_prev, a_covariance_matrix_prev, a_rhs_prev, a_chol_prev, a_coefficients_prev, &
+                    lof_prev)
+        else
+            call lack_of_fit(y_centred_sq, 0, size(y, 1), penalty, lof_prev)
+        end if
 
-        allocate(candidate_queue(1))
-        candidate_queue(1) = 0
+        candidate_queue(1:nbases) = 0
 
-        do iteration = 1, (max_nbases - 1) / 2
+        do iteration = 1, (max_nbases - nbases) / 2
             best_lof = 1d20
             best_cov = -1
             best_root = -1d0
             best_parent = -1
 
-            allocate(parents(size(candidate_queue)))
-            call argsort(candidate_queue, parents)
+            call argsort(candidate_queue(1:nbases), parents(1:nbases))
+            nparents = min(max_ncandidates, nbases)
 
             num_pairs = 0
-            do parent = 1, min(max_ncandidates, nbases)
+            do i = 1, nparents
                 do cov_idx = 1, size(x, 2)
-                    if (all(cov(:, parents(parent)) /= cov_idx .or. .not. mask(:, parents(parent)))) then
+                    ! A covariate is eligible if it isn't in the parent chain yet
+                    func_idx = parents(i)
+                    do while (func_idx > 1)
+                        if (cov(func_idx) == cov_idx) exit
+                        func_idx = parent(func_idx)
+                    end do
+                    if (func_idx <= 1) then
                         num_pairs = num_pairs + 1
-                        pairs(num_pairs, 1) = parent
+                        pairs(num_pairs, 1) = i
                         pairs(num_pairs, 2) = cov_idx
                     end if
                 end do
             end do
 
-            allocate(basis_lofs(min(max_ncandidates, nbases)))
+            ! The cost of a pair scales with the support of its parent, the most expensive pairs are scheduled first
+            do i = 1, nparents
+                if (parents(i) == 1) then
+                    support_sizes(i) = size(x, 1)
+                else
+                    support_sizes(i) = count(a_data_matrix_prev(:, parents(i) - 1) > 0)
+                end if
+            end do
+            do i = 1, num_pairs
+                pair_costs(i) = -real(support_sizes(pairs(i, 1)), 8)
+            end do
+            call argsort(pair_costs(1:num_pairs), pair_order(1:num_pairs))
+
             basis_lofs = 1d20
 
             nbases = nbases + 2
-            allocate(a_data_matrix(size(x, 1), nbases - 1))
-            allocate(a_data_matrix_mean(nbases - 1))
-            allocate(a_covariance_matrix(nbases - 1, nbases - 1))
-            allocate(a_rhs(nbases - 1))
-            allocate(a_chol(nbases - 1, nbases - 1))
-            allocate(a_coefficients(nbases - 1))
-            !$OMP PARALLEL DO DEFAULT(firstprivate) &
-            !$OMP& SHARED(parents, pairs, x, y, y_mean, penalty, &
-            !$OMP& best_lof, best_cov, best_root, best_parent, basis_lofs)
-            do i = 1, num_pairs
-                parent = parents(pairs(i, 1))
+            ! Every thread carves its buffers from its own column of the workspace, nothing is allocated per pair
+            ! The model is copied into every thread, as each pair adds its bases to it
+            !$OMP PARALLEL DEFAULT(none) NUM_THREADS(size(work, 2) - 1) &
+            !$OMP& SHARED(work, a_data_matrix_prev, a_data_matrix_mean_prev, a_covariance_matrix_prev, a_rhs_prev, &
+            !$OMP& a_chol_prev, parents, pairs, pair_order, num_pairs, nbases, x, y, sorted_indices, y_mean, &
+            !$OMP& y_centred_sq, penalty, minspan, endspan, max_nknots, pair_lofs, pair_roots, nresponses) &
+            !$OMP& FIRSTPRIVATE(mask, parent, truncated, cov, root) &
+            !$OMP& PRIVATE(offset, a_data_matrix, a_data_matrix_mean, a_covariance_matrix, a_rhs, a_chol, &
+            !$OMP& a_coefficients, eligible_roots, knots, sweep_sums, sweep_position, k, i, j, parent_idx, cov_idx, &
+            !$OMP& pair_lof, pair_root, neligible, nknots, root_idx, lof)
+            offset = 0
+            call carve_matrix(work(:, omp_get_thread_num() + 2), offset, size(x, 1), nbases - 1, a_data_matrix)
+            call carve_vector(work(:, omp_get_thread_num() + 2), offset, nbases - 1, a_data_matrix_mean)
+            call carve_matrix(work(:, omp_get_thread_num() + 2), offset, nbases - 1, nbases - 1, a_covariance_matrix)
+            call carve_matrix(work(:, omp_get_thread_num() + 2), offset, nbases - 1, nresponses, a_rhs)
+            call carve_matrix(work(:, omp_get_thread_num() + 2), offset, nbases - 1, nbases - 1, a_chol)
+            call carve_matrix(work(:, omp_get_thread_num() + 2), offset, nbases - 1, nresponses, a_coefficients)
+            call carve_vector(work(:, omp_get_thread_num() + 2), offset, size(x, 1), eligible_roots)
+            call carve_vector(work(:, omp_get_thread_num() + 2), offset, size(x, 1), knots)
+            call carve_vector(work(:, omp_get_thread_num() + 2), offset, 3 * nbases - 1 + 2 * nresponses, &
+                    sweep_sums)
+
+            !$OMP DO SCHEDULE(dynamic, 1)
+            do k = 1, num_pairs
+                i = pair_order(k)
+                parent_idx = parents(pairs(i, 1))
                 cov_idx = pairs(i, 2)
+                pair_lof = 1d20
+                pair_root = -1d0
 
-                call add_bases(parent, cov_idx, 0d0, nbases, mask, truncated, cov, root)
+                call add_bases(parent_idx, cov_idx, 0d0, nbases, mask, parent, truncated, cov, root)
 
-                if (parent == 1) then
-                    allocate(eligible_roots(size(x, 1)))
-                    eligible_roots = x(:, cov_idx)
+                ! The presorted order restricted to the support of the parent is already descending
+                if (parent_idx == 1) then
+                    neligible = size(x, 1)
+                    eligible_roots = x(sorted_indices(:, cov_idx), cov_idx)
                 else
-                    allocate(eligible_roots(count(a_data_matrix_prev(:, parent - 1) > 0)))
-                    eligible_roots = x(pack((/(j, j = 1, size(x, 1))/), a_data_matrix_prev(:, parent - 1) > 0), cov_idx)
+                    neligible = 0
+                    do j = 1, size(x, 1)
+                        if (a_data_matrix_prev(sorted_indices(j, cov_idx), parent_idx - 1) > 0) then
+                            neligible = neligible + 1
+                            eligible_roots(neligible) = x(sorted_indices(j, cov_idx), cov_idx)
+                        end if
+                    end do
                 end if
 
-                ! Sort the array in descending order using LAPACK's dlasrt
-                call dlasrt('D', size(eligible_roots), eligible_roots, info)
-                if (info /= 0) then
-                    print *, "Sorting failed, info: ", info
-                    stop
-                end if
+                call select_roots(eligible_roots(1:neligible), endspan, minspan, max_nknots, knots(1:neligible), nknots)
 
-                parent_depth = count(mask(:, parent))
-                do root_idx = 1, size(eligible_roots)
-                    root(parent_depth + 2, nbases) = eligible_roots(root_idx)
+                do root_idx = 1, nknots
+                    root(nbases) = knots(root_idx)
                     if (root_idx == 1) then
-                        call fit(x, y, y_mean, nbases, mask, truncated, cov, root, penalty, &
-                                a_data_matrix, a_data_matrix_mean, a_covariance_matrix, a_rhs, a_chol, a_coefficients, &
-                                lof)
+                        call append_fit(a_data_matrix_prev, a_data_matrix_mean_prev, a_covariance_matrix_prev, &
+                                a_rhs_prev, a_chol_prev, x, y, y_centred_sq, nbases, parent, truncated, cov, &
+                                root, penalty, a_data_matrix, a_data_matrix_mean, a_covariance_matrix, a_rhs, a_chol, &
+                                a_coefficients, lof)
+                        sweep_sums = 0.0d0
+                        sweep_position = 0
                     else
-                        call update_fit(a_data_matrix, a_data_matrix_mean, a_covariance_matrix, a_rhs, a_chol, &
-                                a_coefficients, x, y, eligible_roots(root_idx - 1), parent, &
-                                y_mean, nbases, penalty, mask, cov, root, lof)
+                        call sweep_fit(a_data_matrix, a_data_matrix_mean, a_covariance_matrix, a_rhs, a_chol, &
+                                a_coefficients, sweep_sums, sweep_position, x, y, sorted_indices(:, cov_idx), &
+                                parent_idx, y_mean, y_centred_sq, nbases, penalty, cov, root, lof)
                     end if
-                    !$OMP CRITICAL
-                    if (lof < basis_lofs(pairs(i, 1))) then
-                        basis_lofs(pairs(i, 1)) = lof
+                    if (lof < pair_lof) then
+                        pair_lof = lof
+                        pair_root = knots(root_idx)
                     end if
-                    if (lof < best_lof) then
-                        best_lof = lof
-                        best_cov = cov_idx
-                        best_root = eligible_roots(root_idx)
-                        best_parent = parent
-                    end if
-                    !$OMP END CRITICAL
                 end do
 
-                deallocate(eligible_roots)
+                ! Every pair owns its slot, no synchronisation between threads is needed
+                pair_lofs(i) = pair_lof
+                pair_roots(i) = pair_root
             end do
-            !$OMP END PARALLEL DO
-            deallocate(a_data_matrix)
-            deallocate(a_data_matrix_mean)
-            deallocate(a_covariance_matrix)
-            deallocate(a_rhs)
-            deallocate(a_chol)
-            deallocate(a_coefficients)
-
-            do i = 1, size(candidate_queue)
-                if (i <= size(basis_lofs)) then
+            !$OMP END DO
+            !$OMP END PARALLEL
+
+            ! Reduce in pair order, so the first of equally good candidates wins independent of the number of threads
+            do i = 1, num_pairs
+                if (pair_lofs(i) < basis_lofs(pairs(i, 1))) then
+                    basis_lofs(pairs(i, 1)) = pair_lofs(i)
+                end if
+                if (pair_lofs(i) < best_lof) then
+                    best_lof = pair_lofs(i)
+                    best_cov = pairs(i, 2)
+                    best_root = pair_roots(i)
+                    best_parent = parents(pairs(i, 1))
+                end if
+            end do
+
+            do i = 1, nbases - 2
+                if (i <= nparents) then
                     candidate_queue(parents(i)) = basis_lofs(i) - best_lof
                 else
                     candidate_queue(parents(i)) = candidate_queue(parents(i)) - aging_factor
@@ -583,185 +1163,249 @@ contains
             end do
 
             if (best_cov /= -1) then
-                call add_bases(best_parent, best_cov, best_root, nbases, mask, truncated, cov, root)
-
-                allocate(candidate_queue_buffer(size(candidate_queue)))
-                candidate_queue_buffer = candidate_queue
-                deallocate(candidate_queue)
-                allocate(candidate_queue(nbases))
-                candidate_queue(1:size(candidate_queue_buffer)) = candidate_queue_buffer
-                candidate_queue(nbases - 1:) = 0
-
-                if (allocated(a_data_matrix_prev)) then
-                    deallocate(a_data_matrix_prev)
-                end if
-                allocate(indices(nbases - 1))
-                allocate(a_data_matrix_prev(size(x, 1), nbases - 1))
-                allocate(a_data_matrix_mean(nbases - 1))
-                call active_base_indices(mask, nbases, indices)
-                call data_matrix(x, indices, mask, truncated, cov, root, a_data_matrix_prev, a_data_matrix_mean)
-                deallocate(indices)
-                deallocate(a_data_matrix_mean)
+                call add_bases(best_parent, best_cov, best_root, nbases, mask, parent, truncated, cov, root)
+                candidate_queue(nbases - 1:nbases) = 0
+
+                ! Extend the shared fit into the scratch column of the first thread, which is free between the
+                ! iterations, and copy it back
+                offset = 0
+                call carve_matrix(work(:, 2), offset, size(x, 1), nbases - 1, a_data_matrix)
+                call carve_vector(work(:, 2), offset, nbases - 1, a_data_matrix_mean)
+                call carve_matrix(work(:, 2), offset, nbases - 1, nbases - 1, a_covariance_matrix)
+                call carve_matrix(work(:, 2), offset, nbases - 1, nresponses, a_rhs)
+                call carve_matrix(work(:, 2), offset, nbases - 1, nbases - 1, a_chol)
+                call carve_matrix(work(:, 2), offset, nbases - 1, nresponses, a_coefficients)
+                call append_fit(a_data_matrix_prev, a_data_matrix_mean_prev, a_covariance_matrix_prev, a_rhs_prev, &
+                        a_chol_prev, x, y, y_centred_sq, nbases, parent, truncated, cov, root, penalty, &
+                        a_data_matrix, a_data_matrix_mean, a_covariance_matrix, a_rhs, a_chol, a_coefficients, &
+                        lof_prev)
+
+                offset = 0
+                call carve_matrix(work(:, 1), offset, size(x, 1), nbases - 1, a_data_matrix_prev)
+                call carve_vector(work(:, 1), offset, nbases - 1, a_data_matrix_mean_prev)
+                call carve_matrix(work(:, 1), offset, nbases - 1, nbases - 1, a_covariance_matrix_prev)
+                call carve_matrix(work(:, 1), offset, nbases - 1, nresponses, a_rhs_prev)
+                call carve_matrix(work(:, 1), offset, nbases - 1, nbases - 1, a_chol_prev)
+                call carve_matrix(work(:, 1), offset, nbases - 1, nresponses, a_coefficients_prev)
+                a_data_matrix_prev = a_data_matrix
+                a_data_matrix_mean_prev = a_data_matrix_mean
+                a_covariance_matrix_prev = a_covariance_matrix
+                a_rhs_prev = a_rhs
+                a_chol_prev = a_chol
+                a_coefficients_prev = a_coefficients
             else
                 print *, "Cannot find additional bases in iteration", iteration, "."
-                mask(:, nbases - 1:nbases) = .false.
+                mask(nbases - 1:nbases) = .false.
                 nbases = nbases - 2
                 exit
             end if
-            deallocate(parents)
-            deallocate(basis_lofs)
-            deallocate(candidate_queue_buffer)
         end do
-        deallocate(candidate_queue)
-
-        allocate(a_data_matrix(size(x, 1), nbases - 1))
-        allocate(a_data_matrix_mean(nbases - 1))
-        allocate(a_covariance_matrix(nbases - 1, nbases - 1))
-        allocate(a_rhs(nbases - 1))
-        allocate(a_chol(nbases - 1, nbases - 1))
-        call fit(x, y, y_mean, nbases, mask, truncated, cov, root, penalty, &
-                a_data_matrix, a_data_matrix_mean, a_covariance_matrix, a_rhs, a_chol, &
-                coefficients_out, lof)
-        deallocate(a_data_matrix)
-        deallocate(a_data_matrix_mean)
-        deallocate(a_covariance_matrix)
-        deallocate(a_rhs)
-        deallocate(a_chol)
+
+        ! The shared fit is the fit of the final model
+        coefficients_out = 0.0d0
+        coefficients_out(1:nbases - 1, :) = a_coefficients_prev
+        lof = lof_prev
     end subroutine expand_bases
 
-    subroutine prune_bases(x, y, y_mean, lof, nbases, mask_in, truncated, cov, root, penalty, coefficients_out, &
-            mask)
+    subroutine removal_lofs(covariance_matrix_in, rhs_in, y_centred_sq, n_samples, penalty, lofs)
+        real(8), intent(in) :: covariance_matrix_in(:, :)
+        real(8), intent(in) :: rhs_in(:, :)
+        real(8), intent(in) :: y_centred_sq
+        integer, intent(in) :: n_samples
+        integer, intent(in) :: penalty
+
+        real(8), intent(out) :: lofs(size(rhs_in, 1))
+
+        real(8) :: coefficients_in(size(rhs_in, 1), size(rhs_in, 2))
+        real(8) :: chol(size(rhs_in, 1), size(rhs_in, 1))
+        real(8) :: inverse_chol_column(size(rhs_in, 1))
+        real(8) :: rss
+        integer :: m
+        integer :: i
+
+        m = size(rhs_in, 1)
+        call coefficients(covariance_matrix_in, rhs_in, coefficients_in, chol)
+        rss = y_centred_sq - sum(coefficients_in * rhs_in) - 1.0d-8 * sum(coefficients_in ** 2)
+
+        ! Removing a basis increases the residual sum of squares by its coefficients squared, summed over the response
+        ! variables, over the inverse diagonal.
+        ! The i-th diagonal entry is the squared norm of the i-th column of the inverse Cholesky factor, which is zero
+        ! above the diagonal, so every candidate solves a trailing triangular system of its own. The solves dominate
+        ! the cost and each thread has its own column. Every candidate writes its own slot, the caller reduces
+        ! serially, which keeps the choice deterministic.
+        !$OMP PARALLEL DO PRIVATE(inverse_chol_column) SCHEDULE(dynamic) IF(m > 16)
+        do i = 1, m
+            inverse_chol_column(i:m) = 0.0d0
+            inverse_chol_column(i) = 1.0d0
+            call dtrsv('L', 'N', 'N', m - i + 1, chol(i, i), m, inverse_chol_column(i), 1)
+            call lack_of_fit(max(0.0d0, rss + sum(coefficients_in(i, :) ** 2) / sum(inverse_chol_column(i:m) ** 2)), &
+                    m - 1, n_samples, penalty, lofs(i))
+        end do
+        !$OMP END PARALLEL DO
+    end subroutine removal_lofs
+
+    subroutine prune_bases(x, y, y_mean, lof, nbases, mask_in, parent, truncated, cov, root, penalty, work, &
+            coefficients_out, data_matrix_mean_out, covariance_matrix_out, rhs_out, mask)
         real(8), intent(in) :: x(:, :)
-        real(8), intent(in) :: y(:)
-        real(8), intent(in) :: y_mean
+        real(8), intent(in) :: y(:, :)
+        real(8), intent(in) :: y_mean(:)
         real(8), intent(inout) :: lof
         integer, intent(inout) :: nbases
-        logical, intent(in) :: mask_in(:, :)
-        logical, intent(in) :: truncated(:, :)
-        integer, intent(in) :: cov(:, :)
-        real(8), intent(in) :: root(:, :)
+        logical, intent(in) :: mask_in(:)
+        integer, intent(in) :: parent(:)
+        logical, intent(in) :: truncated(:)
+        integer, intent(in) :: cov(:)
+        real(8), intent(in) :: root(:)
         integer, intent(in) :: penalty
+        real(8), intent(inout), target, contiguous :: work(:, :)
 
-        real(8), intent(out) :: coefficients_out(nbases - 1)
-        logical, intent(out) :: mask(size(mask_in, 1), size(mask_in, 2)) ! Requires splititng since fortran expects 4 byte for a logical?!
+        real(8), intent(out) :: coefficients_out(nbases - 1, size(y, 2))
+        real(8), intent(out) :: data_matrix_mean_out(nbases - 1)
+        real(8), intent(out) :: covariance_matrix_out(nbases - 1, nbases - 1)
+        real(8), intent(out) :: rhs_out(nbases - 1, size(y, 2))
+        logical, intent(out) :: mask(size(mask_in)) ! Requires splititng since fortran expects 4 byte for a logical?!
 
         integer :: best_nbases
-        logical :: best_mask(size(mask, 1), size(mask, 2))
+        logical :: best_mask(size(mask))
         real(8) :: best_lof
-        logical :: prev_mask(size(mask, 1), size(mask, 2))
         integer :: iteration
-        real(8) :: best_lof_trim
         integer :: removal_idx
-        integer, allocatable :: indices(:)
         integer :: i
-        real(8), allocatable :: a_data_matrix(:, :)
-        real(8), allocatable :: a_data_matrix_mean(:)
-        real(8), allocatable :: a_covariance_matrix(:, :)
-        real(8), allocatable :: a_rhs(:)
-        real(8), allocatable :: a_chol(:, :)
-        real(8), allocatable :: a_coefficients(:)
+        integer :: indices(nbases - 1)
+        integer :: keep(nbases - 1)
+        integer :: nkeep
+        integer :: best_keep(nbases - 1)
+        integer :: best_nkeep
+        real(8) :: y_centred_sq
+        real(8) :: lofs(nbases - 1)
+        integer :: offset
+        integer :: nrows, ncols
+        real(8), pointer, contiguous :: a_data_matrix_mean(:)
+        real(8), pointer, contiguous :: a_covariance_matrix(:, :)
+        real(8), pointer, contiguous :: a_rhs(:, :)
+        real(8), pointer, contiguous :: a_chol(:, :)
+        real(8), pointer, contiguous :: a_covariance_matrix_best(:, :)
+        real(8), pointer, contiguous :: a_rhs_best(:, :)
+        integer :: nresponses
+
+        nresponses = size(y, 2)
+        call workspace_shape(size(x, 1), nbases, nresponses, nrows, ncols)
+        if (size(work, 1) < nrows .or. size(work, 2) < 2) then
+            print *, "Workspace too small, shape: ", shape(work)
+            stop
+        end if
 
         coefficients_out = 0.0d0
+        data_matrix_mean_out = 0.0d0
+        covariance_matrix_out = 0.0d0
+        rhs_out = 0.0d0
         mask = mask_in
 
         best_nbases = nbases
         best_mask = mask
         best_lof = lof
-        prev_mask = mask
-
-        do iteration = 1, nbases - 1
-            best_lof_trim = 1d20
-            removal_idx = -1
-
-            allocate(indices(nbases - 1))
-            call active_base_indices(mask, nbases, indices)
-
-            allocate(a_data_matrix(size(x, 1), nbases - 2))
-            allocate(a_data_matrix_mean(nbases - 2))
-            allocate(a_covariance_matrix(nbases - 2, nbases - 2))
-            allocate(a_rhs(nbases - 2))
-            allocate(a_chol(nbases - 2, nbases - 2))
-            allocate(a_coefficients(nbases - 2))
-            do i = 1, size(indices)
-                mask(:, indices(i)) = .false.
-                nbases = nbases - 1
-
-                if (nbases == 1) then
-                    call generalised_cross_validation(y, y_mean, a_data_matrix, a_chol, a_coefficients, penalty, lof)
-                else
-                    call fit(x, y, y_mean, nbases, mask, truncated, cov, root, penalty, &
-                            a_data_matrix, a_data_matrix_mean, a_covariance_matrix, a_rhs, a_chol, a_coefficients, &
-                            lof)
-                end if
 
-                if (lof < best_lof_trim) then
-                    best_lof_trim = lof
-                    removal_idx = indices(i)
-                end if
-                if (lof < best_lof) then
-                    best_lof = lof
-                    best_nbases = nbases
-                    best_mask = mask
-                end if
+        ! The normal equations are built once, every removal is evaluated on the m x m system. The data matrix
+        ! itself is not needed.
+        offset = 0
+        call carve_vector(work(:, 2), offset, nbases - 1, a_data_matrix_mean)
+        call carve_matrix(work(:, 2), offset, nbases - 1, nbases - 1, a_covariance_matrix)
+        call carve_matrix(work(:, 2), offset, nbases - 1, nresponses, a_rhs)
+        call active_base_indices(mask, nbases, indices)
+        call normal_equations(x, y, y_mean, indices, parent, truncated, cov, root, &
+                a_data_matrix_mean, a_covariance_matrix, a_rhs, y_centred_sq)
 
-                mask(:, indices(i)) = prev_mask(:, indices(i))
-                nbases = nbases + 1
-            end do
-            deallocate(indices)
-            deallocate(a_data_matrix)
-            deallocate(a_data_matrix_mean)
-            deallocate(a_covariance_matrix)
-            deallocate(a_rhs)
-            deallocate(a_chol)
-            deallocate(a_coefficients)
-
-            mask(:, removal_idx) = .false.
+        keep = [(i, i = 1, size(keep))]
+        nkeep = size(keep)
+        best_keep = keep
+        best_nkeep = nkeep
+
+        do iteration = 1, size(indices)
+            call removal_lofs(a_covariance_matrix(keep(1:nkeep), keep(1:nkeep)), a_rhs(keep(1:nkeep), :), &
+                    y_centred_sq, size(y, 1), penalty, lofs(1:nkeep))
+            ! First minimum, independent of the number of threads
+            removal_idx = minloc(lofs(1:nkeep), dim = 1)
+
+            mask(indices(keep(removal_idx))) = .false.
             nbases = nbases - 1
-            prev_mask = mask
+            keep(removal_idx:nkeep - 1) = keep(removal_idx + 1:nkeep)
+            nkeep = nkeep - 1
+
+            if (lofs(removal_idx) < best_lof) then
+                best_lof = lofs(removal_idx)
+                best_nbases = nbases
+                best_mask = mask
+                best_keep(1:nkeep) = keep(1:nkeep)
+                best_nkeep = nkeep
+            end if
         end do
+
         mask = best_mask
         nbases = best_nbases
 
-        allocate(a_data_matrix(size(x, 1), nbases - 1))
-        allocate(a_data_matrix_mean(nbases - 1))
-        allocate(a_covariance_matrix(nbases - 1, nbases - 1))
-        allocate(a_rhs(nbases - 1))
-        allocate(a_chol(nbases - 1, nbases - 1))
-        allocate(a_coefficients(nbases - 1))
-        call fit(x, y, y_mean, nbases, mask, truncated, cov, root, penalty, &
-                a_data_matrix, a_data_matrix_mean, a_covariance_matrix, a_rhs, a_chol, a_coefficients, &
-                lof)
-        coefficients_out(:nbases - 1) = a_coefficients
-        deallocate(a_data_matrix)
-        deallocate(a_data_matrix_mean)
-        deallocate(a_covariance_matrix)
-        deallocate(a_rhs)
-        deallocate(a_chol)
+        ! The normal equations of the best subset are a part of the full ones, no basis is evaluated again.
+        ! The data matrix is not needed anymore, the shared column holds the reduced system.
+        offset = 0
+        call carve_matrix(work(:, 1), offset, best_nkeep, best_nkeep, a_covariance_matrix_best)
+        call carve_matrix(work(:, 1), offset, best_nkeep, nresponses, a_rhs_best)
+        call carve_matrix(work(:, 1), offset, best_nkeep, best_nkeep, a_chol)
+        a_covariance_matrix_best = a_covariance_matrix(best_keep(1:best_nkeep), best_keep(1:best_nkeep))
+        a_rhs_best = a_rhs(best_keep(1:best_nkeep), :)
+        call coefficients(a_covariance_matrix_best, a_rhs_best, coefficients_out(1:best_nkeep, :), a_chol)
+        call fast_generalised_cross_validation(y_centred_sq, size(y, 1), a_rhs_best, a_chol, &
+                coefficients_out(1:best_nkeep, :), penalty, lof)
+        data_matrix_mean_out(1:best_nkeep) = a_data_matrix_mean(best_keep(1:best_nkeep))
+        ! The normal equations of the pruned model are kept, so new samples can be merged into them
+        covariance_matrix_out(1:best_nkeep, 1:best_nkeep) = a_covariance_matrix_best
+        rhs_out(1:best_nkeep, :) = a_rhs_best
     end subroutine prune_bases
 
-    subroutine find_bases(x, y, y_mean, max_nbases, max_ncandidates, aging_factor, penalty, &
-            lof, nbases, mask, truncated, cov, root, coefficients_out)
+    subroutine find_bases(x, y, sorted_indices, y_mean, max_nbases, max_ncandidates, aging_factor, penalty, &
+            minspan, endspan, max_nknots, work, lof, nbases, mask, parent, truncated, cov, root, coefficients_out, &
+            data_matrix_mean_out, covariance_matrix_out, rhs_out)
+        ! Release the GIL, so concurrent fits on Python threads run in parallel
+        !f2py threadsafe
         real(8), intent(in) :: x(:, :)
-        real(8), intent(in) :: y(:)
-        real(8), intent(in) :: y_mean
+        real(8), intent(in) :: y(:, :)
+        integer, intent(in) :: sorted_indices(:, :)
+        real(8), intent(in) :: y_mean(:)
         integer, intent(in) :: max_nbases
         integer, intent(in) :: max_ncandidates
         real(8), intent(in) :: aging_factor
         integer, intent(in) :: penalty
+        integer, intent(in) :: minspan
+        integer, intent(in) :: endspan
+        integer, intent(in) :: max_nknots
+        real(8), intent(inout), contiguous :: work(:, :)
 
         real(8), intent(out) :: lof
         integer, intent(out) :: nbases
-        logical, intent(out) :: mask(max_nbases, max_nbases)
-        logical, intent(out) :: truncated(max_nbases, max_nbases)
-        integer, intent(out) :: cov(max_nbases, max_nbases)
-        real(8), intent(out) :: root(max_nbases, max_nbases)
-        real(8), intent(out) :: coefficients_out(max_nbases - 1)
-
-        logical :: mask_in(max_nbases, max_nbases)
-
-        call expand_bases(x, y, y_mean, max_nbases, max_ncandidates, aging_factor, penalty, &
-                lof, nbases, mask_in, truncated, cov, root, coefficients_out)
-        call prune_bases(x, y, y_mean, lof, nbases, mask_in, truncated, cov, root, penalty, coefficients_out, mask)
+        logical, intent(out) :: mask(max_nbases)
+        integer, intent(out) :: parent(max_nbases)
+        logical, intent(out) :: truncated(max_nbases)
+        integer, intent(out) :: cov(max_nbases)
+        real(8), intent(out) :: root(max_nbases)
+        real(8), intent(out) :: coefficients_out(max_nbases - 1, size(y, 2))
+        real(8), intent(out) :: data_matrix_mean_out(max_nbases - 1)
+        real(8), intent(out) :: covariance_matrix_out(max_nbases - 1, max_nbases - 1)
+        real(8), intent(out) :: rhs_out(max_nbases - 1, size(y, 2))
+
+        logical :: mask_in(max_nbases)
+        integer :: constant_parent(max_nbases)
+        logical :: constant_truncated(max_nbases)
+        integer :: constant_cov(max_nbases)
+        real(8) :: constant_root(max_nbases)
+
+        ! The search starts from the constant model
+        constant_parent = 1
+        constant_truncated = .false.
+        constant_cov = 0
+        constant_root = 0d0
+        call expand_bases(x, y, sorted_indices, y_mean, max_nbases, max_ncandidates, aging_factor, penalty, &
+                minspan, endspan, max_nknots, work, 1, constant_parent, constant_truncated, constant_cov, &
+                constant_root, lof, nbases, mask_in, parent, truncated, cov, root, coefficients_out)
+        call prune_bases(x, y, y_mean, lof, nbases, mask_in, parent, truncated, cov, root, penalty, work, &
+                coefficients_out, data_matrix_mean_out, covariance_matrix_out, rhs_out, mask)
     end subroutine find_bases
 
 end module backend
@@ -0,0 +1,1357 @@
+"""
+Numba backend of the OMAR model. The routines mirror the Fortran backend, but index from 0, allocate their own buffers
+and need no compiler toolchain. They are compiled on their first call and cached on disk, the parent and covariate
+pairs of the forward pass and the columns of the data matrix are processed by parallel threads.
+"""
+import numpy as np
+from jaxtyping import Bool, Float, Integer
+# The thread count is thread-local, so fits on several Python threads can split the cores between them
+from numba import get_num_threads, njit, prange, set_num_threads, threading_layer
+from numpy.linalg import LinAlgError
+
+# Compiled routines are cached next to this module, so only the first fit after an installation compiles them. They
+# release the GIL, so concurrent fits on Python threads run in parallel.
+OPTIONS = {"cache": True, "error_model": "numpy", "nogil": True}
+# Rows of the tiles the normal equations are accumulated on, like in the Fortran backend. The tiles are grouped into
+# a fixed number of blocks, which the threads share, so the sums don't depend on the number of threads.
+ROW_TILE = 256
+ROW_BLOCKS = 64
+
+
+def threadsafe() -> bool:
+    """
+    Check whether the parallel routines may run on several Python threads at once. The workqueue threading layer of
+    Numba aborts the process on concurrent parallel regions, the omp and tbb layers don't.
+
+    Returns:
+        Whether concurrent fits are safe.
+    """
+    # The layer is only known once the thread pool has been started
+    get_num_threads()
+    return threading_layer() != "workqueue"
+
+
+@njit(**OPTIONS)
+def active_base_indices(mask: Bool[np.ndarray, "max_nbases"]) -> Integer[np.ndarray, "k"]:
+    """
+    Get the indices of the active basis functions.
+
+    Args:
+        mask: Flags the active basis functions.
+
+    Returns:
+        Indices of the active basis functions.
+    """
+    return np.flatnonzero(mask)
+
+
+@njit(**OPTIONS)
+def basis_function(x: Float[np.ndarray, "N d"],
+                   basis_idx: int,
+                   parent: Integer[np.ndarray, "max_nbases"],
+                   truncated: Bool[np.ndarray, "max_nbases"],
+                   cov: Integer[np.ndarray, "max_nbases"],
+                   root: Float[np.ndarray, "max_nbases"],
+                   values: Float[np.ndarray, "N"]) -> None:
+    """
+    Evaluate a basis function into values, multiplying the hinges of its parent chain from the first one on.
+
+    Args:
+        x: Predictor variables.
+        basis_idx: Index of the basis function.
+        parent: Index of the parent of every basis function.
+        truncated: Flags whether the hinge of a basis function is truncated.
+        cov: Covariate of the hinge of a basis function.
+        root: Root of the hinge of a basis function.
+        values: Output, values of the basis function.
+    """
+    chain = np.empty(len(parent), dtype=np.int64)
+    depth = 0
+    while basis_idx != 0:
+        chain[depth] = basis_idx
+        depth += 1
+        basis_idx = parent[basis_idx]
+
+    values[:] = 1.0
+    for i in range(depth - 1, -1, -1):
+        func_idx = chain[i]
+        if truncated[func_idx]:
+            for row in range(len(values)):
+                values[row] *= max(0.0, x[row, cov[func_idx]] - root[func_idx])
+        else:
+            for row in range(len(values)):
+                values[row] *= x[row, cov[func_idx]] - root[func_idx]
+
+
+@njit(**OPTIONS)
+def centred_column(x: Float[np.ndarray, "N d"],
+                   basis_idx: int,
+                   parent: Integer[np.ndarray, "max_nbases"],
+                   truncated: Bool[np.ndarray, "max_nbases"],
+                   cov: Integer[np.ndarray, "max_nbases"],
+                   root: Float[np.ndarray, "max_nbases"],
+                   values: Float[np.ndarray, "N"]) -> float:
+    """
+    Evaluate a basis function into values and centre it.
+
+    Args:
+        x: Predictor variables.
+        basis_idx: Index of the basis function.
+        parent: Index of the parent of every basis function.
+        truncated: Flags whether the hinge of a basis function is truncated.
+        cov: Covariate of the hinge of a basis function.
+        root: Root of the hinge of a basis function.
+        values: Output, centred values of the basis function.
+
+    Returns:
+        Mean of the basis function.
+    """
+    basis_function(x, basis_idx, parent, truncated, cov, root, values)
+    mean = values.mean()
+    values -= mean
+    return mean
+
+
+@njit(parallel=True, **OPTIONS)
+def data_matrix(x: Float[np.ndarray, "N d"],
+                basis_indices: Integer[np.ndarray, "k"],
+                parent: Integer[np.ndarray, "max_nbases"],
+                truncated: Bool[np.ndarray, "max_nbases"],
+                cov: Integer[np.ndarray, "max_nbases"],
+                root: Float[np.ndarray, "max_nbases"]) -> tuple[Float[np.ndarray, "N k"], Float[np.ndarray, "k"]]:
+    """
+    Evaluate the selected basis functions, one column per thread.
+
+    Args:
+        x: Predictor variables.
+        basis_indices: Indices of the basis functions to be evaluated.
+        parent: Index of the parent of every basis function.
+        truncated: Flags whether the hinge of a basis function is truncated.
+        cov: Covariate of the hinge of a basis function.
+        root: Root of the hinge of a basis function.
+
+    Returns:
+        Centred data matrix, mean of the data matrix.
+    """
+    # Column-major, so the columns are contiguous like in the Fortran backend
+    data_matrix_out = np.empty((len(basis_indices), x.shape[0])).T
+    data_matrix_mean = np.empty(len(basis_indices))
+    for i in prange(len(basis_indices)):
+        data_matrix_mean[i] = centred_column(x, basis_indices[i], parent, truncated, cov, root, data_matrix_out[:, i])
+    return data_matrix_out, data_matrix_mean
+
+
+@njit(parallel=True, **OPTIONS)
+def covariance_matrix(data_matrix_in: Float[np.ndarray, "N m"]) -> Float[np.ndarray, "m m"]:
+    """
+    Calculate the covariance matrix of the data matrix, with epsilon added to the diagonal.
+
+    Args:
+        data_matrix_in: Centred data matrix.
+
+    Returns:
+        Covariance matrix.
+    """
+    ncols = data_matrix_in.shape[1]
+    covariance_matrix_out = np.empty((ncols, ncols))
+    for j in prange(ncols):
+        for i in range(j, ncols):
+            covariance_matrix_out[i, j] = np.dot(data_matrix_in[:, i], data_matrix_in[:, j])
+            covariance_matrix_out[j, i] = covariance_matrix_out[i, j]
+        covariance_matrix_out[j, j] += 1e-8
+    return covariance_matrix_out
+
+
+@njit(**OPTIONS)
+def rhs(y: Float[np.ndarray, "N k"], y_mean: Float[np.ndarray, "k"], data_matrix_in: Float[np.ndarray, "N m"]) \
+        -> Float[np.ndarray, "m k"]:
+    """
+    Calculate the right hand side of the normal equations, one column per response variable.
+
+    Args:
+        y: Response variables.
+        y_mean: Mean of the response variables.
+        data_matrix_in: Centred data matrix.
+
+    Returns:
+        Right hand side of the normal equations.
+    """
+    rhs_out = np.empty((data_matrix_in.shape[1], y.shape[1]))
+    for j in range(y.shape[1]):
+        y_centred = y[:, j] - y_mean[j]
+        for i in range(rhs_out.shape[0]):
+            rhs_out[i, j] = np.dot(data_matrix_in[:, i], y_centred)
+    return rhs_out
+
+
+@njit(parallel=True, **OPTIONS)
+def normal_equations(x: Float[np.ndarray, "N d"],
+                     y: Float[np.ndarray, "N k"],
+                     y_mean: Float[np.ndarray, "k"],
+                     basis_indices: Integer[np.ndarray, "m"],
+                     parent: Integer[np.ndarray, "max_nbases"],
+                     truncated: Bool[np.ndarray, "max_nbases"],
+                     cov: Integer[np.ndarray, "max_nbases"],
+                     root: Float[np.ndarray, "max_nbases"]) -> tuple:
+    """
+    Build the normal equations of the selected basis functions without storing the data matrix. Every thread
+    evaluates the bases on the row tiles of a block and accumulates the sums while the tile is in cache. The partial
+    sums are reduced in the order of the blocks, which keeps the result independent of the scheduling.
+
+    Args:
+        x: Predictor variables.
+        y: Response variables.
+        y_mean: Mean of the response variables.
+        basis_indices: Indices of the basis functions.
+        parent: Index of the parent of every basis function.
+        truncated: Flags whether the hinge of a basis function is truncated.
+        cov: Covariate of the hinge of a basis function.
+        root: Root of the hinge of a basis function.
+
+    Returns:
+        Mean of the data matrix, covariance matrix, right hand side of the normal equations, squared norm of the
+        centred response variables.
+    """
+    nrows = x.shape[0]
+    ncols = len(basis_indices)
+    nresponses = y.shape[1]
+
+    # The first row shifts the columns, so the centring of the sums below does not cancel
+    shift = np.empty(ncols)
+    first_row = np.empty(1)
+    for i in range(ncols):
+        basis_function(x[:1], basis_indices[i], parent, truncated, cov, root, first_row)
+        shift[i] = first_row[0]
+
+    ntiles = (nrows + ROW_TILE - 1) // ROW_TILE
+    nblocks = max(1, min(ROW_BLOCKS, ntiles))
+    tiles_per_block = (ntiles + nblocks - 1) // nblocks
+    block_covariance = np.zeros((nblocks, ncols, ncols))
+    block_rhs = np.zeros((nblocks, ncols, nresponses))
+    block_column_sum = np.zeros((nblocks, ncols))
+    block_y_centred_sq = np.zeros(nblocks)
+    block_y_centred_sum = np.zeros((nblocks, nresponses))
+    for block in prange(nblocks):
+        # Column-major, so the columns are contiguous. Rows beyond the data stay zero and add nothing to the sums.
+        tile = np.zeros((ncols, ROW_TILE)).T
+        y_centred = np.zeros((nresponses, ROW_TILE)).T
+        for tile_idx in range(block * tiles_per_block, min((block + 1) * tiles_per_block, ntiles)):
+            first = tile_idx * ROW_TILE
+            ntile = min(ROW_TILE, nrows - first)
+            for i in range(ncols):
+                basis_function(x[first:first + ntile], basis_indices[i], parent, truncated, cov, root,
+                               tile[:ntile, i])
+                tile[:ntile, i] -= shift[i]
+                tile[ntile:, i] = 0.0
+                block_column_sum[block, i] += np.sum(tile[:, i])
+            for j in range(nresponses):
+                y_centred[:ntile, j] = y[first:first + ntile, j] - y_mean[j]
+                y_centred[ntile:, j] = 0.0
+                block_y_centred_sum[block, j] += np.sum(y_centred[:, j])
+            block_y_centred_sq[block] += np.sum(y_centred ** 2)
+            if ncols > 0:
+                block_covariance[block] += np.dot(tile.T, tile)
+                block_rhs[block] += np.dot(tile.T, y_centred)
+
+    covariance_matrix_out = np.zeros((ncols, ncols))
+    rhs_out = np.zeros((ncols, nresponses))
+    column_sum = np.zeros(ncols)
+    y_centred_sq = 0.0
+    y_centred_sum = np.zeros(nresponses)
+    for block in range(nblocks):
+        covariance_matrix_out += block_covariance[block]
+        rhs_out += block_rhs[block]
+        column_sum += block_column_sum[block]
+        y_centred_sq += block_y_centred_sq[block]
+        y_centred_sum += block_y_centred_sum[block]
+    data_matrix_mean = column_sum / nrows
+
+    # Centre the sums instead of the columns, C - N mu mu^T, and add epsilon to the diagonal
+    for j in range(ncols):
+        for i in range(ncols):
+            covariance_matrix_out[i, j] -= nrows * data_matrix_mean[i] * data_matrix_mean[j]
+        covariance_matrix_out[j, j] += 1e-8
+        rhs_out[j] -= data_matrix_mean[j] * y_centred_sum
+    return data_matrix_mean + shift, covariance_matrix_out, rhs_out, y_centred_sq
+
+
+@njit(**OPTIONS)
+def cholesky(matrix: Float[np.ndarray, "m m"]) -> Float[np.ndarray, "m m"]:
+    """
+    Compute the lower triangular Cholesky decomposition. The systems are small, so no LAPACK is needed. Like
+    LAPACK's dpotrf, which the other backends call, it fails on the first pivot that is not positive or NaN, without
+    a tolerance. The epsilon on the diagonal of the covariance matrix keeps the pivots of duplicate bases positive
+    in exact arithmetic only.
+
+    Args:
+        matrix: Symmetric positive definite matrix.
+
+    Returns:
+        Lower triangular Cholesky decomposition.
+    """
+    n = matrix.shape[0]
+    chol = np.zeros((n, n))
+    for j in range(n):
+        diagonal = matrix[j, j]
+        for k in range(j):
+            diagonal -= chol[j, k] ** 2
+        if not diagonal > 0:
+            raise LinAlgError("Error during Cholesky decomposition.")
+        chol[j, j] = np.sqrt(diagonal)
+        for i in range(j + 1, n):
+            value = matrix[i, j]
+            for k in range(j):
+                value -= chol[i, k] * chol[j, k]
+            chol[i, j] = value / chol[j, j]
+    return chol
+
+
+@njit(**OPTIONS)
+def cho_solve(chol: Float[np.ndarray, "m m"], rhs_in: Float[np.ndarray, "m k"]) -> Float[np.ndarray, "m k"]:
+    """
+    Solve the linear system given by its lower triangular Cholesky decomposition, for every column of the right hand
+    side.
+
+    Args:
+        chol: Lower triangular Cholesky decomposition.
+        rhs_in: Right hand side.
+
+    Returns:
+        Solution of the linear system.
+    """
+    n = rhs_in.shape[0]
+    solution = rhs_in.copy()
+    for j in range(rhs_in.shape[1]):
+        for i in range(n):
+            for k in range(i):
+                solution[i, j] -= chol[i, k] * solution[k, j]
+            solution[i, j] /= chol[i, i]
+        for i in range(n - 1, -1, -1):
+            for k in range(i + 1, n):
+                solution[i, j] -= chol[k, i] * solution[k, j]
+            solution[i, j] /= chol[i, i]
+    return solution
+
+
+@njit(**OPTIONS)
+def coefficients(covariance_matrix_in: Float[np.ndarray, "m m"],
+                 rhs_in: Float[np.ndarray, "m k"]) -> tuple[Float[np.ndarray, "m k"], Float[np.ndarray, "m m"]]:
+    """
+    Solve the normal equations via Cholesky decomposition.
+
+    Args:
+        covariance_matrix_in: Covariance matrix.
+        rhs_in: Right hand side of the normal equations.
+
+    Returns:
+        Coefficients, Cholesky decomposition of the covariance matrix.
+    """
+    chol = cholesky(covariance_matrix_in)
+    return cho_solve(chol, rhs_in), chol
+
+
+@njit(**OPTIONS)
+def rank(chol: Float[np.ndarray, "m m"]) -> int:
+    """
+    Rank of a matrix from the diagonal of its Cholesky decomposition.
+
+    Args:
+        chol: Cholesky decomposition.
+
+    Returns:
+        Rank of the matrix.
+    """
+    nonzero = 0
+    for i in range(chol.shape[0]):
+        if chol[i, i] != 0:
+            nonzero += 1
+    return nonzero
+
+
+@njit(**OPTIONS)
+def lack_of_fit(rss: float, rank_in: int, n_samples: int, penalty: float) -> float:
+    """
+    Calculate the generalised cross validation criterion from the residual sum of squares.
+
+    Args:
+        rss: Residual sum of squares.
+        rank_in: Rank of the covariance matrix.
+        n_samples: Number of samples.
+        penalty: Cost of every basis function.
+
+    Returns:
+        Lack of fit criterion.
+    """
+    c_m = rank_in * (1 + penalty) + 1 - penalty
+    if c_m == n_samples:
+        return np.inf
+    return rss / n_samples / (1 - c_m / n_samples) ** 2
+
+
+@njit(**OPTIONS)
+def generalised_cross_validation(y: Float[np.ndarray, "N k"],
+                                 y_mean: Float[np.ndarray, "k"],
+                                 data_matrix_in: Float[np.ndarray, "N m"],
+                                 chol: Float[np.ndarray, "m m"],
+                                 coefficients_in: Float[np.ndarray, "m k"],
+                                 penalty: float) -> float:
+    """
+    Calculate the lack of fit criterion from the residuals of the prediction, summed over the response variables.
+
+    Args:
+        y: Response variables.
+        y_mean: Mean of the response variables.
+        data_matrix_in: Centred data matrix.
+        chol: Cholesky decomposition of the covariance matrix.
+        coefficients_in: Coefficients of the model.
+        penalty: Cost of every basis function.
+
+    Returns:
+        Lack of fit criterion.
+    """
+    rss = 0.0
+    for j in range(y.shape[1]):
+        residuals = y[:, j] - y_mean[j]
+        for i in range(data_matrix_in.shape[1]):
+            residuals -= coefficients_in[i, j] * data_matrix_in[:, i]
+        rss += np.sum(residuals ** 2)
+    return lack_of_fit(rss, rank(chol), y.shape[0], penalty)
+
+
+@njit(**OPTIONS)
+def fast_generalised_cross_validation(y_centred_sq: float,
+                                      n_samples: int,
+                                      rhs_in: Float[np.ndarray, "m k"],
+                                      chol: Float[np.ndarray, "m m"],
+                                      coefficients_in: Float[np.ndarray, "m k"],
+                                      penalty: float) -> float:
+    """
+    Calculate the lack of fit criterion from the normal equations, without touching the data matrix. The residual sum
+    of squares is summed over the response variables.
+
+    Args:
+        y_centred_sq: Squared norm of the centred response variables.
+        n_samples: Number of samples.
+        rhs_in: Right hand side of the normal equations.
+        chol: Cholesky decomposition of the covariance matrix.
+        coefficients_in: Coefficients of the model.
+        penalty: Cost of every basis function.
+
+    Returns:
+        Lack of fit criterion.
+    """
+    rss = y_centred_sq - np.sum(coefficients_in * rhs_in) - 1e-8 * np.sum(coefficients_in ** 2)
+    # A failed update leaves a NaN, which must not be clamped to a perfect fit
+    return lack_of_fit(max(rss, 0.0), rank(chol), n_samples, penalty)
+
+
+@njit(**OPTIONS)
+def fit(x: Float[np.ndarray, "N d"],
+        y: Float[np.ndarray, "N k"],
+        y_mean: Float[np.ndarray, "k"],
+        mask: Bool[np.ndarray, "max_nbases"],
+        parent: Integer[np.ndarray, "max_nbases"],
+        truncated: Bool[np.ndarray, "max_nbases"],
+        cov: Integer[np.ndarray, "max_nbases"],
+        root: Float[np.ndarray, "max_nbases"],
+        penalty: float) -> tuple:
+    """
+    Calculate the least-squares fit of the active basis functions.
+
+    Args:
+        x: Predictor variables.
+        y: Response variables.
+        y_mean: Mean of the response variables.
+        mask: Flags the active basis functions.
+        parent: Index of the parent of every basis function.
+        truncated: Flags whether the hinge of a basis function is truncated.
+        cov: Covariate of the hinge of a basis function.
+        root: Root of the hinge of a basis function.
+        penalty: Cost of every basis function.
+
+    Returns:
+        Centred data matrix, mean of the data matrix, covariance matrix, right hand side of the normal equations,
+        Cholesky decomposition, coefficients, lack of fit criterion.
+    """
+    data_matrix_out, data_matrix_mean = data_matrix(x, active_base_indices(mask), parent, truncated, cov, root)
+    covariance_matrix_out = covariance_matrix(data_matrix_out)
+    rhs_out = rhs(y, y_mean, data_matrix_out)
+    coefficients_out, chol = coefficients(covariance_matrix_out, rhs_out)
+    lof = fast_generalised_cross_validation(np.sum((y - y_mean) ** 2), y.shape[0], rhs_out, chol, coefficients_out,
+                                            penalty)
+    return data_matrix_out, data_matrix_mean, covariance_matrix_out, rhs_out, chol, coefficients_out, lof
+
+
+@njit(**OPTIONS)
+def append_fit(data_matrix_prev: Float[np.ndarray, "N m"],
+               data_matrix_mean_prev: Float[np.ndarray, "m"],
+               covariance_matrix_prev: Float[np.ndarray, "m m"],
+               rhs_prev: Float[np.ndarray, "m k"],
+               chol_prev: Float[np.ndarray, "m m"],
+               x: Float[np.ndarray, "N d"],
+               y: Float[np.ndarray, "N k"],
+               y_centred_sq: float,
+               nbases: int,
+               parent: Integer[np.ndarray, "max_nbases"],
+               truncated: Bool[np.ndarray, "max_nbases"],
+               cov: Integer[np.ndarray, "max_nbases"],
+               root: Float[np.ndarray, "max_nbases"],
+               penalty: float) -> tuple:
+    """
+    Extend the fit of the previous model by its last two basis functions. Only their columns are evaluated, the
+    normal equations are bordered and the Cholesky decomposition is extended by the 2 x 2 Schur complement.
+
+    Args:
+        data_matrix_prev: Centred data matrix of the previous model.
+        data_matrix_mean_prev: Mean of the data matrix of the previous model.
+        covariance_matrix_prev: Covariance matrix of the previous model.
+        rhs_prev: Right hand side of the normal equations of the previous model.
+        chol_prev: Cholesky decomposition of the previous model.
+        x: Predictor variables.
+        y: Response variables.
+        y_centred_sq: Squared norm of the centred response variables.
+        nbases: Number of basis functions, including the two new ones.
+        parent: Index of the parent of every basis function.
+        truncated: Flags whether the hinge of a basis function is truncated.
+        cov: Covariate of the hinge of a basis function.
+        root: Root of the hinge of a basis function.
+        penalty: Cost of every basis function.
+
+    Returns:
+        Centred data matrix, mean of the data matrix, covariance matrix, right hand side of the normal equations,
+        Cholesky decomposition, coefficients, lack of fit criterion.
+    """
+    nprev = nbases - 3
+    ncols = nbases - 1
+    data_matrix_out = np.empty((ncols, x.shape[0])).T
+    data_matrix_mean = np.empty(ncols)
+    data_matrix_out[:, :nprev] = data_matrix_prev
+    data_matrix_mean[:nprev] = data_matrix_mean_prev
+    for j in range(nprev, ncols):
+        data_matrix_mean[j] = centred_column(x, j + 1, parent, truncated, cov, root, data_matrix_out[:, j])
+
+    # Border the covariance matrix with the products of the new columns and all columns. The new columns are centred,
+    # so the response does not need to be.
+    covariance_matrix_out = np.empty((ncols, ncols))
+    covariance_matrix_out[:nprev, :nprev] = covariance_matrix_prev
+    rhs_out = np.empty((ncols, y.shape[1]))
+    rhs_out[:nprev] = rhs_prev
+    for j in range(nprev, ncols):
+        for i in range(j + 1):
+            covariance_matrix_out[i, j] = np.dot(data_matrix_out[:, i], data_matrix_out[:, j])
+            covariance_matrix_out[j, i] = covariance_matrix_out[i, j]
+        covariance_matrix_out[j, j] += 1e-8
+        for k in range(y.shape[1]):
+            rhs_out[j, k] = np.dot(data_matrix_out[:, j], y[:, k])
+
+    # The new rows of the Cholesky decomposition solve a triangular system against the previous factor
+    chol = np.zeros((ncols, ncols))
+    chol[:nprev, :nprev] = chol_prev
+    for j in range(nprev, ncols):
+        for i in range(nprev):
+            value = covariance_matrix_out[j, i]
+            for k in range(i):
+                value -= chol[j, k] * chol[i, k]
+            chol[j, i] = value / chol[i, i]
+    schur = covariance_matrix_out[nprev:, nprev:].copy()
+    for i in range(2):
+        for j in range(2):
+            for k in range(nprev):
+                schur[i, j] -= chol[nprev + i, k] * chol[nprev + j, k]
+    chol[nprev:, nprev:] = cholesky(schur)
+
+    coefficients_out = cho_solve(chol, rhs_out)
+    lof = fast_generalised_cross_validation(y_centred_sq, y.shape[0], rhs_out, chol, coefficients_out, penalty)
+    return data_matrix_out, data_matrix_mean, covariance_matrix_out, rhs_out, chol, coefficients_out, lof
+
+
+@njit(**OPTIONS)
+def update_init(x: Float[np.ndarray, "N d"],
+                data_matrix_in: Float[np.ndarray, "N m"],
+                data_matrix_mean: Float[np.ndarray, "m"],
+                prev_root: float,
+                parent_idx: int,
+                nbases: int,
+                cov: Integer[np.ndarray, "max_nbases"],
+                root: Float[np.ndarray, "max_nbases"]) -> tuple[Float[np.ndarray, "N"], float]:
+    """
+    Calculate the change of the last column of the data matrix when its root moves from prev_root.
+
+    Args:
+        x: Predictor variables.
+        data_matrix_in: Centred data matrix.
+        data_matrix_mean: Mean of the data matrix.
+        prev_root: Previous root of the last basis function.
+        parent_idx: Index of the parent basis function.
+        nbases: Number of basis functions.
+        cov: Covariate of the hinge of a basis function.
+        root: Root of the hinge of a basis function.
+
+    Returns:
+        Centred update vector, mean of the update vector.
+    """
+    new_root = root[nbases - 1]
+    new_cov = cov[nbases - 1]
+
+    update = np.empty(x.shape[0])
+    for row in range(x.shape[0]):
+        if x[row, new_cov] >= prev_root:
+            update[row] = prev_root - new_root
+        elif x[row, new_cov] < new_root:
+            update[row] = 0.0
+        else:
+            update[row] = x[row, new_cov] - new_root
+        if parent_idx != 0:
+            update[row] *= data_matrix_in[row, parent_idx - 1] + data_matrix_mean[parent_idx - 1]
+
+    update_mean = update.mean()
+    update -= update_mean
+    return update, update_mean
+
+
+@njit(**OPTIONS)
+def update_data_matrix(data_matrix_in: Float[np.ndarray, "N m"],
+                       data_matrix_mean: Float[np.ndarray, "m"],
+                       update: Float[np.ndarray, "N"],
+                       update_mean: float) -> None:
+    """
+    Update the last column of the data matrix in place.
+
+    Args:
+        data_matrix_in: Centred data matrix.
+        data_matrix_mean: Mean of the data matrix.
+        update: Centred update vector.
+        update_mean: Mean of the update vector.
+    """
+    data_matrix_in[:, -1] += update
+    data_matrix_mean[-1] += update_mean
+
+
+@njit(**OPTIONS)
+def update_covariance_matrix(covariance_matrix_in: Float[np.ndarray, "m m"],
+                             data_matrix_in: Float[np.ndarray, "N m"],
+                             update: Float[np.ndarray, "N"]) -> Float[np.ndarray, "m"]:
+    """
+    Update the last row and column of the covariance matrix in place.
+
+    Args:
+        covariance_matrix_in: Covariance matrix.
+        data_matrix_in: Updated centred data matrix.
+        update: Centred update vector.
+
+    Returns:
+        Addition to the last row and column of the covariance matrix.
+    """
+    last = covariance_matrix_in.shape[0] - 1
+    covariance_addition = np.empty(last + 1)
+    for i in range(last):
+        covariance_addition[i] = np.dot(update, data_matrix_in[:, i])
+    covariance_addition[last] = 2 * np.dot(data_matrix_in[:, last], update) - np.dot(update, update)
+
+    covariance_matrix_in[last, :last] += covariance_addition[:last]
+    covariance_matrix_in[:, last] += covariance_addition
+    return covariance_addition
+
+
+@njit(**OPTIONS)
+def update_rhs(rhs_in: Float[np.ndarray, "m k"], update: Float[np.ndarray, "N"], y: Float[np.ndarray, "N k"],
+               y_mean: Float[np.ndarray, "k"]) -> None:
+    """
+    Update the last row of the right hand side in place.
+
+    Args:
+        rhs_in: Right hand side of the normal equations.
+        update: Centred update vector.
+        y: Response variables.
+        y_mean: Mean of the response variables.
+    """
+    for j in range(y.shape[1]):
+        rhs_in[-1, j] += np.dot(update, y[:, j] - y_mean[j])
+
+
+@njit(**OPTIONS)
+def decompose_addition(covariance_addition: Float[np.ndarray, "m"]) \
+        -> tuple[Float[np.ndarray, "2"], Float[np.ndarray, "2 m"]]:
+    """
+    Decompose the addition to the last row and column of the covariance matrix into two rank-1 updates.
+
+    Args:
+        covariance_addition: Addition to the last row and column of the covariance matrix.
+
+    Returns:
+        Eigenvalues and eigenvectors of the addition.
+    """
+    n = len(covariance_addition)
+    eigenvalue_intermediate = np.sqrt(covariance_addition[-1] ** 2 + 4 * np.sum(covariance_addition[:-1] ** 2))
+    eigenvalues = np.array([(covariance_addition[-1] + eigenvalue_intermediate) / 2,
+                            (covariance_addition[-1] - eigenvalue_intermediate) / 2])
+
+    eigenvectors = np.empty((2, n))
+    for i in range(2):
+        eigenvectors[i, :-1] = covariance_addition[:-1] / eigenvalues[i]
+        eigenvectors[i, -1] = 1.0
+        eigenvectors[i] /= np.sqrt(np.sum(eigenvectors[i] ** 2))
+    return eigenvalues, eigenvectors
+
+
+@njit(**OPTIONS)
+def update_cholesky(chol: Float[np.ndarray, "m m"], update_vector: Float[np.ndarray, "m"], multiplier: float) -> None:
+    """
+    Update the lower triangular Cholesky decomposition in place to chol @ chol.T + multiplier * update_vector @
+    update_vector.T. Same recurrence as the Fortran backend, but row i of its work matrix only differs from row i - 1
+    behind the diagonal, so a single vector is carried through the columns.
+
+    Args:
+        chol: Cholesky decomposition.
+        update_vector: Vector defining the rank-1 update.
+        multiplier: Scalar multiplier of the rank-1 update.
+    """
+    n = chol.shape[0]
+    u = update_vector.copy()
+    b = 1.0
+    for i in range(n):
+        diag = chol[i, i] ** 2
+        for k in range(i + 1, n):
+            chol[k, i] /= chol[i, i]
+            u[k] -= u[i] * chol[k, i]
+
+        chol[i, i] = np.sqrt(diag + multiplier / b * u[i] ** 2)
+        for k in range(i + 1, n):
+            chol[k, i] = chol[k, i] * chol[i, i] + multiplier / b * u[i] * u[k] / chol[i, i]
+        b += multiplier * u[i] ** 2 / diag
+
+
+@njit(**OPTIONS)
+def update_coefficients(coefficients_in: Float[np.ndarray, "m k"],
+                        chol: Float[np.ndarray, "m m"],
+                        covariance_addition: Float[np.ndarray, "m"],
+                        rhs_in: Float[np.ndarray, "m k"]) -> None:
+    """
+    Update the Cholesky decomposition and the coefficients in place.
+
+    Args:
+        coefficients_in: Coefficients of the model.
+        chol: Cholesky decomposition of the covariance matrix.
+        covariance_addition: Addition to the last row and column of the covariance matrix.
+        rhs_in: Updated right hand side of the normal equations.
+    """
+    if np.any(covariance_addition != 0):
+        eigenvalues, eigenvectors = decompose_addition(covariance_addition)
+        for i in range(2):
+            update_cholesky(chol, eigenvectors[i], eigenvalues[i])
+    coefficients_in[:] = cho_solve(chol, rhs_in)
+
+
+@njit(**OPTIONS)
+def update_fit(data_matrix_in: Float[np.ndarray, "N m"],
+               data_matrix_mean: Float[np.ndarray, "m"],
+               covariance_matrix_in: Float[np.ndarray, "m m"],
+               rhs_in: Float[np.ndarray, "m k"],
+               chol: Float[np.ndarray, "m m"],
+               coefficients_in: Float[np.ndarray, "m k"],
+               x: Float[np.ndarray, "N d"],
+               y: Float[np.ndarray, "N k"],
+               prev_root: float,
+               parent_idx: int,
+               y_mean: Float[np.ndarray, "k"],
+               y_centred_sq: float,
+               nbases: int,
+               penalty: float,
+               cov: Integer[np.ndarray, "max_nbases"],
+               root: Float[np.ndarray, "max_nbases"]) -> float:
+    """
+    Update the fit in place to the current root of the last basis function.
+
+    Args:
+        data_matrix_in: Centred data matrix.
+        data_matrix_mean: Mean of the data matrix.
+        covariance_matrix_in: Covariance matrix.
+        rhs_in: Right hand side of the normal equations.
+        chol: Cholesky decomposition of the covariance matrix.
+        coefficients_in: Coefficients of the model.
+        x: Predictor variables.
+        y: Response variables.
+        prev_root: Previous root of the last basis function.
+        parent_idx: Index of the parent basis function.
+        y_mean: Mean of the response variables.
+        y_centred_sq: Squared norm of the centred response variables.
+        nbases: Number of basis functions.
+        penalty: Cost of every basis function.
+        cov: Covariate of the hinge of a basis function.
+        root: Root of the hinge of a basis function.
+
+    Returns:
+        Lack of fit criterion.
+    """
+    update, update_mean = update_init(x, data_matrix_in, data_matrix_mean, prev_root, parent_idx, nbases, cov, root)
+    update_data_matrix(data_matrix_in, data_matrix_mean, update, update_mean)
+    covariance_addition = update_covariance_matrix(covariance_matrix_in, data_matrix_in, update)
+    update_rhs(rhs_in, update, y, y_mean)
+    update_coefficients(coefficients_in, chol, covariance_addition, rhs_in)
+    return fast_generalised_cross_validation(y_centred_sq, y.shape[0], rhs_in, chol, coefficients_in, penalty)
+
+
+@njit(**OPTIONS)
+def sweep_fit(data_matrix_in: Float[np.ndarray, "N m"],
+              data_matrix_mean: Float[np.ndarray, "m"],
+              covariance_matrix_in: Float[np.ndarray, "m m"],
+              rhs_in: Float[np.ndarray, "m k"],
+              chol: Float[np.ndarray, "m m"],
+              coefficients_in: Float[np.ndarray, "m k"],
+              sweep_sums: Float[np.ndarray, "3*m+2*k+2"],
+              sweep_position: int,
+              x: Float[np.ndarray, "N d"],
+              y: Float[np.ndarray, "N k"],
+              sorted_indices: Integer[np.ndarray, "N"],
+              parent_idx: int,
+              y_mean: Float[np.ndarray, "k"],
+              y_centred_sq: float,
+              nbases: int,
+              penalty: float,
+              cov: Integer[np.ndarray, "max_nbases"],
+              root: Float[np.ndarray, "max_nbases"]) -> tuple[int, float]:
+    """
+    Update the fit in place to the next smaller root by accumulating the rows crossed since the previous root.
+
+    Args:
+        data_matrix_in: Centred data matrix of the first root of the pair.
+        data_matrix_mean: Mean of the data matrix.
+        covariance_matrix_in: Covariance matrix.
+        rhs_in: Right hand side of the normal equations.
+        chol: Cholesky decomposition of the covariance matrix.
+        coefficients_in: Coefficients of the model.
+        sweep_sums: Running sums over the rows above the previous root, the sums of the response variables have one
+            entry per response variable. Zeros at the first root of a pair.
+        sweep_position: Number of sorted rows already accumulated in the sums.
+        x: Predictor variables.
+        y: Response variables.
+        sorted_indices: Indices sorting the covariate of the new basis in descending order.
+        parent_idx: Index of the parent basis function.
+        y_mean: Mean of the response variables.
+        y_centred_sq: Squared norm of the centred response variables.
+        nbases: Number of basis functions.
+        penalty: Cost of every basis function.
+        cov: Covariate of the hinge of a basis function.
+        root: Root of the hinge of a basis function.
+
+    Returns:
+        Position in the sorted rows, lack of fit criterion.
+    """
+    new_root = root[nbases - 1]
+    new_cov = cov[nbases - 1]
+    ncols = covariance_matrix_in.shape[0] - 1
+    n_samples, nresponses = y.shape
+
+    # The columns of the data matrix sum to zero only up to rounding
+    if sweep_position == 0:
+        for i in range(ncols):
+            sweep_sums[2 * ncols + i] = np.sum(data_matrix_in[:, i])
+
+    # Accumulate the rows crossed since the previous root, the rows above it only shift by a constant
+    while sweep_position < len(sorted_indices):
+        row = sorted_indices[sweep_position]
+        if x[row, new_cov] < new_root:
+            break
+        sweep_position += 1
+
+        if parent_idx == 0:
+            parent_value = 1.0
+        else:
+            parent_value = data_matrix_in[row, parent_idx - 1] + data_matrix_mean[parent_idx - 1]
+        if parent_value == 0:
+            continue
+        parent_x = parent_value * x[row, new_cov]
+
+        for i in range(ncols):
+            sweep_sums[i] += parent_x * data_matrix_in[row, i]
+            sweep_sums[ncols + i] += parent_value * data_matrix_in[row, i]
+        sweep_sums[3 * ncols] += parent_x ** 2
+        sweep_sums[3 * ncols + 1] += parent_value * parent_x
+        sweep_sums[3 * ncols + 2] += parent_value ** 2
+        sweep_sums[3 * ncols + 3] += parent_x
+        sweep_sums[3 * ncols + 4] += parent_value
+        for j in range(nresponses):
+            y_centred = y[row, j] - y_mean[j]
+            sweep_sums[3 * ncols + 5 + j] += parent_x * y_centred
+            sweep_sums[3 * ncols + 5 + nresponses + j] += parent_value * y_centred
+
+    # Last column of the normal equations from the sums over the rows above the root
+    column_mean = (sweep_sums[3 * ncols + 3] - new_root * sweep_sums[3 * ncols + 4]) / n_samples
+    covariance_addition = np.empty(ncols + 1)
+    for i in range(ncols):
+        covariance_addition[i] = (sweep_sums[i] - new_root * sweep_sums[ncols + i]
+                                  - column_mean * sweep_sums[2 * ncols + i])
+    covariance_addition[ncols] = (sweep_sums[3 * ncols] - 2 * new_root * sweep_sums[3 * ncols + 1]
+                                  + new_root ** 2 * sweep_sums[3 * ncols + 2] - n_samples * column_mean ** 2 + 1e-8)
+    covariance_addition -= covariance_matrix_in[:, ncols]
+
+    covariance_matrix_in[ncols, :ncols] += covariance_addition[:ncols]
+    covariance_matrix_in[:, ncols] += covariance_addition
+    for j in range(nresponses):
+        rhs_in[ncols, j] = sweep_sums[3 * ncols + 5 + j] - new_root * sweep_sums[3 * ncols + 5 + nresponses + j]
+
+    update_coefficients(coefficients_in, chol, covariance_addition, rhs_in)
+    return sweep_position, fast_generalised_cross_validation(y_centred_sq, n_samples, rhs_in, chol, coefficients_in,
+                                                             penalty)
+
+
+@njit(parallel=True, **OPTIONS)
+def sort_predictors(x: Float[np.ndarray, "N d"]) -> Integer[np.ndarray, "N d"]:
+    """
+    Sort every predictor variable in descending order, one covariate per thread.
+
+    Args:
+        x: Predictor variables.
+
+    Returns:
+        Indices sorting each column of x in descending order.
+    """
+    sorted_indices = np.empty((x.shape[1], x.shape[0]), dtype=np.int64).T
+    for cov_idx in prange(x.shape[1]):
+        # The stable ascending order reversed, like the other backends
+        sorted_indices[:, cov_idx] = np.argsort(x[:, cov_idx], kind="mergesort")[::-1]
+    return sorted_indices
+
+
+@njit(**OPTIONS)
+def select_roots(sorted_roots: Float[np.ndarray, "n"], endspan: int, minspan: int, max_nknots: int) \
+        -> Float[np.ndarray, "k"]:
+    """
+    Select the candidate roots of a parent and covariate pair.
+
+    Args:
+        sorted_roots: Eligible roots sorted in descending order.
+        endspan: Number of roots skipped at both ends.
+        minspan: Step between the roots.
+        max_nknots: Maximum number of roots, 0 for no limit.
+
+    Returns:
+        Candidate roots in descending order.
+    """
+    # Skip the ends, step by minspan and drop repeated values, since they yield the same fit
+    selected_roots = np.empty(len(sorted_roots))
+    nselected = 0
+    for i in range(endspan, len(sorted_roots) - endspan, minspan):
+        if nselected != 0 and sorted_roots[i] == selected_roots[nselected - 1]:
+            continue
+        selected_roots[nselected] = sorted_roots[i]
+        nselected += 1
+
+    # Centres of max_nknots equally populated bins, the source index never lags behind the target index
+    if 0 < max_nknots < nselected:
+        for i in range(max_nknots):
+            selected_roots[i] = selected_roots[((2 * i + 1) * nselected) // (2 * max_nknots)]
+        nselected = max_nknots
+    return selected_roots[:nselected]
+
+
+@njit(**OPTIONS)
+def add_bases(parent_in: int,
+              cov_in: int,
+              root_in: float,
+              nbases: int,
+              mask: Bool[np.ndarray, "max_nbases"],
+              parent: Integer[np.ndarray, "max_nbases"],
+              truncated: Bool[np.ndarray, "max_nbases"],
+              cov: Integer[np.ndarray, "max_nbases"],
+              root: Float[np.ndarray, "max_nbases"]) -> None:
+    """
+    Add a linear and a truncated basis function in place, as the last two basis functions.
+
+    Args:
+        parent_in: Index of the parent basis function.
+        cov_in: Covariate of the new hinges.
+        root_in: Root of the truncated hinge.
+        nbases: Number of basis functions, including the two new ones.
+        mask: Flags the active basis functions.
+        parent: Index of the parent of every basis function.
+        truncated: Flags whether the hinge of a basis function is truncated.
+        cov: Covariate of the hinge of a basis function.
+        root: Root of the hinge of a basis function.
+    """
+    mask[nbases - 2:nbases] = True
+    parent[nbases - 2:nbases] = parent_in
+    cov[nbases - 2:nbases] = cov_in
+
+    # The linear basis function has its root at zero, the truncated one at the given root
+    truncated[nbases - 2] = False
+    truncated[nbases - 1] = True
+    root[nbases - 2] = 0.0
+    root[nbases - 1] = root_in
+
+
+@njit(**OPTIONS)
+def evaluate_pair(data_matrix_prev: Float[np.ndarray, "N m"],
+                  data_matrix_mean_prev: Float[np.ndarray, "m"],
+                  covariance_matrix_prev: Float[np.ndarray, "m m"],
+                  rhs_prev: Float[np.ndarray, "m k"],
+                  chol_prev: Float[np.ndarray, "m m"],
+                  x: Float[np.ndarray, "N d"],
+                  y: Float[np.ndarray, "N k"],
+                  sorted_indices: Integer[np.ndarray, "N d"],
+                  y_mean: Float[np.ndarray, "k"],
+                  y_centred_sq: float,
+                  nbases: int,
+                  parent_idx: int,
+                  cov_idx: int,
+                  mask: Bool[np.ndarray, "max_nbases"],
+                  parent: Integer[np.ndarray, "max_nbases"],
+                  truncated: Bool[np.ndarray, "max_nbases"],
+                  cov: Integer[np.ndarray, "max_nbases"],
+                  root: Float[np.ndarray, "max_nbases"],
+                  penalty: float,
+                  minspan: int,
+                  endspan: int,
+                  max_nknots: int) -> tuple[float, float]:
+    """
+    Find the best root of a parent and covariate pair. The pair works on its own copy of the model, so pairs can be
+    evaluated in parallel threads.
+
+    Args:
+        data_matrix_prev: Centred data matrix of the current model.
+        data_matrix_mean_prev: Mean of the data matrix of the current model.
+        covariance_matrix_prev: Covariance matrix of the current model.
+        rhs_prev: Right hand side of the normal equations of the current model.
+        chol_prev: Cholesky decomposition of the current model.
+        x: Predictor variables.
+        y: Response variables.
+        sorted_indices: Indices sorting each column of x in descending order.
+        y_mean: Mean of the response variables.
+        y_centred_sq: Squared norm of the centred response variables.
+        nbases: Number of basis functions, including the two new ones.
+        parent_idx: Index of the parent basis function.
+        cov_idx: Covariate of the new hinges.
+        mask: Flags the active basis functions of the current model.
+        parent: Index of the parent of every basis function of the current model.
+        truncated: Flags whether the hinge of a basis function is truncated.
+        cov: Covariate of the hinge of a basis function.
+        root: Root of the hinge of a basis function.
+        penalty: Cost of every basis function.
+        minspan: Step between the candidate roots.
+        endspan: Number of candidate roots skipped at both ends.
+        max_nknots: Maximum number of candidate roots, 0 for no limit.
+
+    Returns:
+        Lack of fit criterion of the best root, best root. Infinite lack of fit if the pair has no candidate roots.
+    """
+    mask = mask.copy()
+    parent = parent.copy()
+    truncated = truncated.copy()
+    cov = cov.copy()
+    root = root.copy()
+    add_bases(parent_idx, cov_idx, 0.0, nbases, mask, parent, truncated, cov, root)
+
+    # The presorted order restricted to the support of the parent is already descending
+    eligible_roots = np.empty(x.shape[0])
+    neligible = 0
+    for j in range(x.shape[0]):
+        row = sorted_indices[j, cov_idx]
+        if parent_idx == 0 or data_matrix_prev[row, parent_idx - 1] > 0:
+            eligible_roots[neligible] = x[row, cov_idx]
+            neligible += 1
+    knots = select_roots(eligible_roots[:neligible], endspan, minspan, max_nknots)
+
+    best_lof = np.inf
+    best_root = -1.0
+    if len(knots) == 0:
+        return best_lof, best_root
+
+    # The first root extends the current fit, the further roots sweep down the sorted covariate
+    root[nbases - 1] = knots[0]
+    data_matrix_out, data_matrix_mean, covariance_matrix_out, rhs_out, chol, coefficients_out, lof = \
+        append_fit(data_matrix_prev, data_matrix_mean_prev, covariance_matrix_prev, rhs_prev, chol_prev, x, y,
+                   y_centred_sq, nbases, parent, truncated, cov, root, penalty)
+    best_lof = lof
+    best_root = knots[0]
+
+    sweep_sums = np.zeros(3 * nbases - 1 + 2 * y.shape[1])
+    sweep_position = 0
+    for root_idx in range(1, len(knots)):
+        root[nbases - 1] = knots[root_idx]
+        sweep_position, lof = sweep_fit(data_matrix_out, data_matrix_mean, covariance_matrix_out, rhs_out, chol,
+                                        coefficients_out, sweep_sums, sweep_position, x, y, sorted_indices[:, cov_idx],
+                                        parent_idx, y_mean, y_centred_sq, nbases, penalty, cov, root)
+        if lof < best_lof:
+            best_lof = lof
+            best_root = knots[root_idx]
+    return best_lof, best_root
+
+
+@njit(parallel=True, **OPTIONS)
+def expand_bases(x: Float[np.ndarray, "N d"],
+                 y: Float[np.ndarray, "N k"],
+                 sorted_indices: Integer[np.ndarray, "N d"],
+                 y_mean: Float[np.ndarray, "k"],
+                 max_nbases: int,
+                 max_ncandidates: int,
+                 aging_factor: float,
+                 penalty: float,
+                 minspan: int,
+                 endspan: int,
+                 max_nknots: int,
+                 nbases: int,
+                 parent: Integer[np.ndarray, "max_nbases"],
+                 truncated: Bool[np.ndarray, "max_nbases"],
+                 cov: Integer[np.ndarray, "max_nbases"],
+                 root: Float[np.ndarray, "max_nbases"]) -> tuple:
+    """
+    Forward pass, continuing from the given model. In every iteration, every parent and covariate pair extends the
+    fit of the current model and sweeps its roots, the pairs run in parallel threads and write their result into
+    their own slot.
+
+    Args:
+        x: Predictor variables.
+        y: Response variables.
+        sorted_indices: Indices sorting each column of x in descending order.
+        y_mean: Mean of the response variables.
+        max_nbases: Maximum number of basis functions.
+        max_ncandidates: Maximum number of parent candidates per iteration.
+        aging_factor: Aging of the parent candidates that are not evaluated.
+        penalty: Cost of every basis function.
+        minspan: Step between the candidate roots.
+        endspan: Number of candidate roots skipped at both ends.
+        max_nknots: Maximum number of candidate roots per pair, 0 for no limit.
+        nbases: Number of basis functions of the model to continue from, all of them are active.
+        parent: Index of the parent of every basis function of the model to continue from.
+        truncated: Flags whether the hinge of a basis function of the model to continue from is truncated.
+        cov: Covariate of the hinge of a basis function of the model to continue from.
+        root: Root of the hinge of a basis function of the model to continue from.
+
+    Returns:
+        Lack of fit criterion, number of basis functions, mask, parent, truncated, cov, root, coefficients.
+    """
+    n_samples, ncovs = x.shape
+    mask = np.zeros(max_nbases, dtype=np.bool_)
+    mask[1:nbases] = True
+    parent = parent.copy()
+    truncated = truncated.copy()
+    cov = cov.copy()
+    root = root.copy()
+    y_centred_sq = np.sum((y - y_mean) ** 2)
+
+    # The fit of the current model, which every pair extends. It starts with the given model and is extended by the
+    # selected pair in every iteration, so every basis is evaluated once.
+    if nbases > 1:
+        (data_matrix_prev, data_matrix_mean_prev, covariance_matrix_prev, rhs_prev, chol_prev, coefficients_prev,
+         lof_prev) = fit(x, y, y_mean, mask, parent, truncated, cov, root, penalty)
+    else:
+        data_matrix_prev = np.empty((0, n_samples)).T
+        data_matrix_mean_prev = np.empty(0)
+        covariance_matrix_prev = np.empty((0, 0))
+        rhs_prev = np.empty((0, y.shape[1]))
+        chol_prev = np.empty((0, 0))
+        coefficients_prev = np.empty((0, y.shape[1]))
+        lof_prev = lack_of_fit(y_centred_sq, 0, n_samples, penalty)
+
+    candidate_queue = np.zeros(max_nbases)
+    for iteration in range((max_nbases - nbases) // 2):
+        parents = np.argsort(candidate_queue[:nbases], kind="mergesort")
+        nparents = min(max_ncandidates, nbases)
+
+        # A covariate is eligible if it isn't in the parent chain yet
+        pairs = np.empty((nparents * ncovs, 2), dtype=np.int64)
+        npairs = 0
+        for i in range(nparents):
+            for cov_idx in range(ncovs):
+                func_idx = parents[i]
+                while func_idx != 0 and cov[func_idx] != cov_idx:
+                    func_idx = parent[func_idx]
+                if func_idx == 0:
+                    pairs[npairs, 0] = i
+                    pairs[npairs, 1] = cov_idx
+                    npairs += 1
+
+        nbases += 2
+        # Every pair owns its slot, no synchronisation between threads is needed
+        pair_lofs = np.full(npairs, np.inf)
+        pair_roots = np.zeros(npairs)
+        for k in prange(npairs):
+            pair_lofs[k], pair_roots[k] = evaluate_pair(
+                data_matrix_prev, data_matrix_mean_prev, covariance_matrix_prev, rhs_prev, chol_prev, x, y,
+                sorted_indices, y_mean, y_centred_sq, nbases, parents[pairs[k, 0]], pairs[k, 1], mask, parent,
+                truncated, cov, root, penalty, minspan, endspan, max_nknots)
+
+        # Reduce in pair order, so the first of equally good candidates wins independent of the number of threads
+        best_lof = np.inf
+        best_pair = -1
+        basis_lofs = np.full(nparents, np.inf)
+        for k in range(npairs):
+            basis_lofs[pairs[k, 0]] = min(basis_lofs[pairs[k, 0]], pair_lofs[k])
+            if pair_lofs[k] < best_lof:
+                best_lof = pair_lofs[k]
+                best_pair = k
+
+        if best_pair == -1:
+            print("Cannot find additional bases in iteration", iteration, ".")
+            nbases -= 2
+            break
+
+        for i in range(nbases - 2):
+            if i < nparents:
+                candidate_queue[parents[i]] = basis_lofs[i] - best_lof
+            else:
+                candidate_queue[parents[i]] -= aging_factor
+
+        add_bases(parents[pairs[best_pair, 0]], pairs[best_pair, 1], pair_roots[best_pair], nbases, mask, parent,
+                  truncated, cov, root)
+        candidate_queue[nbases - 2:nbases] = 0
+        (data_matrix_prev, data_matrix_mean_prev, covariance_matrix_prev, rhs_prev, chol_prev, coefficients_prev,
+         lof_prev) = append_fit(data_matrix_prev, data_matrix_mean_prev, covariance_matrix_prev, rhs_prev, chol_prev,
+                                x, y, y_centred_sq, nbases, parent, truncated, cov, root, penalty)
+
+    # The shared fit is the fit of the final model
+    return lof_prev, nbases, mask, parent, truncated, cov, root, coefficients_prev
+
+
+@njit(parallel=True, **OPTIONS)
+def removal_lofs(covariance_matrix_in: Float[np.ndarray, "m m"],
+                 rhs_in: Float[np.ndarray, "m k"],
+                 y_centred_sq: float,
+                 n_samples: int,
+                 penalty: float) -> Float[np.ndarray, "m"]:
+    """
+    Calculate the lack of fit criterion after removing each of the basis functions, without refitting.
+
+    Args:
+        covariance_matrix_in: Covariance matrix.
+        rhs_in: Right hand side of the normal equations.
+        y_centred_sq: Squared norm of the centred response variables.
+        n_samples: Number of samples.
+        penalty: Cost of every basis function.
+
+    Returns:
+        Lack of fit criterion after removing the respective basis function.
+    """
+    n = rhs_in.shape[0]
+    coefficients_in, chol = coefficients(covariance_matrix_in, rhs_in)
+    rss = y_centred_sq - np.sum(coefficients_in * rhs_in) - 1e-8 * np.sum(coefficients_in ** 2)
+
+    # Removing a basis increases the residual sum of squares by its coefficients squared, summed over the response
+    # variables, over the inverse diagonal. The i-th diagonal entry is the squared norm of the i-th column of the
+    # inverse Cholesky factor, which is zero above the diagonal, so every candidate solves a trailing triangular
+    # system of its own on its thread and writes its own slot.
+    lofs = np.empty(n)
+    for i in prange(n):
+        inverse_chol_column = np.zeros(n)
+        inverse_chol_column[i] = 1 / chol[i, i]
+        for row in range(i + 1, n):
+            value = 0.0
+            for k in range(i, row):
+                value -= chol[row, k] * inverse_chol_column[k]
+            inverse_chol_column[row] = value / chol[row, row]
+        inverse_diag = np.sum(inverse_chol_column ** 2)
+        lofs[i] = lack_of_fit(max(rss + np.sum(coefficients_in[i] ** 2) / inverse_diag, 0.0), n - 1, n_samples,
+                              penalty)
+    return lofs
+
+
+@njit(**OPTIONS)
+def prune_bases(x: Float[np.ndarray, "N d"],
+                y: Float[np.ndarray, "N k"],
+                y_mean: Float[np.ndarray, "k"],
+                lof: float,
+                nbases: int,
+                mask: Bool[np.ndarray, "max_nbases"],
+                parent: Integer[np.ndarray, "max_nbases"],
+                truncated: Bool[np.ndarray, "max_nbases"],
+                cov: Integer[np.ndarray, "max_nbases"],
+                root: Float[np.ndarray, "max_nbases"],
+                penalty: float) -> tuple:
+    """
+    Backward pass. The normal equations are built once without storing the data matrix, every removal is evaluated
+    on the m x m system.
+
+    Args:
+        x: Predictor variables.
+        y: Response variables.
+        y_mean: Mean of the response variables.
+        lof: Lack of fit criterion of the full model.
+        nbases: Number of basis functions.
+        mask: Flags the active basis functions.
+        parent: Index of the parent of every basis function.
+        truncated: Flags whether the hinge of a basis function is truncated.
+        cov: Covariate of the hinge of a basis function.
+        root: Root of the hinge of a basis function.
+        penalty: Cost of every basis function.
+
+    Returns:
+        Lack of fit criterion, number of basis functions, coefficients, mean of the data matrix, mask, covariance
+        matrix and right hand side of the normal equations of the pruned model.
+    """
+    mask = mask.copy()
+    indices = active_base_indices(mask)
+    data_matrix_mean, covariance_matrix_in, rhs_in, y_centred_sq = normal_equations(x, y, y_mean, indices, parent,
+                                                                                    truncated, cov, root)
+
+    best_nbases = nbases
+    best_mask = mask.copy()
+    best_lof = lof
+    keep = np.arange(len(indices))
+    best_keep = keep.copy()
+    for iteration in range(len(indices)):
+        lofs = removal_lofs(covariance_matrix_in[keep][:, keep], rhs_in[keep], y_centred_sq, y.shape[0], penalty)
+        # First minimum, independent of the number of threads
+        removal_idx = np.argmin(lofs)
+
+        mask[indices[keep[removal_idx]]] = False
+        nbases -= 1
+        keep = np.delete(keep, removal_idx)
+
+        if lofs[removal_idx] < best_lof:
+            best_lof = lofs[removal_idx]
+            best_nbases = nbases
+            best_mask = mask.copy()
+            best_keep = keep.copy()
+
+    # The normal equations of the best subset are a part of the full ones, no basis is evaluated again
+    covariance_matrix_best = covariance_matrix_in[best_keep][:, best_keep]
+    rhs_best = rhs_in[best_keep]
+    coefficients_out, chol = coefficients(covariance_matrix_best, rhs_best)
+    lof = fast_generalised_cross_validation(y_centred_sq, y.shape[0], rhs_best, chol, coefficients_out, penalty)
+    return lof, best_nbases, coefficients_out, data_matrix_mean[best_keep], best_mask, covariance_matrix_best, rhs_best
+
+
+@njit(**OPTIONS)
+def find_bases(x: Float[np.ndarray, "N d"],
+               y: Float[np.ndarray, "N k"],
+               sorted_indices: Integer[np.ndarray, "N d"],
+               y_mean: Float[np.ndarray, "k"],
+               max_nbases: int,
+               max_ncandidates: int,
+               aging_factor: float,
+               penalty: float,
+               minspan: int,
+               endspan: int,
+               max_nknots: int) -> tuple:
+    """
+    Forward and backward pass.
+
+    Args:
+        x: Predictor variables.
+        y: Response variables.
+        sorted_indices: Indices sorting each column of x in descending order.
+        y_mean: Mean of the response variables.
+        max_nbases: Maximum number of basis functions.
+        max_ncandidates: Maximum number of parent candidates per iteration.
+        aging_factor: Aging of the parent candidates that are not evaluated.
+        penalty: Cost of every basis function.
+        minspan: Step between the candidate roots.
+        endspan: Number of candidate roots skipped at both ends.
+        max_nknots: Maximum number of candidate roots per pair, 0 for no limit.
+
+    Returns:
+        Lack of fit criterion, number of basis functions, mask, parent, truncated, cov, root, coefficients, mean of
+        the data matrix, covariance matrix and right hand side of the normal equations of the pruned model.
+    """
+    # The search starts from the constant model
+    lof, nbases, mask, parent, truncated, cov, root, _ = expand_bases(x, y, sorted_indices, y_mean, max_nbases,
+                                                                      max_ncandidates, aging_factor, penalty,
+                                                                      minspan, endspan, max_nknots, 1,
+                                                                      np.zeros(max_nbases, dtype=np.int64),
+                                                                      np.zeros(max_nbases, dtype=np.bool_),
+                                                                      np.zeros(max_nbases, dtype=np.int64),
+                                                                      np.zeros(max_nbases))
+    lof, nbases, coefficients_out, data_matrix_mean, mask, covariance_matrix_out, rhs_out = \
+        prune_bases(x, y, y_mean, lof, nbases, mask, parent, truncated, cov, root, penalty)
+    return (lof, nbases, mask, parent, truncated, cov, root, coefficients_out, data_matrix_mean, covariance_matrix_out,
+            rhs_out)
@@ -1,12 +1,30 @@
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import Self
+import functools
+import importlib
+import os
+import threading
+from types import ModuleType
+from typing import Any, Self
+import warnings
 
 import numpy as np
-from numba import njit
-from jaxtyping import Float, Integer
-from scipy.linalg import cho_factor, cho_solve
-
-import build.fortran_backend as fortran
+from jaxtyping import Bool, Float, Integer
+
+# Rows per block when single precision operands are widened to double precision
+ROW_BLOCK_SIZE = 4096
+# Candidate roots per covariate of chunked fits without max_nknots
+CHUNKED_NKNOTS = 100
+# Rows sampled to place the candidate roots of chunked fits
+KNOT_SAMPLE_SIZE = 2 ** 16
+# Default memory cap of the basis cache in bytes
+BASIS_CACHE_SIZE = 2 ** 30
+# Rows of the predictor variables checksummed to tell whether the basis cache still matches them
+BASIS_CACHE_CHECK_ROWS = 64
+# Rows per tile of the frozen model, every thread holds a few vectors of this length
+PREDICTION_TILE_SIZE = 2 ** 14
 
 
 class Backend(Enum):
@@ -15,6 +33,229 @@ class Backend(Enum):
     """
     FORTRAN = 1
     PYTHON = 2
+    NUMBA = 3
+
+
+class LazyModule:
+    """
+    Module that is imported on the first attribute access, so importing omar doesn't load the backends and libraries
+    that a fit or prediction doesn't use. The first of the candidate names that can be imported is used.
+    """
+
+    def __init__(self, *names: str):
+        """
+        Register the module without importing it.
+
+        Args:
+            names: Candidate names of the module, in the order of preference.
+        """
+        self.names = [name for name in names if name]
+        self.module = None
+
+    def load(self) -> ModuleType:
+        """
+        Import the module, unless it is already imported.
+
+        Returns:
+            The imported module.
+        """
+        if self.module is None:
+            errors = []
+            for name in self.names:
+                try:
+                    self.module = importlib.import_module(name)
+                    break
+                except ImportError as error:
+                    errors.append(error)
+            else:
+                # The preferred candidate is chained, the messages of all of them are listed
+                reasons = "; ".join(f"{name}: {error}" for name, error in zip(self.names, errors))
+                raise ImportError(f"None of the modules {self.names} can be imported ({reasons}).") \
+                    from (errors[0] if errors else None)
+        return self.module
+
+    def __getattr__(self, name: str) -> Any:
+        # Special attributes are looked up by copy and pickle, which must not trigger the import
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+
+# Compiled backends, the Fortran extension is looked up in the package first, then as an installed module and
+# finally in the build directory of a source checkout. The Numba backend is compiled on its first call.
+BACKENDS = {
+    Backend.FORTRAN: LazyModule(f"{__package__}.fortran_backend" if __package__ else "", "fortran_backend",
+                                "build.fortran_backend"),
+    Backend.NUMBA: LazyModule(f"{__package__}.numba_backend" if __package__ else "", "numba_backend"),
+}
+fortran = BACKENDS[Backend.FORTRAN]
+numba_backend = BACKENDS[Backend.NUMBA]
+linalg = LazyModule("scipy.linalg")
+sparse = LazyModule("scipy.sparse")
+
+
+def lazy_njit(**options: Any) -> Callable[[Callable], Callable]:
+    """
+    Compile a function with numba on its first call instead of at import.
+
+    Args:
+        options: Options of numba.njit.
+
+    Returns:
+        Decorator replacing the function with one that compiles and calls it.
+    """
+    def decorator(function: Callable) -> Callable:
+        compiled = None
+
+        @functools.wraps(function)
+        def wrapper(*args: Any) -> Any:
+            nonlocal compiled
+            if compiled is None:
+                compiled = importlib.import_module("numba").njit(**options)(function)
+            return compiled(*args)
+
+        return wrapper
+
+    return decorator
+
+
+class Workspace:
+    """
+    Scratch memory of the Fortran backend. The forward and backward pass carve their data matrices, normal equations
+    and root buffers from it instead of allocating them in every iteration. Pass the same workspace to models that are
+    fitted repeatedly on data of the same size to reuse the memory across fits.
+    """
+
+    def __init__(self, n_samples: int, max_nbases: int, nresponses: int = 1):
+        """
+        Allocate the workspace. One column is shared, every OpenMP thread owns one further column.
+
+        Args:
+            n_samples: Number of samples of the fits.
+            max_nbases: Maximum number of basis functions of the fits.
+            nresponses: Number of response variables of the fits.
+        """
+        nrows, ncols = fortran.backend.workspace_shape(n_samples, max_nbases, nresponses)
+        self.buffer = np.empty((nrows, ncols), dtype=float, order="F")
+
+    def fits(self, n_samples: int, max_nbases: int, nresponses: int = 1) -> bool:
+        """
+        Check if the workspace is large enough for a fit. Only the rows depend on the fit, the columns cap the number of
+        threads of the forward pass at one per column besides the shared one, so a workspace allocated under a lower
+        thread limit still fits.
+
+        Args:
+            n_samples: Number of samples of the fit.
+            max_nbases: Maximum number of basis functions of the fit.
+            nresponses: Number of response variables of the fit.
+
+        Returns:
+            True if the workspace can be used for the fit, False otherwise.
+        """
+        nrows, _ = fortran.backend.workspace_shape(n_samples, max_nbases, nresponses)
+        return self.buffer.shape[0] >= nrows and self.buffer.shape[1] >= 2
+
+
+class BasisCache:
+    """
+    Uncentred columns of the basis functions evaluated on one dataset, keyed by the chain of hinge functions that
+    defines them. A basis is the product of its parent and one further hinge, so a column is derived from the cached
+    column of its parent in O(N) instead of multiplying all of its hinges again. Once the memory cap is reached, the
+    least recently used columns are evicted. Pass the same cache to models that are fitted and evaluated on the same
+    data to share the columns across the forward pass, the backward pass and the prediction.
+
+    The cache holds no reference to the data. It recognises the data by the address, shape, strides and type of the
+    array and by a checksum of a sample of its rows, and drops its columns once they differ. Changes in place that
+    leave the sampled rows untouched are not detected, call clear after them.
+    """
+
+    def __init__(self, max_bytes: int = BASIS_CACHE_SIZE):
+        """
+        Create an empty cache.
+
+        Args:
+            max_bytes: Memory cap of the cached columns in bytes.
+        """
+        assert max_bytes >= 0, "Parameter \"max_bytes\" should be non-negative."
+
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.columns = OrderedDict()
+        self.dataset = None
+
+    def clear(self) -> None:
+        """
+        Drop all columns, e.g. after the predictor variables were changed in place.
+        """
+        self.columns.clear()
+        self.nbytes = 0
+        self.dataset = None
+
+    def bind(self, x: Float[np.ndarray, "N d"]) -> None:
+        """
+        Bind the cache to a dataset. The columns are dropped unless they were evaluated on the same array with the
+        same values in the sampled rows.
+
+        Args:
+            x: Predictor variables.
+        """
+        step = max(1, len(x) // BASIS_CACHE_CHECK_ROWS)
+        dataset = (*self._layout(x), hash(np.ascontiguousarray(x[::step]).tobytes()))
+        if dataset != self.dataset:
+            self.clear()
+            self.dataset = dataset
+
+    @staticmethod
+    def _layout(x: Float[np.ndarray, "N d"]) -> tuple:
+        """
+        Identify the memory of an array without holding a reference to it.
+
+        Args:
+            x: Predictor variables.
+
+        Returns:
+            Address, shape, strides and type of the array.
+        """
+        return x.__array_interface__["data"][0], x.shape, x.strides, x.dtype.str
+
+    def column(self,
+               x: Float[np.ndarray, "N d"],
+               key: tuple[tuple[int, float, bool], ...],
+               store: bool = True) -> Float[np.ndarray, "N"]:
+        """
+        Get the uncentred column of a basis function. Only the layout of x is compared with the bound dataset, a
+        different array binds the cache to it. Values are checked by bind, once per evaluation of the model.
+
+        Args:
+            x: Predictor variables.
+            key: Covariate, root and truncation of every hinge of the basis function, in the order of the parent chain.
+            store: Whether to keep the column. The parents are always kept.
+
+        Returns:
+            Read-only values of the basis function.
+        """
+        if self.dataset is None or self._layout(x) != self.dataset[:-1]:
+            self.bind(x)
+
+        if key in self.columns:
+            self.columns.move_to_end(key)
+            return self.columns[key]
+
+        cov, root, truncated = key[-1]
+        values = x[:, cov] - x.dtype.type(root)
+        if truncated:
+            np.maximum(0, values, out=values)
+        if len(key) > 1:
+            values *= self.column(x, key[:-1])
+        values.flags.writeable = False
+
+        if store and values.nbytes <= self.max_bytes:
+            while self.nbytes + values.nbytes > self.max_bytes:
+                self.nbytes -= self.columns.popitem(last=False)[1].nbytes
+            self.columns[key] = values
+            self.nbytes += values.nbytes
+
+        return values
 
 
 class OMAR:
@@ -39,6 +280,13 @@ class OMAR:
                  max_ncandidates: int = 11,
                  aging_factor: float = 0.,
                  penalty: float = 3,
+                 minspan: int = 1,
+                 endspan: int = 0,
+                 max_nknots: int | None = None,
+                 workspace: Workspace | None = None,
+                 basis_cache: BasisCache | None = None,
+                 dtype: type[np.floating] = np.float64,
+                 copy_warning: bool = False,
                  backend: Backend = Backend.FORTRAN):
         """
         Initialize the OMAR model.
@@ -47,42 +295,90 @@ class OMAR:
             max_ncandidates: Maximum queue length for parent candidates. (See Fast Mars paper)
             aging_factor: Determines how fast unused parent basis functions need recalculation. (See Fast Mars paper)
             penalty: Cost for each basis function optimization, parameter of the generalized cross validation.
+            minspan: Number of sorted observations between two candidate roots. (See Mars paper) The default
+            considers every observation.
+            endspan: Number of observations at both ends of the sorted support that are not considered as roots.
+            (See Mars paper)
+            max_nknots: Maximum number of candidate roots per parent and covariate. If more are eligible, a quantile
+            grid is used. None considers all eligible roots.
+            workspace: Scratch memory of the Fortran backend, which is reused across fits. None allocates it for
+            every fit.
+            basis_cache: Columns of the basis functions of the Python backend, which are shared with every fit and
+            prediction on the same data. None uses a temporary cache for every fit.
+            dtype: Precision of the predictor variables and the data matrix, either np.float64 or np.float32.
+            The normal equations and their Cholesky decomposition are always built in double precision. Only the
+            Python backend implements single precision, the Fortran and Numba backends raise a ValueError.
+            copy_warning: Warn whenever the Fortran backend copies predictor variables that are not
+            Fortran-contiguous double precision. The copy itself is silent by default.
             backend: Backend for the model. "Fortran" should be chosen most of the time since it's way faster.
+            "Numba" comes close without a compiler toolchain, it is compiled on the first fit and cached on disk.
 
         Other attributes:
             nbases: Number of basis functions.
-            mask: Flags active cells in the arrays describing the basis functions. Columns are multiplicative, while
-            the rows are additive.
-            truncated: Flags which basis function planes are truncated. Columns are multiplicative, while
-            the rows are additive.
-            cov: Determines the dimension this basis function is acting on. Columns are multiplicative, while
-            the rows are additive.
-            root: Determines the root of the basis function. Columns are multiplicative, while
-            the rows are additive.
-            coefficients: Coefficients for the superposition of bases.
+            mask: Flags the active basis functions.
+            parent: Index of the basis function every basis function is multiplied onto, the first (constant) basis
+            function ends every parent chain. A basis function is its parent times its own hinge, so the model is
+            stored as a tree in arrays of length max_nbases.
+            truncated: Flags whether the hinge of a basis function is truncated.
+            cov: Determines the dimension the hinge of a basis function is acting on.
+            root: Determines the root of the hinge of a basis function.
+            coefficients: Coefficients for the superposition of bases, one column per response variable of several.
+            data_matrix_mean: Means of the active basis functions on the training data, set by find_bases.
+            mean_keys: Keys of the active basis functions the training means belong to, None without means.
             y_mean: Mean of the response variables, which makes it also the coefficient for the first (constant) basis.
+            One per response variable of several.
+            n_samples: Number of samples the model is fitted on.
+            covariance_matrix: Covariance matrix of the active basis functions on the training data.
+            rhs: Right hand side of the normal equations on the training data.
+            y_centred_sq: Squared norm of the centred response variables of the training data.
+            search_lof: Lack of fit criterion of the last basis search, partial_fit searches again once the lack of
+            fit criterion drifts away from it.
         """
         assert max_nbases % 2 == 1, "Parameter \"max_nbases\" should be odd."
         assert max_ncandidates <= max_nbases, ("""Maximum queue length for parent candidates should be less than the
                                                maximum number of basis functions.""")
+        assert minspan >= 1, "Parameter \"minspan\" should be positive."
+        assert endspan >= 0, "Parameter \"endspan\" should be non-negative."
+        assert max_nknots is None or max_nknots >= 1, "Parameter \"max_nknots\" should be positive."
+        assert dtype in (np.float64, np.float32), "Parameter \"dtype\" should be np.float64 or np.float32."
+        if dtype is not np.float64 and backend is not Backend.PYTHON:
+            raise ValueError(f"Single precision is only implemented by the Python backend, not by {backend}.")
 
         self.max_nbases = max_nbases
         self.max_ncandidates = max_ncandidates
         self.aging_factor = aging_factor
         self.penalty = penalty
+        self.minspan = minspan
+        self.endspan = endspan
+        self.max_nknots = max_nknots
+        self.workspace = workspace
+        self.basis_cache = basis_cache
+        self.dtype = dtype
+        self.copy_warning = copy_warning
         self.backend = backend
 
         self.nbases = 1
-        self.mask = np.zeros((self.max_nbases, self.max_nbases), dtype=bool)
-        self.truncated = np.zeros((self.max_nbases, self.max_nbases), dtype=bool)
-        self.cov = np.zeros((self.max_nbases, self.max_nbases), dtype=int)
-        self.root = np.zeros((self.max_nbases, self.max_nbases), dtype=float)
+        self.mask = np.zeros(self.max_nbases, dtype=bool)
+        self.parent = np.zeros(self.max_nbases, dtype=int)
+        self.truncated = np.zeros(self.max_nbases, dtype=bool)
+        self.cov = np.zeros(self.max_nbases, dtype=int)
+        self.root = np.zeros(self.max_nbases, dtype=float)
         self.coefficients = np.empty(0, dtype=float)
+        self.data_matrix_mean = np.empty(0, dtype=float)
+        self.mean_keys = None
         self.y_mean = float()
+        self.n_samples = 0
+        self.covariance_matrix = np.empty((0, 0), dtype=float)
+        self.rhs = np.empty(0, dtype=float)
+        self.y_centred_sq = float()
+        self.search_lof = np.inf
 
-    def __call__(self, x: Float[np.ndarray, "N d"]) -> Float[np.ndarray, "N"]:
+    def __call__(self, x: Float[np.ndarray, "N d"]) -> Float[np.ndarray, "N *k"]:
         """
-        Predict the response variables for the given predictor variables.
+        Predict the response variables for the given predictor variables. The basis functions are centred with their
+        means on the training data, so the prediction doesn't depend on the other rows and equals the one of the
+        frozen model. Models without the means of their current basis functions, e.g. assembled or edited by hand,
+        leave the basis functions uncentred.
 
         Args:
             x: Predictor Variables.
@@ -90,11 +386,15 @@ class OMAR:
         Returns:
             Predicted response variables.
         """
-        pred = self.y_mean * np.ones(x.shape[0])
-        if self._active_base_indices().any():
-            data_matrix, _ = self._data_matrix(x, self._active_base_indices())
-            centered_y_pred = data_matrix @ self.coefficients
-            pred += centered_y_pred
+        x = self._predictors(x)
+        pred = np.full((x.shape[0],) + np.shape(self.y_mean), self.y_mean)
+        active = self._active_base_indices()
+        if active.any():
+            data_matrix, data_matrix_mean = self._data_matrix(x, active)
+            # The data matrix is centred with the means of the batch, the difference to the training means is a
+            # constant shift
+            training_mean = self.data_matrix_mean if self.mean_keys == self._active_basis_keys() else 0
+            pred += data_matrix @ self.coefficients + (data_matrix_mean - training_mean) @ self.coefficients
         return pred
 
     def __str__(self) -> str:
@@ -107,16 +407,15 @@ class OMAR:
         desc = "OMAR (Open Multivariate Adaptive Splines Regression) Model\n"
         desc += "Basis functions: \n"
         desc += f"{self.y_mean} * 1 + \n"
-        for basis_idx in self._active_base_indices():
-            for func_idx in range(self.max_nbases):
-                if self.mask[func_idx, basis_idx]:
-                    truncated = self.truncated[func_idx, basis_idx]
-                    cov = self.cov[func_idx, basis_idx]
-                    root = self.root[func_idx, basis_idx]
-
-                    desc += f"{self.coefficients[basis_idx]:.2f} * (x[{cov}] - {root}){u'\u208A' if truncated else ''}"
-            if np.any(self.mask[:, basis_idx]):
-                desc += " + \n"
+        for i, basis_idx in enumerate(self._active_base_indices()):
+            coefficient = self.coefficients[i]
+            if np.ndim(coefficient) == 0:
+                coefficient = f"{coefficient:.2f}"
+            else:
+                coefficient = np.array2string(coefficient, precision=2)
+            for cov, root, truncated in self._basis_key(basis_idx):
+                desc += f"{coefficient} * (x[{cov}] - {root}){u'\u208A' if truncated else ''}"
+            desc += " + \n"
         return desc[:-4]
 
     def __len__(self) -> int:
@@ -140,14 +439,19 @@ class OMAR:
         """
         sub_model = OMAR()
         sub_model.nbases = 1
-        sub_model.mask[:, i:i + 1] = self.mask[:, i:i + 1]
-        sub_model.truncated[:, i:i + 1] = self.truncated[:, i:i + 1]
-        sub_model.cov[:, i:i + 1] = self.cov[:, i:i + 1]
-        sub_model.root[:, i:i + 1] = self.root[:, i:i + 1]
+        # The parent chain of the basis function is kept, only the basis function itself is active
+        sub_model.mask = np.zeros_like(self.mask)
+        sub_model.mask[i] = i != 0
+        sub_model.parent = self.parent.copy()
+        sub_model.truncated = self.truncated.copy()
+        sub_model.cov = self.cov.copy()
+        sub_model.root = self.root.copy()
 
         if i != 0:
             sub_model.coefficients = self.coefficients[i:i + 1]
+            sub_model.data_matrix_mean = self.data_matrix_mean[i:i + 1]
             sub_model.nbases = 2
+            sub_model.mean_keys = sub_model._active_basis_keys()
 
         sub_model.y_mean = self.y_mean
         return sub_model
@@ -162,14 +466,45 @@ class OMAR:
         Returns:
             True if the models are equal, False otherwise.
         """
-        self_idx = [slice(None), slice(self.nbases)]
-        other_idx = [slice(None), slice(other.nbases)]
-
         return self.nbases == other.nbases and \
-            np.array_equal(self.mask[*self_idx], other.mask[*other_idx]) and \
-            np.array_equal(self.truncated[*self_idx], other.truncated[*other_idx]) and \
-            np.array_equal(self.cov[*self_idx], other.cov[*other_idx]) and \
-            np.array_equal(self.root[*self_idx], other.root[*other_idx])
+            np.array_equal(self.mask[:self.nbases], other.mask[:other.nbases]) and \
+            np.array_equal(self.parent[:self.nbases], other.parent[:other.nbases]) and \
+            np.array_equal(self.truncated[:self.nbases], other.truncated[:other.nbases]) and \
+            np.array_equal(self.cov[:self.nbases], other.cov[:other.nbases]) and \
+            np.array_equal(self.root[:self.nbases], other.root[:other.nbases])
+
+    def _predictors(self, x: Float[np.ndarray, "N d"]) -> Float[np.ndarray, "N d"]:
+        """
+        Bring the predictor variables into the layout of the backend once, so no routine copies them implicitly.
+        The Python backend computes in the precision of the model. f2py copies every array that is not
+        Fortran-contiguous double precision in every call, so such predictor variables are converted, and a warning
+        reports the copy if the model asks for it. Numba compiles a specialisation for every layout, so only the precision is converted.
+        Arrays in the right layout are passed through.
+
+        Args:
+            x: Predictor variables.
+
+        Returns:
+            Predictor variables in the layout of the backend.
+        """
+        if self.dtype is not np.float64 and self.backend is not Backend.PYTHON:
+            raise ValueError(f"Single precision is only implemented by the Python backend, not by {self.backend}.")
+
+        if self.backend is Backend.PYTHON:
+            x = x.astype(self.dtype, copy=False)
+        elif self.backend is Backend.FORTRAN:
+            if x.dtype != np.float64 or not x.flags.f_contiguous:
+                if self.copy_warning:
+                    warnings.warn(f"Copying predictor variables of type {x.dtype} and shape {x.shape} into a "
+                                  "Fortran-contiguous float64 array, pass np.asfortranarray(x, dtype=np.float64) to "
+                                  "avoid it.", stacklevel=3)
+                x = np.asfortranarray(x, dtype=np.float64)
+        elif self.backend is Backend.NUMBA:
+            x = x.astype(np.float64, copy=False)
+        else:
+            raise NotImplementedError("Backend not implemented.")
+
+        return x
 
     def _active_base_indices(self) -> Integer[np.ndarray, "{self.nbases}-1"]:
         """
@@ -179,15 +514,47 @@ class OMAR:
             Indices of the active basis functions.
         """
         if self.backend is Backend.PYTHON:
-            return np.where(np.any(self.mask, axis=0))[0]
+            return np.flatnonzero(self.mask)
         elif self.backend is Backend.FORTRAN:
             # Fortran indexes from 1
             return fortran.backend.active_base_indices(self.mask, self.nbases) - 1
+        elif self.backend is Backend.NUMBA:
+            return numba_backend.active_base_indices(self.mask)
+        else:
+            raise NotImplementedError("Backend not implemented.")
+
+    def _basis_key(self, basis_idx: int) -> tuple[tuple[int, float, bool], ...]:
+        """
+        Identify a basis function by the hinges of its parent chain, starting at the first hinge.
+
+        Args:
+            basis_idx: Index of the basis function.
+
+        Returns:
+            Covariate, root and truncation of every hinge of the basis function.
+        """
+        key = []
+        while basis_idx != 0:
+            key.append((int(self.cov[basis_idx]), float(self.root[basis_idx]), bool(self.truncated[basis_idx])))
+            basis_idx = self.parent[basis_idx]
+        return tuple(reversed(key))
+
+    def _active_basis_keys(self) -> tuple[tuple[tuple[int, float, bool], ...], ...]:
+        """
+        Identify the active basis functions, e.g. to check that the training means belong to them.
+
+        Returns:
+            Key of every active basis function.
+        """
+        return tuple(self._basis_key(basis_idx) for basis_idx in self._active_base_indices())
 
-    def _data_matrix(self, x: Float[np.ndarray, "N d"], basis_indices: Integer[np.ndarray, "{self.nbases}-1"]) \
+    def _data_matrix(self,
+                     x: Float[np.ndarray, "N d"],
+                     basis_indices: Integer[np.ndarray, "k"],
+                     cache_columns: bool = True) \
             -> tuple[
-                Float[np.ndarray, "N {self.nbases}-1"],
-                Float[np.ndarray, "{self.nbases}-1"]
+                Float[np.ndarray, "N k"],
+                Float[np.ndarray, "k"]
             ]:
         """
         Evaluate the selected part of the model on the predictor variables x.
@@ -195,22 +562,37 @@ class OMAR:
         Args:
             x: Predictor variables points.
             basis_indices: Indices of the basis functions to be evaluated.
+            cache_columns: Whether to keep the columns in the basis cache. Candidates of the forward pass are
+            evaluated once and shouldn't evict the bases of the model.
 
         Returns:
             Centered data matrix, mean of the data matrix.
         """
+        x = self._predictors(x)
         if self.backend is Backend.PYTHON:
-            bases = x[:, self.cov[:, basis_indices]] - self.root[:, basis_indices]
-            np.maximum(0, bases, where=self.truncated[:, basis_indices], out=bases)
-
-            data_matrix = bases.prod(axis=1, where=self.mask[:, basis_indices])
-
-            data_matrix_mean = data_matrix.mean(axis=0)
+            if self.basis_cache is not None:
+                self.basis_cache.bind(x)
+                data_matrix = np.empty((len(x), len(basis_indices)), dtype=x.dtype)
+                for i, basis_idx in enumerate(basis_indices):
+                    data_matrix[:, i] = self.basis_cache.column(x, self._basis_key(basis_idx), cache_columns)
+            else:
+                data_matrix = np.ones((len(x), len(basis_indices)), dtype=x.dtype)
+                for i, basis_idx in enumerate(basis_indices):
+                    for cov, root, truncated in self._basis_key(basis_idx):
+                        hinge = x[:, cov] - x.dtype.type(root)
+                        if truncated:
+                            np.maximum(0, hinge, out=hinge)
+                        data_matrix[:, i] *= hinge
+
+            data_matrix_mean = data_matrix.mean(axis=0, dtype=float)
             data_matrix -= data_matrix_mean
         elif self.backend is Backend.FORTRAN:
             # Fortran indexes from 1
-            data_matrix, data_matrix_mean = fortran.backend.data_matrix(x, basis_indices + 1, self.mask,
+            data_matrix, data_matrix_mean = fortran.backend.data_matrix(x, basis_indices + 1, self.parent + 1,
                                                                         self.truncated, self.cov + 1, self.root)
+        elif self.backend is Backend.NUMBA:
+            data_matrix, data_matrix_mean = numba_backend.data_matrix(x, basis_indices, self.parent, self.truncated,
+                                                                      self.cov, self.root)
         else:
             raise NotImplementedError("Backend not implemented.")
 
@@ -234,17 +616,19 @@ class OMAR:
             a unique solution again.
         """
         if self.backend is Backend.PYTHON:
-            covariance_matrix = data_matrix.T @ data_matrix
+            covariance_matrix = double_precision_product(data_matrix, data_matrix)
             covariance_matrix += np.eye(covariance_matrix.shape[0]) * 1e-8
         elif self.backend is Backend.FORTRAN:
             covariance_matrix = fortran.backend.covariance_matrix(data_matrix)
+        elif self.backend is Backend.NUMBA:
+            covariance_matrix = numba_backend.covariance_matrix(data_matrix)
         else:
             raise NotImplementedError("Backend not implemented.")
 
         return covariance_matrix
 
-    def _rhs(self, y: Float[np.ndarray, "N"], data_matrix: Float[np.ndarray, "N {self.nbases}-1"]) \
-            -> Float[np.ndarray, "N"]:
+    def _rhs(self, y: Float[np.ndarray, "N *k"], data_matrix: Float[np.ndarray, "N {self.nbases}-1"]) \
+            -> Float[np.ndarray, "{self.nbases}-1 *k"]:
         """
         Calculate the right hand side of the normal equations.
 
@@ -256,9 +640,11 @@ class OMAR:
             Right hand side of the normal equations.
         """
         if self.backend is Backend.PYTHON:
-            rhs = data_matrix.T @ (y - self.y_mean)
+            rhs = double_precision_product(data_matrix, y - self.y_mean)
         elif self.backend is Backend.FORTRAN:
-            rhs = fortran.backend.rhs(y, self.y_mean, data_matrix)
+            rhs = like_response(fortran.backend.rhs(as_columns(y), np.atleast_1d(self.y_mean), data_matrix), y)
+        elif self.backend is Backend.NUMBA:
+            rhs = like_response(numba_backend.rhs(as_columns(y), np.atleast_1d(self.y_mean), data_matrix), y)
         else:
             raise NotImplementedError("Backend not implemented.")
 
@@ -266,9 +652,9 @@ class OMAR:
 
     def _coefficients(self,
                       covariance_matrix: Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
-                      rhs: Float[np.ndarray, "{self.nbases}-1"]) \
+                      rhs: Float[np.ndarray, "{self.nbases}-1 *k"]) \
             -> tuple[
-                Float[np.ndarray, "{self.nbases}-1"],
+                Float[np.ndarray, "{self.nbases}-1 *k"],
                 Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"]
             ]:
         """
@@ -282,17 +668,21 @@ class OMAR:
             Coefficients of the model, Cholesky decomposition of the covariance matrix.
         """
         if self.backend is Backend.PYTHON:
-            chol, lower = cho_factor(covariance_matrix, lower=True)
-            self.coefficients = cho_solve((chol, lower), rhs)
+            chol, lower = linalg.cho_factor(covariance_matrix, lower=True)
+            self.coefficients = linalg.cho_solve((chol, lower), rhs)
         elif self.backend is Backend.FORTRAN:
-            self.coefficients, chol = fortran.backend.coefficients(covariance_matrix, rhs)
+            coefficients, chol = fortran.backend.coefficients(covariance_matrix, as_columns(rhs))
+            self.coefficients = like_response(coefficients, rhs)
+        elif self.backend is Backend.NUMBA:
+            coefficients, chol = numba_backend.coefficients(covariance_matrix, as_columns(rhs))
+            self.coefficients = like_response(coefficients, rhs)
         else:
             raise NotImplementedError("Backend not implemented.")
 
-        return self.coefficients, np.tril(chol)
+        return self.coefficients, lower_triangle(chol)
 
     def _generalised_cross_validation(self,
-                                      y: Float[np.ndarray, "N"],
+                                      y: Float[np.ndarray, "N *k"],
                                       data_matrix: Float[np.ndarray, "N {self.nbases}-1"],
                                       chol: Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"]) -> float:
         """
@@ -309,36 +699,93 @@ class OMAR:
         """
         if self.backend is Backend.PYTHON:
             if data_matrix.size != 0:
-                y_pred = data_matrix @ self.coefficients + self.y_mean
-                c_m = np.sum(np.abs(np.diag(chol)) != 0) * (1 + self.penalty) + 1 - self.penalty
+                y_pred = data_matrix @ self.coefficients.astype(data_matrix.dtype) + self.y_mean
+                rank = np.sum(np.abs(np.diag(chol)) != 0)
             else:
                 y_pred = self.y_mean
-                c_m = 1 - self.penalty
-            mse = np.sum((y - y_pred) ** 2) / len(y)
+                rank = 0
+            lof = self._lack_of_fit(np.sum((y - y_pred) ** 2), rank, len(y))
 
-            if c_m != len(y):
-                lof = mse / (1 - c_m / len(y)) ** 2
-            else:
-                print("Infinite lack of fit criterion, as the rank of the covariance matrix is equal to the number of \
-                       response variables.")
-                lof = np.inf
+        elif self.backend is Backend.FORTRAN:
+            lof = fortran.backend.generalised_cross_validation(as_columns(y), np.atleast_1d(self.y_mean), data_matrix,
+                                                               chol, as_columns(self.coefficients), self.penalty)
+        elif self.backend is Backend.NUMBA:
+            lof = numba_backend.generalised_cross_validation(as_columns(y), np.atleast_1d(self.y_mean), data_matrix,
+                                                             chol, as_columns(self.coefficients), self.penalty)
+        else:
+            raise NotImplementedError("Backend not implemented.")
+
+        return lof
+
+    def _fast_generalised_cross_validation(self,
+                                           y_centred_sq: float,
+                                           n_samples: int,
+                                           rhs: Float[np.ndarray, "{self.nbases}-1 *k"],
+                                           chol: Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"]) -> float:
+        """
+        Calculate the generalised cross validation criterion without touching the data matrix. Since the
+        coefficients solve the normal equations, the residual sum of squares reduces to
+        ||y - y_mean||^2 - coefficients^T rhs (minus the contribution of the diagonal regularisation),
+        which costs O(m) instead of O(N*m).
+
+        Args:
+            y_centred_sq: Squared norm of the centred response variables.
+            n_samples: Number of samples.
+            rhs: Right hand side of the normal equations.
+            chol: Cholesky decomposition of the covariance matrix.
 
+        Returns:
+            Lack of fit criterion.
+        """
+        if self.backend is Backend.PYTHON:
+            # Summed over the response variables
+            rss = y_centred_sq - np.sum(self.coefficients * rhs) - 1e-8 * np.sum(self.coefficients ** 2)
+            rank = np.sum(np.abs(np.diag(chol)) != 0)
+            lof = self._lack_of_fit(max(rss, 0.), rank, n_samples)
         elif self.backend is Backend.FORTRAN:
-            lof = fortran.backend.generalised_cross_validation(y, self.y_mean, data_matrix, chol, self.coefficients,
-                                                               self.penalty)
+            lof = fortran.backend.fast_generalised_cross_validation(y_centred_sq, n_samples, as_columns(rhs), chol,
+                                                                    as_columns(self.coefficients), self.penalty)
+        elif self.backend is Backend.NUMBA:
+            lof = numba_backend.fast_generalised_cross_validation(y_centred_sq, n_samples, as_columns(rhs), chol,
+                                                                  as_columns(self.coefficients), self.penalty)
         else:
             raise NotImplementedError("Backend not implemented.")
 
         return lof
 
-    def _fit(self, x: Float[np.ndarray, "N d"], y: Float[np.ndarray, "N"]) \
+    def _lack_of_fit(self, rss: float | Float[np.ndarray, "k"], rank: int, n_samples: int) \
+            -> float | Float[np.ndarray, "k"]:
+        """
+        Calculate the generalised cross validation criterion from the residual sum of squares.
+
+        Args:
+            rss: Residual sum of squares, or one per candidate of the same rank.
+            rank: Rank of the covariance matrix.
+            n_samples: Number of samples.
+
+        Returns:
+            Lack of fit criterion, in the shape of rss.
+        """
+        c_m = rank * (1 + self.penalty) + 1 - self.penalty
+        mse = rss / n_samples
+
+        if c_m != n_samples:
+            lof = mse / (1 - c_m / n_samples) ** 2
+        else:
+            print("Infinite lack of fit criterion, as the rank of the covariance matrix is equal to the number of \
+                   response variables.")
+            lof = np.inf if np.ndim(rss) == 0 else np.full(len(rss), np.inf)
+
+        return lof
+
+    def _fit(self, x: Float[np.ndarray, "N d"], y: Float[np.ndarray, "N *k"]) \
             -> tuple[
                 Float[np.ndarray, "N {self.nbases}-1"],
                 Float[np.ndarray, "{self.nbases}-1"],
                 Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
-                Float[np.ndarray, "{self.nbases}-1"],
+                Float[np.ndarray, "{self.nbases}-1 *k"],
                 Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
-                Float[np.ndarray, "{self.nbases}-1"],
+                Float[np.ndarray, "{self.nbases}-1 *k"],
                 float
             ]:
         """
@@ -352,6 +799,7 @@ class OMAR:
             Centered data matrix, mean of the data matrix, covariance matrix, right hand side of the normal equations,
             Cholesky decomposition of the covariance matrix, coefficients of the model, lack of fit criterion
         """
+        x = self._predictors(x)
         if self.backend is Backend.PYTHON:
             data_matrix, data_matrix_mean = self._data_matrix(x, self._active_base_indices())
             covariance_matrix = self._covariance_matrix(data_matrix)
@@ -360,10 +808,90 @@ class OMAR:
             lof = self._generalised_cross_validation(y, data_matrix, chol)
         elif self.backend is Backend.FORTRAN:
             # Fortran indexes from 1
-            data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, self.coefficients, lof = \
-                fortran.backend.fit(x, y, self.y_mean, self.nbases, self.mask, self.truncated, self.cov + 1,
-                                    self.root, self.penalty)
-            chol = np.tril(chol)
+            data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, coefficients, lof = \
+                fortran.backend.fit(x, as_columns(y), np.atleast_1d(self.y_mean), self.nbases, self.mask,
+                                    self.parent + 1, self.truncated, self.cov + 1, self.root, self.penalty)
+            rhs, self.coefficients = like_response(rhs, y), like_response(coefficients, y)
+            chol = lower_triangle(chol)
+        elif self.backend is Backend.NUMBA:
+            data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, coefficients, lof = \
+                numba_backend.fit(x, as_columns(y), np.atleast_1d(self.y_mean), self.mask, self.parent,
+                                  self.truncated, self.cov, self.root, self.penalty)
+            rhs, self.coefficients = like_response(rhs, y), like_response(coefficients, y)
+        else:
+            raise NotImplementedError("Backend not implemented.")
+
+        return data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, self.coefficients, lof
+
+    def _append_fit(self,
+                    data_matrix: Float[np.ndarray, "N {self.nbases}-3"],
+                    data_matrix_mean: Float[np.ndarray, "{self.nbases}-3"],
+                    covariance_matrix: Float[np.ndarray, "{self.nbases}-3 {self.nbases}-3"],
+                    rhs: Float[np.ndarray, "{self.nbases}-3 *k"],
+                    chol: Float[np.ndarray, "{self.nbases}-3 {self.nbases}-3"],
+                    x: Float[np.ndarray, "N d"],
+                    y: Float[np.ndarray, "N *k"],
+                    y_centred_sq: float) \
+            -> tuple[
+                Float[np.ndarray, "N {self.nbases}-1"],
+                Float[np.ndarray, "{self.nbases}-1"],
+                Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
+                Float[np.ndarray, "{self.nbases}-1 *k"],
+                Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
+                Float[np.ndarray, "{self.nbases}-1 *k"],
+                float
+            ]:
+        """
+        Fit the model after adding the last two basis functions, reusing the fit of the model without them.
+        Only the new columns are evaluated, and the Cholesky decomposition is extended by a bordered update, which
+        costs O(N*m + m^2) instead of O(N*m^2 + m^3).
+
+        Args:
+            data_matrix: Centered data matrix of the model without the last two basis functions.
+            data_matrix_mean: Mean of the data matrix.
+            covariance_matrix: Covariance matrix.
+            rhs: Right hand side of the normal equations.
+            chol: Cholesky decomposition of the covariance matrix.
+            x: Predictor Variables.
+            y: Response Variables.
+            y_centred_sq: Squared norm of the centred response variables.
+
+        Returns:
+            Data matrix, mean of the data matrix, covariance matrix, right hand side, Cholesky decomposition,
+            coefficients and lack of fit criterion of the extended model.
+        """
+        x = self._predictors(x)
+        if self.backend is Backend.PYTHON:
+            new_matrix, new_mean = self._data_matrix(x, np.arange(self.nbases - 2, self.nbases), cache_columns=False)
+            cross = double_precision_product(data_matrix, new_matrix)
+            corner = double_precision_product(new_matrix, new_matrix) + np.eye(2) * 1e-8
+
+            # Border the Cholesky decomposition, only the 2 x 2 Schur complement is factorised
+            chol_cross = linalg.solve_triangular(chol, cross, lower=True)
+            chol_corner = linalg.cholesky(corner - chol_cross.T @ chol_cross, lower=True)
+
+            data_matrix = np.hstack([data_matrix, new_matrix])
+            data_matrix_mean = np.concatenate([data_matrix_mean, new_mean])
+            covariance_matrix = np.block([[covariance_matrix, cross], [cross.T, corner]])
+            rhs = np.concatenate([rhs, double_precision_product(new_matrix, y - self.y_mean)])
+            chol = np.block([[chol, np.zeros_like(cross)], [chol_cross.T, chol_corner]])
+
+            self.coefficients = linalg.cho_solve((chol, True), rhs)
+            lof = self._fast_generalised_cross_validation(y_centred_sq, len(y), rhs, chol)
+        elif self.backend is Backend.FORTRAN:
+            # Fortran indexes from 1
+            data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, coefficients, lof = \
+                fortran.backend.append_fit(data_matrix, data_matrix_mean, covariance_matrix, as_columns(rhs), chol, x,
+                                           as_columns(y), y_centred_sq, self.nbases, self.parent + 1, self.truncated,
+                                           self.cov + 1, self.root, self.penalty)
+            rhs, self.coefficients = like_response(rhs, y), like_response(coefficients, y)
+            chol = lower_triangle(chol)
+        elif self.backend is Backend.NUMBA:
+            data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, coefficients, lof = \
+                numba_backend.append_fit(data_matrix, data_matrix_mean, covariance_matrix, as_columns(rhs), chol, x,
+                                         as_columns(y), y_centred_sq, self.nbases, self.parent, self.truncated,
+                                         self.cov, self.root, self.penalty)
+            rhs, self.coefficients = like_response(rhs, y), like_response(coefficients, y)
         else:
             raise NotImplementedError("Backend not implemented.")
 
@@ -388,25 +916,27 @@ class OMAR:
         Returns:
             Update vector, mean of the update vector.
         """
+        x = self._predictors(x)
         if self.backend is Backend.PYTHON:
-            prod_idx = self.mask[:, self.nbases - 1].sum()
-            root = self.root[prod_idx, self.nbases - 1]
-            cov = self.cov[prod_idx, self.nbases - 1]
+            root = self.root[self.nbases - 1]
+            cov = self.cov[self.nbases - 1]
 
-            update = x[:, cov] - root
+            update = x[:, cov] - x.dtype.type(root)
             update[x[:, cov] >= prev_root] = prev_root - root
             update[x[:, cov] < root] = 0
 
             if parent_idx != 0:  # Not Constant basis function, otherwise 1 anyway
                 update *= data_matrix[:, parent_idx - 1] + data_matrix_mean[parent_idx - 1]
 
-            update_mean = update.mean()
+            update_mean = update.mean(dtype=float)
             update -= update_mean
         elif self.backend is Backend.FORTRAN:
             # Fortran indexes from 1
             update, update_mean = fortran.backend.update_init(x, data_matrix, data_matrix_mean, prev_root,
-                                                              parent_idx, self.nbases, self.mask, self.cov + 1,
-                                                              self.root)
+                                                              parent_idx, self.nbases, self.cov + 1, self.root)
+        elif self.backend is Backend.NUMBA:
+            update, update_mean = numba_backend.update_init(x, data_matrix, data_matrix_mean, prev_root, parent_idx,
+                                                            self.nbases, self.cov, self.root)
         else:
             raise NotImplementedError("Backend not implemented.")
         return update, update_mean
@@ -438,6 +968,9 @@ class OMAR:
         elif self.backend is Backend.FORTRAN:
             # Fortran updates in place
             fortran.backend.update_data_matrix(data_matrix, data_matrix_mean, update, update_mean)
+        elif self.backend is Backend.NUMBA:
+            # Numba updates in place
+            numba_backend.update_data_matrix(data_matrix, data_matrix_mean, update, update_mean)
         else:
             raise NotImplementedError("Backend not implemented.")
 
@@ -463,10 +996,9 @@ class OMAR:
             Updated covariance matrix, addition to the covariance matrix.
         """
         if self.backend is Backend.PYTHON:
-            covariance_addition = np.zeros_like(covariance_matrix[-1, :])
-            covariance_addition[:-1] = update @ data_matrix[:, :-1]
-            covariance_addition[-1] = 2 * data_matrix[:, -1] @ update
-            covariance_addition[-1] -= update @ update
+            # Taken against the stored column, so single precision rounding of the update does not accumulate
+            covariance_addition = double_precision_product(data_matrix, data_matrix[:, -1]) - covariance_matrix[:, -1]
+            covariance_addition[-1] += 1e-8
 
             covariance_matrix[-1, :-1] += covariance_addition[:-1]
             covariance_matrix[:, -1] += covariance_addition
@@ -474,16 +1006,19 @@ class OMAR:
             # Fortran updates in place
             covariance_addition = fortran.backend.update_covariance_matrix(covariance_matrix, data_matrix,
                                                                            update)
+        elif self.backend is Backend.NUMBA:
+            # Numba updates in place
+            covariance_addition = numba_backend.update_covariance_matrix(covariance_matrix, data_matrix, update)
         else:
             raise NotImplementedError("Backend not implemented.")
 
         return covariance_matrix, covariance_addition
 
     def _update_rhs(self,
-                    rhs: Float[np.ndarray, "{self.nbases}-1"],
+                    rhs: Float[np.ndarray, "{self.nbases}-1 *k"],
                     update: Float[np.ndarray, "N"],
-                    y: Float[np.ndarray, "N"]) \
-            -> Float[np.ndarray, "{self.nbases}-1"]:
+                    y: Float[np.ndarray, "N *k"]) \
+            -> Float[np.ndarray, "{self.nbases}-1 *k"]:
         """
         Update the right hand side to the latest root location.
 
@@ -496,18 +1031,23 @@ class OMAR:
             Updated right hand side.
         """
         if self.backend is Backend.PYTHON:
-            rhs[-1] += update.T @ (y - self.y_mean)
+            rhs[-1] += double_precision_product(update, y - self.y_mean)
         elif self.backend is Backend.FORTRAN:
             # Fortran updates in place
-            fortran.backend.update_rhs(rhs, update, y, self.y_mean)
+            fortran.backend.update_rhs(as_columns(rhs), update, as_columns(y), np.atleast_1d(self.y_mean))
+        elif self.backend is Backend.NUMBA:
+            # Numba updates in place
+            numba_backend.update_rhs(as_columns(rhs), update, as_columns(y), np.atleast_1d(self.y_mean))
+        else:
+            raise NotImplementedError("Backend not implemented.")
         return rhs
 
     def _update_coefficients(self,
                              chol: Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
                              covariance_addition: Float[np.ndarray, "{self.nbases}-1"],
-                             rhs: Float[np.ndarray, "{self.nbases}-1"]) \
+                             rhs: Float[np.ndarray, "{self.nbases}-1 *k"]) \
             -> tuple[
-                Float[np.ndarray, "{self.nbases}-1"],
+                Float[np.ndarray, "{self.nbases}-1 *k"],
                 Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"]
             ]:
         """
@@ -526,36 +1066,43 @@ class OMAR:
                 eigenvalues, eigenvectors = decompose_addition(covariance_addition)
                 for val, vec in zip(eigenvalues, eigenvectors):
                     chol = update_cholesky(chol, vec, val)
-            self.coefficients = cho_solve((chol, True), rhs)
+            self.coefficients = linalg.cho_solve((chol, True), rhs)
         elif self.backend is Backend.FORTRAN:
             # Fortran updates in place
-            fortran.backend.update_coefficients(self.coefficients, chol, covariance_addition, rhs)
+            fortran.backend.update_coefficients(as_columns(self.coefficients), chol, covariance_addition,
+                                                as_columns(rhs))
+        elif self.backend is Backend.NUMBA:
+            # Numba updates in place
+            numba_backend.update_coefficients(as_columns(self.coefficients), chol, covariance_addition,
+                                              as_columns(rhs))
         else:
             raise NotImplementedError("Backend not implemented.")
 
-        return self.coefficients, np.tril(chol)
+        return self.coefficients, lower_triangle(chol)
 
     def _update_fit(self,
                     data_matrix: Float[np.ndarray, "N {self.nbases}-1"],
                     data_matrix_mean: Float[np.ndarray, "{self.nbases}-1"],
                     covariance_matrix: Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
-                    rhs: Float[np.ndarray, "{self.nbases}-1"],
+                    rhs: Float[np.ndarray, "{self.nbases}-1 *k"],
                     chol: Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
                     x: Float[np.ndarray, "N d"],
-                    y: Float[np.ndarray, "N"],
+                    y: Float[np.ndarray, "N *k"],
                     prev_root: float,
-                    parent_idx: int) \
+                    parent_idx: int,
+                    y_centred_sq: float | None = None) \
             -> tuple[
                 Float[np.ndarray, "N {self.nbases}-1"],
                 Float[np.ndarray, "{self.nbases}-1"],
                 Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
-                Float[np.ndarray, "{self.nbases}-1"],
+                Float[np.ndarray, "{self.nbases}-1 *k"],
                 Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
-                Float[np.ndarray, "{self.nbases}-1"],
+                Float[np.ndarray, "{self.nbases}-1 *k"],
                 float
             ]:
         """
-        Update the model to the latest root location and determine the least-squares fit.
+        Update the model to the latest root location and determine the least-squares fit. The Fortran backend
+        updates the arrays in place, so they have to be Fortran-ordered like the ones _fit returns.
 
         Args:
             data_matrix: Centered data matrix.
@@ -567,11 +1114,17 @@ class OMAR:
             y: Response Variables.
             prev_root: Previous root of the basis function.
             parent_idx: Index of the parent basis function. (including constant basis)
+            y_centred_sq: Squared norm of the centred response variables. Computed if not given, pass it when
+            sweeping over many roots.
 
         Returns:
             Centered data matrix, mean of the data matrix, covariance matrix, right hand side of the normal equations,
             Cholesky decomposition of the covariance matrix, coefficients of the model, lack of fit criterion
         """
+        x = self._predictors(x)
+        if y_centred_sq is None:
+            y_centred_sq = np.sum((y - self.y_mean) ** 2)
+
         if self.backend is Backend.PYTHON:
             update, update_mean = self._update_init(x, data_matrix, data_matrix_mean, prev_root, parent_idx)
             data_matrix, data_matrix_mean = self._update_data_matrix(data_matrix, data_matrix_mean, update, update_mean)
@@ -580,118 +1133,490 @@ class OMAR:
             rhs = self._update_rhs(rhs, update, y)
             self.coefficients, chol = self._update_coefficients(chol, covariance_addition, rhs)
 
-            lof = self._generalised_cross_validation(y, data_matrix, chol)
+            lof = self._fast_generalised_cross_validation(y_centred_sq, len(y), rhs, chol)
         elif self.backend is Backend.FORTRAN:
-            # Fortran updates in place, and indexes from 1
-            data_matrix = np.asfortranarray(data_matrix)
-            data_matrix_mean = np.asfortranarray(data_matrix_mean)
-            covariance_matrix = np.asfortranarray(covariance_matrix)
-            rhs = np.asfortranarray(rhs)
-            chol = np.asfortranarray(chol)
-            self.coefficients = np.asfortranarray(self.coefficients)
-            lof = fortran.backend.update_fit(data_matrix, data_matrix_mean, covariance_matrix, rhs, chol,
-                                             self.coefficients, x, y, prev_root, parent_idx + 1, self.y_mean,
-                                             self.nbases, self.penalty, self.mask, self.cov + 1, self.root)
-            chol = np.tril(chol)
+            # Fortran updates in place, and indexes from 1. The arrays are Fortran-ordered already, f2py refuses
+            # to update anything else.
+            lof = fortran.backend.update_fit(data_matrix, data_matrix_mean, covariance_matrix, as_columns(rhs), chol,
+                                             as_columns(self.coefficients), x, as_columns(y), prev_root,
+                                             parent_idx + 1, np.atleast_1d(self.y_mean), y_centred_sq, self.nbases,
+                                             self.penalty, self.cov + 1, self.root)
+            chol = lower_triangle(chol)
+        elif self.backend is Backend.NUMBA:
+            # Numba updates in place
+            lof = numba_backend.update_fit(data_matrix, data_matrix_mean, covariance_matrix, as_columns(rhs), chol,
+                                           as_columns(self.coefficients), x, as_columns(y), prev_root, parent_idx,
+                                           np.atleast_1d(self.y_mean), y_centred_sq, self.nbases, self.penalty,
+                                           self.cov, self.root)
         else:
             raise NotImplementedError("Backend not implemented.")
 
         return data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, self.coefficients, lof
 
-    def _add_bases(self, parent: int, cov: int, root: float) -> None:
+    def _sweep_fit(self,
+                   data_matrix: Float[np.ndarray, "N {self.nbases}-1"],
+                   data_matrix_mean: Float[np.ndarray, "{self.nbases}-1"],
+                   covariance_matrix: Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
+                   rhs: Float[np.ndarray, "{self.nbases}-1 *k"],
+                   chol: Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
+                   sweep_sums: Float[np.ndarray, "3*{self.nbases}-1+2*k"],
+                   sweep_position: int,
+                   x: Float[np.ndarray, "N d"],
+                   y: Float[np.ndarray, "N *k"],
+                   sorted_indices: Integer[np.ndarray, "N"],
+                   parent_idx: int,
+                   y_centred_sq: float) \
+            -> tuple[
+                Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
+                Float[np.ndarray, "{self.nbases}-1 *k"],
+                Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
+                Float[np.ndarray, "{self.nbases}-1 *k"],
+                int,
+                float
+            ]:
         """
-        Add two bases functions to model, one truncated and one linear.
+        Update the fit to the next smaller root by sweeping down the sorted covariate. Running sums of the parent
+        times the covariate, the response variables and the other columns of the data matrix over the rows above the
+        root yield the last column of the normal equations. Only the rows crossed since the previous root are
+        visited, so a pair costs O(N*m) for all of its roots. The last column of the data matrix is not updated.
+        The first call of a pair also stores the column sums of the data matrix, which are zero only up to rounding.
+        The Fortran backend updates the arrays in place, so they have to be Fortran-ordered like the ones _fit
+        returns.
 
         Args:
-            parent: Index of the parent basis function.
-            cov: Determines the dimension this basis function is acting on.
-            root: Determines the root of the basis function.
+            data_matrix: Centered data matrix of the first root of the pair.
+            data_matrix_mean: Mean of the data matrix.
+            covariance_matrix: Covariance matrix.
+            rhs: Right hand side of the normal equations.
+            chol: Cholesky decomposition of the covariance matrix.
+            sweep_sums: Running sums over the rows above the previous root, updated in place, the sums of the
+            response variables have one entry per response variable. Zeros at the first root of a pair.
+            sweep_position: Number of sorted rows already accumulated in the sums.
+            x: Predictor Variables.
+            y: Response Variables.
+            sorted_indices: Indices sorting the covariate of the new basis in descending order.
+            parent_idx: Index of the parent basis function.
+            y_centred_sq: Squared norm of the centred response variables.
+
+        Returns:
+            Updated covariance matrix, right hand side, Cholesky decomposition and coefficients, position in the
+            sorted rows, lack of fit criterion.
         """
+        x = self._predictors(x)
         if self.backend is Backend.PYTHON:
-            parent_depth = self.mask[:, parent].sum()
+            root = self.root[self.nbases - 1]
+            cov = self.cov[self.nbases - 1]
+            ncols = covariance_matrix.shape[0] - 1
+
+            if sweep_position == 0:
+                sweep_sums[2 * ncols:3 * ncols] = data_matrix[:, :ncols].sum(axis=0, dtype=float)
 
-            self.mask[:, self.nbases - 2: self.nbases] = np.tile(self.mask[:, parent:parent + 1], (1, 2))
-            self.mask[parent_depth + 1, self.nbases - 2:self.nbases] = True
+            # Accumulate the rows crossed since the previous root, the rows above it only shift by a constant
+            end = sweep_position
+            while end < len(sorted_indices) and x[sorted_indices[end], cov] >= root:
+                end += 1
+            rows = sorted_indices[sweep_position:end]
+            sweep_position = end
 
-            self.truncated[:, self.nbases - 2: self.nbases] = np.tile(self.truncated[:, parent:parent + 1], (1, 2))
-            self.truncated[parent_depth + 1, self.nbases - 1] = True
+            if parent_idx != 0:  # Not Constant basis function, otherwise 1 anyway
+                parent = data_matrix[rows, parent_idx - 1] + data_matrix_mean[parent_idx - 1]
+            else:
+                parent = np.ones(len(rows))
+            parent_x = parent * x[rows, cov]
+            y_centred = as_columns(y[rows] - self.y_mean)
+            sweep_sums[:ncols] += parent_x @ data_matrix[rows, :ncols]
+            sweep_sums[ncols:2 * ncols] += parent @ data_matrix[rows, :ncols]
+            sweep_sums[3 * ncols:3 * ncols + 5] += [parent_x @ parent_x, parent @ parent_x, parent @ parent,
+                                                    parent_x.sum(), parent.sum()]
+            y_sums = sweep_sums[3 * ncols + 5:].reshape(2, -1)
+            y_sums += [parent_x @ y_centred, parent @ y_centred]
+
+            # Last column of the normal equations from the sums over the rows above the root
+            column_mean = (sweep_sums[3 * ncols + 3] - root * sweep_sums[3 * ncols + 4]) / len(y)
+            covariance_addition = np.empty(ncols + 1)
+            covariance_addition[:-1] = (sweep_sums[:ncols] - root * sweep_sums[ncols:2 * ncols]
+                                        - column_mean * sweep_sums[2 * ncols:3 * ncols])
+            covariance_addition[-1] = (sweep_sums[3 * ncols] - 2 * root * sweep_sums[3 * ncols + 1]
+                                       + root ** 2 * sweep_sums[3 * ncols + 2] - len(y) * column_mean ** 2 + 1e-8)
+            covariance_addition -= covariance_matrix[:, -1]
 
-            self.cov[:, self.nbases - 2: self.nbases] = np.tile(self.cov[:, parent:parent + 1], (1, 2))
-            self.cov[parent_depth + 1, self.nbases - 2:self.nbases] = cov
+            covariance_matrix[-1, :-1] += covariance_addition[:-1]
+            covariance_matrix[:, -1] += covariance_addition
+            as_columns(rhs)[-1] = y_sums[0] - root * y_sums[1]
 
-            self.root[:, self.nbases - 2: self.nbases] = np.tile(self.root[:, parent:parent + 1], (1, 2))
-            self.root[parent_depth + 1, self.nbases - 1] = root
+            self.coefficients, chol = self._update_coefficients(chol, covariance_addition, rhs)
+            lof = self._fast_generalised_cross_validation(y_centred_sq, len(y), rhs, chol)
         elif self.backend is Backend.FORTRAN:
-            fortran.backend.add_bases(parent, cov, root, self.nbases, self.mask, self.truncated, self.cov,
-                                      self.root)
+            # Fortran updates in place, and indexes from 1. The arrays are Fortran-ordered already, f2py refuses
+            # to update anything else.
+            # Need mutable types for Fortran
+            sweep_position = np.array(sweep_position, dtype=np.int32)
+            lof = fortran.backend.sweep_fit(data_matrix, data_matrix_mean, covariance_matrix, as_columns(rhs), chol,
+                                            as_columns(self.coefficients), sweep_sums, sweep_position, x,
+                                            as_columns(y), sorted_indices + 1, parent_idx + 1,
+                                            np.atleast_1d(self.y_mean), y_centred_sq, self.nbases, self.penalty,
+                                            self.cov + 1, self.root)
+            sweep_position = int(sweep_position)
+            chol = lower_triangle(chol)
+        elif self.backend is Backend.NUMBA:
+            # Numba updates in place
+            sweep_position, lof = numba_backend.sweep_fit(data_matrix, data_matrix_mean, covariance_matrix,
+                                                          as_columns(rhs), chol, as_columns(self.coefficients),
+                                                          sweep_sums, sweep_position, x, as_columns(y),
+                                                          sorted_indices, parent_idx, np.atleast_1d(self.y_mean),
+                                                          y_centred_sq, self.nbases, self.penalty, self.cov,
+                                                          self.root)
         else:
             raise NotImplementedError("Backend not implemented.")
 
-    def _expand_bases(self, x: Float[np.ndarray, "N d"], y: Float[np.ndarray, "N"]) -> float:
+        return covariance_matrix, rhs, chol, self.coefficients, sweep_position, lof
+
+    def _sweep_lofs(self,
+                    data_matrix: Float[np.ndarray, "N {self.nbases}-1"],
+                    data_matrix_mean: Float[np.ndarray, "{self.nbases}-1"],
+                    rhs: Float[np.ndarray, "{self.nbases}-1 *k"],
+                    chol: Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
+                    x: Float[np.ndarray, "N d"],
+                    y: Float[np.ndarray, "N *k"],
+                    sorted_indices: Integer[np.ndarray, "N"],
+                    parent_idx: int,
+                    roots: Float[np.ndarray, "k"],
+                    y_centred_sq: float) -> Float[np.ndarray, "k"]:
         """
-        Grow the model to the maximum number of basis functions by iteratively adding the basis that reduces
-        the lack of fit criterion the most. Equivalent to the forward pass in the Mars paper, including the adaptions
-        in the Fast Mars paper.
+        Calculate the lack of fit criterion for every candidate root of the last basis function at once, the batched
+        counterpart of sweeping the roots one by one with _sweep_fit. Prefix sums over the sorted covariate yield the
+        last column of the normal equations for every root, and the Cholesky decomposition of the other columns is
+        bordered for all roots with two triangular solves. Only the other columns of the data matrix are used.
 
         Args:
+            data_matrix: Centered data matrix, the last column belongs to the basis function whose root is swept.
+            data_matrix_mean: Mean of the data matrix.
+            rhs: Right hand side of the normal equations.
+            chol: Cholesky decomposition of the covariance matrix.
             x: Predictor Variables.
             y: Response Variables.
+            sorted_indices: Indices sorting the covariate of the new basis in descending order.
+            parent_idx: Index of the parent basis function.
+            roots: Candidate roots in descending order.
+            y_centred_sq: Squared norm of the centred response variables.
 
         Returns:
-            Lack of fit criterion
+            Lack of fit criterion for every root, NaN where the normal equations are singular.
+        """
+        cov = self.cov[self.nbases - 1]
+        ncols = chol.shape[0] - 1
+
+        # Each root covers the sorted rows down to the last one that is not smaller than the root
+        ends = np.searchsorted(-x[sorted_indices, cov], -roots, side="right")
+        rows = sorted_indices[:ends[-1]]
+        if parent_idx != 0:  # Not Constant basis function, otherwise 1 anyway
+            parent = data_matrix[rows, parent_idx - 1] + data_matrix_mean[parent_idx - 1]
+        else:
+            parent = np.ones(len(rows))
+        parent = parent.astype(float)
+        parent_x = parent * x[rows, cov]
+        # One column per response variable
+        y_centred = (y[rows] - self.y_mean).reshape(len(rows), -1)
+        ntargets = y_centred.shape[1]
+        other_columns = data_matrix[rows, :ncols].astype(float)
+
+        # Row k holds the sums over the first k sorted rows, the same running sums as in _sweep_fit
+        terms = np.column_stack([parent_x[:, None] * other_columns, parent[:, None] * other_columns, parent_x ** 2,
+                                 parent * parent_x, parent ** 2, parent_x, parent, parent_x[:, None] * y_centred,
+                                 parent[:, None] * y_centred])
+        sums = np.zeros((len(rows) + 1, terms.shape[1]))
+        np.cumsum(terms, axis=0, out=sums[1:])
+        sums = sums[ends]
+
+        # Last column of the normal equations for every root
+        column_sums = data_matrix[:, :ncols].sum(axis=0, dtype=float)
+        column_mean = (sums[:, 2 * ncols + 3] - roots * sums[:, 2 * ncols + 4]) / len(y)
+        cross = (sums[:, :ncols] - roots[:, None] * sums[:, ncols:2 * ncols]
+                 - column_mean[:, None] * column_sums)
+        corner = (sums[:, 2 * ncols] - 2 * roots * sums[:, 2 * ncols + 1] + roots ** 2 * sums[:, 2 * ncols + 2]
+                  - len(y) * column_mean ** 2 + 1e-8)
+        last_rhs = (sums[:, 2 * ncols + 5:2 * ncols + 5 + ntargets]
+                    - roots[:, None] * sums[:, 2 * ncols + 5 + ntargets:])
+
+        # Border the Cholesky decomposition of the other columns for every root. The coefficients of the other
+        # columns are the ones without the last basis, corrected along one direction per root.
+        other_chol = chol[:ncols, :ncols]
+        border = linalg.solve_triangular(other_chol, cross.T, lower=True)
+        half_solution = linalg.solve_triangular(other_chol, rhs[:ncols].reshape(ncols, ntargets), lower=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pivot = np.sqrt(corner - np.sum(border ** 2, axis=0))
+            last_half_solution = (last_rhs - border.T @ half_solution) / pivot[:, None]
+            last_coefficient = last_half_solution / pivot[:, None]
+        base_coefficients = linalg.solve_triangular(other_chol, half_solution, lower=True, trans="T")
+        correction = linalg.solve_triangular(other_chol, border, lower=True, trans="T")
+        coefficients_sq = (np.sum(base_coefficients ** 2)
+                           - 2 * np.sum(last_coefficient * (correction.T @ base_coefficients), axis=1)
+                           + np.sum(last_coefficient ** 2, axis=1) * (np.sum(correction ** 2, axis=0) + 1))
+
+        # Same criterion as _fast_generalised_cross_validation, summed over the response variables, a NaN pivot
+        # marks a failed decomposition
+        rss = (y_centred_sq - np.sum(half_solution ** 2) - np.sum(last_half_solution ** 2, axis=1)
+               - 1e-8 * coefficients_sq)
+        rank = np.sum(np.diag(other_chol) != 0) + 1
+        return self._lack_of_fit(np.maximum(rss, 0.), rank, len(y))
+
+    def _compact_bases(self) -> None:
+        """
+        Number the active basis functions and their parents consecutively and activate all of them, so the forward
+        pass can continue from the model. The forward pass treats every basis function up to nbases as a column of
+        the data matrix, so the parents of active basis functions, which may have been pruned, are activated again.
+        """
+        kept = set()
+        for basis_idx in self._active_base_indices():
+            while basis_idx != 0 and basis_idx not in kept:
+                kept.add(int(basis_idx))
+                basis_idx = self.parent[basis_idx]
+        # Parents precede their children, so sorting keeps every parent chain intact
+        order = np.array([0] + sorted(kept))
+        new_index = np.zeros(self.max_nbases, dtype=int)
+        new_index[order] = np.arange(len(order))
+
+        self.nbases = len(order)
+        self.mask = np.zeros(self.max_nbases, dtype=bool)
+        self.mask[1:self.nbases] = True
+        parent = np.zeros(self.max_nbases, dtype=int)
+        parent[:self.nbases] = new_index[self.parent[order]]
+        truncated = np.zeros(self.max_nbases, dtype=bool)
+        truncated[:self.nbases] = self.truncated[order]
+        cov = np.zeros(self.max_nbases, dtype=int)
+        cov[:self.nbases] = self.cov[order]
+        root = np.zeros(self.max_nbases, dtype=float)
+        root[:self.nbases] = self.root[order]
+        self.parent, self.truncated, self.cov, self.root = parent, truncated, cov, root
+
+    def _add_bases(self, parent: int, cov: int, root: float) -> None:
+        """
+        Add two bases functions to model, one truncated and one linear.
+
+        Args:
+            parent: Index of the parent basis function.
+            cov: Determines the dimension this basis function is acting on.
+            root: Determines the root of the basis function.
         """
         if self.backend is Backend.PYTHON:
-            self.nbases = 1
-            self.mask = np.zeros((self.max_nbases, self.max_nbases), dtype=bool)
-            self.truncated = np.zeros((self.max_nbases, self.max_nbases), dtype=bool)
-            self.cov = np.zeros((self.max_nbases, self.max_nbases), dtype=int)
-            self.root = np.zeros((self.max_nbases, self.max_nbases), dtype=float)
+            self.mask[self.nbases - 2: self.nbases] = True
+            self.parent[self.nbases - 2: self.nbases] = parent
+            self.cov[self.nbases - 2: self.nbases] = cov
 
-            candidate_queue = [0.]  # One for the constant function
-            for iteration in range(self.max_nbases // 2):
-                best_lof = np.inf
-                best_cov = None
-                best_root = None
-                best_parent = None
+            # The linear basis function has its root at zero, the truncated one at the given root
+            self.truncated[self.nbases - 2: self.nbases] = [False, True]
+            self.root[self.nbases - 2: self.nbases] = [0., root]
+        elif self.backend is Backend.FORTRAN:
+            # Fortran updates in place, indexes from 1 and stores logicals in 4 bytes
+            fortran_mask = self.mask.astype(np.int32)
+            fortran_parent = np.asarray(self.parent + 1, dtype=np.int32)
+            fortran_truncated = self.truncated.astype(np.int32)
+            fortran_cov = np.asarray(self.cov + 1, dtype=np.int32)
+            self.root = np.ascontiguousarray(self.root, dtype=float)
+            fortran.backend.add_bases(parent + 1, cov + 1, root, self.nbases, fortran_mask, fortran_parent,
+                                      fortran_truncated, fortran_cov, self.root)
+            self.mask = fortran_mask.astype(bool)
+            self.parent = fortran_parent - 1
+            self.truncated = fortran_truncated.astype(bool)
+            self.cov = fortran_cov - 1
+        elif self.backend is Backend.NUMBA:
+            # Numba updates in place
+            numba_backend.add_bases(parent, cov, root, self.nbases, self.mask, self.parent, self.truncated, self.cov,
+                                    self.root)
+        else:
+            raise NotImplementedError("Backend not implemented.")
 
-                parents = np.argsort(candidate_queue)
-                pairs = []
-                for i in range(min(self.max_ncandidates, self.nbases)):
-                    parent = parents[i]
-                    eligible_cov = set(range(x.shape[1])) - set(self.cov[self.mask[:, parent], parent])
-                    for cov_idx in eligible_cov:
-                        pairs.append((i, cov_idx))
-                basis_lofs = [np.inf] * min(self.max_ncandidates, self.nbases)
+    def _workspace(self, n_samples: int, nresponses: int = 1) -> Workspace:
+        """
+        Get the scratch memory of the Fortran backend for a fit.
 
-                self.nbases += 2
-                for i, cov_idx in pairs:
-                    parent = parents[i]
-                    self._add_bases(parent, cov_idx, 0)
+        Args:
+            n_samples: Number of samples of the fit.
+            nresponses: Number of response variables of the fit.
 
-                    if parent == 0:  # constant function
-                        eligible_roots = x[:, cov_idx].copy()  # copy is important!
-                    else:
-                        eligible_roots = x[np.where(data_matrix[:, parent - 1] > 0)[0], cov_idx]
-                    eligible_roots[::-1].sort()
-
-                    for root_idx in range(len(eligible_roots)):
-                        self.root[self.mask[:, parent].sum() + 1, self.nbases - 1] = eligible_roots[root_idx]
-
-                        if root_idx == 0:
-                            data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, self.coefficients, lof = \
-                                self._fit(x, y)
-                        else:
-                            data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, self.coefficients, lof = \
-                                self._update_fit(data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, x, y,
-                                                 eligible_roots[root_idx - 1], parent)
-
-                        if lof < basis_lofs[i]:
-                            basis_lofs[i] = lof
-                        if lof < best_lof:
-                            best_lof = lof
-                            best_cov = cov_idx
-                            best_root = eligible_roots[root_idx]
-                            best_parent = parent
+        Returns:
+            The workspace of the model, or a temporary one if the model has none.
+        """
+        if self.workspace is None:
+            return Workspace(n_samples, self.max_nbases, nresponses)
+
+        assert self.workspace.fits(n_samples, self.max_nbases, nresponses), "Workspace is too small for the data."
+        return self.workspace
+
+    def _max_threads(self) -> int:
+        """
+        Get the number of threads the backend uses for the parallel regions started by the calling thread.
+
+        Returns:
+            Number of threads.
+        """
+        if self.backend is Backend.PYTHON:
+            nthreads = 1
+        elif self.backend is Backend.FORTRAN:
+            nthreads = fortran.backend.get_max_threads()
+        elif self.backend is Backend.NUMBA:
+            nthreads = numba_backend.get_num_threads()
+        else:
+            raise NotImplementedError("Backend not implemented.")
+
+        return nthreads
+
+    def _limit_threads(self, nthreads: int) -> None:
+        """
+        Limit the threads of the parallel regions that the calling thread starts. The limit is thread-local, so fits
+        on several Python threads can split the cores between them.
+
+        Args:
+            nthreads: Number of threads.
+        """
+        if self.backend is Backend.PYTHON:
+            pass
+        elif self.backend is Backend.FORTRAN:
+            fortran.backend.set_num_threads(nthreads)
+        elif self.backend is Backend.NUMBA:
+            numba_backend.set_num_threads(nthreads)
+        else:
+            raise NotImplementedError("Backend not implemented.")
+
+    def _sort_predictors(self, x: Float[np.ndarray, "N d"]) -> Integer[np.ndarray, "N d"]:
+        """
+        Sort every predictor variable once in descending order. The forward pass derives the root sequences of all
+        parent and covariate pairs by filtering this order, instead of sorting for every pair.
+
+        Args:
+            x: Predictor variables.
+
+        Returns:
+            Indices sorting each column of x in descending order.
+        """
+        x = self._predictors(x)
+        if self.backend is Backend.PYTHON:
+            sorted_indices = np.argsort(x, axis=0, kind="stable")[::-1]
+        elif self.backend is Backend.FORTRAN:
+            # Fortran indexes from 1
+            sorted_indices = fortran.backend.sort_predictors(x) - 1
+        elif self.backend is Backend.NUMBA:
+            sorted_indices = numba_backend.sort_predictors(x)
+        else:
+            raise NotImplementedError("Backend not implemented.")
+
+        return sorted_indices
+
+    def _select_roots(self, eligible_roots: Float[np.ndarray, "n"]) -> Float[np.ndarray, "k"]:
+        """
+        Select the candidate roots of a parent and covariate pair. Repeated values are evaluated only once, since
+        they yield the same fit.
+
+        Args:
+            eligible_roots: Eligible roots sorted in descending order.
+
+        Returns:
+            Candidate roots in descending order.
+        """
+        if self.backend is Backend.PYTHON:
+            roots = eligible_roots[self.endspan:len(eligible_roots) - self.endspan:self.minspan]
+            if roots.size != 0:
+                roots = roots[np.concatenate(([True], roots[1:] != roots[:-1]))]
+            if self.max_nknots is not None and len(roots) > self.max_nknots:
+                # Centres of max_nknots equally populated bins
+                grid = np.arange(self.max_nknots)
+                roots = roots[((2 * grid + 1) * len(roots)) // (2 * self.max_nknots)]
+        elif self.backend is Backend.FORTRAN:
+            roots, nroots = fortran.backend.select_roots(eligible_roots, self.endspan, self.minspan,
+                                                         self.max_nknots or 0)
+            roots = roots[:nroots]
+        elif self.backend is Backend.NUMBA:
+            roots = numba_backend.select_roots(eligible_roots, self.endspan, self.minspan, self.max_nknots or 0)
+        else:
+            raise NotImplementedError("Backend not implemented.")
+
+        return roots
+
+    def _expand_bases(self,
+                      x: Float[np.ndarray, "N d"],
+                      y: Float[np.ndarray, "N *k"],
+                      sorted_indices: Integer[np.ndarray, "N d"] | None = None,
+                      warm_start: bool = False) -> float:
+        """
+        Grow the model to the maximum number of basis functions by iteratively adding the basis that reduces
+        the lack of fit criterion the most. Equivalent to the forward pass in the Mars paper, including the adaptions
+        in the Fast Mars paper.
+
+        Args:
+            x: Predictor Variables.
+            y: Response Variables.
+            sorted_indices: Indices sorting each column of x in descending order. Computed if not given.
+            warm_start: Whether to continue from the basis functions of the model instead of the constant model.
+
+        Returns:
+            Lack of fit criterion
+        """
+        x = self._predictors(x)
+        if sorted_indices is None:
+            sorted_indices = self._sort_predictors(x)
+        if warm_start:
+            self._compact_bases()
+        else:
+            self.nbases = 1
+            self.mask = np.zeros(self.max_nbases, dtype=bool)
+            self.parent = np.zeros(self.max_nbases, dtype=int)
+            self.truncated = np.zeros(self.max_nbases, dtype=bool)
+            self.cov = np.zeros(self.max_nbases, dtype=int)
+            self.root = np.zeros(self.max_nbases, dtype=float)
+
+        if self.backend is Backend.PYTHON:
+            y_centred_sq = np.sum((y - self.y_mean) ** 2)
+            candidate_queue = [0.] * self.nbases  # One for every basis function, including the constant one
+            for iteration in range((self.max_nbases - self.nbases) // 2):
+                best_lof = np.inf
+                best_cov = None
+                best_root = None
+                best_parent = None
+
+                parents = np.argsort(candidate_queue)
+                pairs = []
+                for i in range(min(self.max_ncandidates, self.nbases)):
+                    parent = parents[i]
+                    eligible_cov = set(range(x.shape[1])) - {cov for cov, _, _ in self._basis_key(parent)}
+                    for cov_idx in eligible_cov:
+                        pairs.append((i, cov_idx))
+                basis_lofs = [np.inf] * min(self.max_ncandidates, self.nbases)
+
+                # Every pair extends the fit of the current model
+                prev_data_matrix, prev_data_matrix_mean, prev_covariance_matrix, prev_rhs, prev_chol, _, _ = \
+                    self._fit(x, y)
+
+                self.nbases += 2
+                for i, cov_idx in pairs:
+                    parent = parents[i]
+                    self._add_bases(parent, cov_idx, 0)
+
+                    # The presorted order restricted to the support of the parent is already descending
+                    order = sorted_indices[:, cov_idx]
+                    if parent != 0:  # Not constant function
+                        order = order[prev_data_matrix[order, parent - 1] > 0]
+                    eligible_roots = self._select_roots(x[order, cov_idx])
+                    if len(eligible_roots) == 0:
+                        continue
+
+                    # The fit at the first root provides the other columns, all roots are then evaluated at once
+                    self.root[self.nbases - 1] = eligible_roots[0]
+                    data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, self.coefficients, _ = \
+                        self._append_fit(prev_data_matrix, prev_data_matrix_mean, prev_covariance_matrix,
+                                         prev_rhs, prev_chol, x, y, y_centred_sq)
+                    lofs = self._sweep_lofs(data_matrix, data_matrix_mean, rhs, chol, x, y,
+                                            sorted_indices[:, cov_idx], parent, eligible_roots, y_centred_sq)
+                    lofs[np.isnan(lofs)] = np.inf
+                    root_idx = np.argmin(lofs)
+                    lof = lofs[root_idx]
+
+                    if lof < basis_lofs[i]:
+                        basis_lofs[i] = lof
+                    if lof < best_lof:
+                        best_lof = lof
+                        best_cov = cov_idx
+                        best_root = float(eligible_roots[root_idx])
+                        best_parent = parent
                 for i in range(len(candidate_queue)):
                     if i < len(basis_lofs):
                         candidate_queue[parents[i]] = basis_lofs[i] - best_lof
@@ -703,33 +1628,200 @@ class OMAR:
                     candidate_queue.extend([0, 0])
                 else:
                     print(f"Cannot find additional bases in iteration {iteration}.")
-                    self.mask[:, self.nbases - 2: self.nbases] = False
+                    self.mask[self.nbases - 2: self.nbases] = False
                     self.nbases -= 2
                     break
 
             data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, self.coefficients, lof = self._fit(x, y)
 
         elif self.backend is Backend.FORTRAN:
-            (lof, self.nbases, self.mask, self.truncated, self.cov, self.root,
-             self.coefficients) = fortran.backend.expand_bases(x, y, self.y_mean,
-                                                               self.max_nbases, self.max_ncandidates,
-                                                               self.aging_factor,
-                                                               self.penalty)
+            (lof, self.nbases, self.mask, self.parent, self.truncated, self.cov, self.root,
+             coefficients) = fortran.backend.expand_bases(x, as_columns(y), sorted_indices + 1,
+                                                          np.atleast_1d(self.y_mean),
+                                                          self.max_ncandidates,
+                                                          self.aging_factor,
+                                                          self.penalty,
+                                                          self.minspan, self.endspan,
+                                                          self.max_nknots or 0,
+                                                          self._workspace(*as_columns(y).shape).buffer, self.nbases,
+                                                          self.parent + 1, self.truncated, self.cov + 1,
+                                                          self.root)
             # Fortran indexes from 1 and has a fixed output size, therefore requires trimming in case of early stopping
+            self.parent -= 1
             self.cov -= 1
-            self.coefficients = self.coefficients[:self.nbases - 1]
+            self.coefficients = like_response(coefficients[:self.nbases - 1], y)
+        elif self.backend is Backend.NUMBA:
+            (lof, self.nbases, self.mask, self.parent, self.truncated, self.cov, self.root,
+             coefficients) = numba_backend.expand_bases(x, as_columns(y), sorted_indices, np.atleast_1d(self.y_mean),
+                                                        self.max_nbases, self.max_ncandidates, self.aging_factor,
+                                                        self.penalty, self.minspan, self.endspan,
+                                                        self.max_nknots or 0, self.nbases, self.parent,
+                                                        self.truncated, self.cov, self.root)
+            self.coefficients = like_response(coefficients, y)
+        else:
+            raise NotImplementedError("Backend not implemented.")
+
+        return lof
+
+    def _removal_lofs(self,
+                      covariance_matrix: Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
+                      rhs: Float[np.ndarray, "{self.nbases}-1 *k"],
+                      y_centred_sq: float,
+                      n_samples: int) -> Float[np.ndarray, "{self.nbases}-1"]:
+        """
+        Calculate the lack of fit criterion after removing each of the basis functions, without refitting.
+        Removing a basis increases the residual sum of squares by its coefficient squared divided by the
+        corresponding diagonal element of the inverse covariance matrix.
+
+        Args:
+            covariance_matrix: Covariance matrix.
+            rhs: Right hand side of the normal equations.
+            y_centred_sq: Squared norm of the centred response variables.
+            n_samples: Number of samples.
+
+        Returns:
+            Lack of fit criterion after removing the respective basis function.
+        """
+        if self.backend is Backend.PYTHON:
+            chol = linalg.cho_factor(covariance_matrix, lower=True)
+            coefficients = linalg.cho_solve(chol, rhs)
+            inverse_diag = np.diag(linalg.cho_solve(chol, np.eye(len(rhs))))
+            rss = y_centred_sq - np.sum(coefficients * rhs) - 1e-8 * np.sum(coefficients ** 2)
+            increases = np.sum(coefficients.reshape(len(rhs), -1) ** 2, axis=1) / inverse_diag
+
+            lofs = np.array([self._lack_of_fit(max(rss + increase, 0.), len(rhs) - 1, n_samples)
+                             for increase in increases])
+        elif self.backend is Backend.FORTRAN:
+            lofs = fortran.backend.removal_lofs(covariance_matrix, as_columns(rhs), y_centred_sq, n_samples,
+                                                self.penalty)
+        elif self.backend is Backend.NUMBA:
+            lofs = numba_backend.removal_lofs(covariance_matrix, as_columns(rhs), y_centred_sq, n_samples,
+                                              self.penalty)
         else:
             raise NotImplementedError("Backend not implemented.")
 
+        return lofs
+
+    def _prune_normal_equations(self,
+                                covariance_matrix: Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
+                                rhs: Float[np.ndarray, "{self.nbases}-1 *k"],
+                                y_centred_sq: float,
+                                n_samples: int,
+                                lof: float) -> Integer[np.ndarray, "k"]:
+        """
+        Remove the basis functions one by one on the normal equations of the full model and keep the best subset.
+
+        Args:
+            covariance_matrix: Covariance matrix of all active basis functions.
+            rhs: Right hand side of the normal equations.
+            y_centred_sq: Squared norm of the centred response variables.
+            n_samples: Number of samples.
+            lof: Lack of fit criterion of the full model.
+
+        Returns:
+            Indices of the kept basis functions in the normal equations.
+        """
+        best_nbases = self.nbases
+        best_mask = self.mask.copy()
+        best_lof = lof
+
+        active = self._active_base_indices()
+        keep = np.arange(len(active))
+        best_keep = keep
+        for iteration in range(len(active)):
+            lofs = self._removal_lofs(covariance_matrix[np.ix_(keep, keep)], rhs[keep], y_centred_sq, n_samples)
+            removal_idx = np.argmin(lofs)
+
+            self.mask[active[keep[removal_idx]]] = False
+            self.nbases -= 1
+            keep = np.delete(keep, removal_idx)
+
+            if lofs[removal_idx] < best_lof:
+                best_lof = lofs[removal_idx]
+                best_nbases = self.nbases
+                best_mask = self.mask.copy()
+                best_keep = keep
+
+        self.mask = best_mask
+        self.nbases = best_nbases
+
+        return best_keep
+
+    def _solve_kept(self,
+                    covariance_matrix: Float[np.ndarray, "m m"],
+                    rhs: Float[np.ndarray, "m *k"],
+                    data_matrix_mean: Float[np.ndarray, "m"],
+                    keep: Integer[np.ndarray, "{self.nbases}-1"],
+                    y_centred_sq: float,
+                    n_samples: int) -> float:
+        """
+        Solve the normal equations of the basis functions kept by _prune_normal_equations, which are a part of the
+        full ones, so no basis function is evaluated again.
+
+        Args:
+            covariance_matrix: Covariance matrix of all basis functions before the pruning.
+            rhs: Right hand side of the normal equations before the pruning.
+            data_matrix_mean: Mean of the data matrix before the pruning.
+            keep: Indices of the kept basis functions in the normal equations.
+            y_centred_sq: Squared norm of the centred response variables.
+            n_samples: Number of samples.
+
+        Returns:
+            Lack of fit criterion.
+        """
+        self.data_matrix_mean = data_matrix_mean[keep]
+        self.mean_keys = self._active_basis_keys()
+        if len(keep) != 0:
+            self.coefficients, chol = self._coefficients(covariance_matrix[np.ix_(keep, keep)], rhs[keep])
+            lof = self._fast_generalised_cross_validation(y_centred_sq, n_samples, rhs[keep], chol)
+        else:
+            self.coefficients = np.empty((0,) + rhs.shape[1:], dtype=float)
+            lof = self._lack_of_fit(y_centred_sq, 0, n_samples)
+
         return lof
 
+    def _removal_path(self,
+                      covariance_matrix: Float[np.ndarray, "m m"],
+                      rhs: Float[np.ndarray, "m *k"],
+                      y_centred_sq: float) -> tuple[Integer[np.ndarray, "m"], Float[np.ndarray, "m+1"]]:
+        """
+        Remove the basis functions one by one on the normal equations, always the one that increases the residual
+        sum of squares the least, down to the constant model. All removal candidates share the same rank, so the
+        order doesn't depend on the penalty of the lack of fit criterion.
+
+        Args:
+            covariance_matrix: Covariance matrix of all active basis functions.
+            rhs: Right hand side of the normal equations.
+            y_centred_sq: Squared norm of the centred response variables.
+
+        Returns:
+            Indices of the basis functions in the normal equations in the order of removal, residual sum of squares
+            after each number of removals.
+        """
+        keep = np.arange(len(rhs))
+        removals = np.empty(len(rhs), dtype=int)
+        rss = np.full(len(rhs) + 1, y_centred_sq)
+        for iteration in range(len(rhs)):
+            chol = linalg.cho_factor(covariance_matrix[np.ix_(keep, keep)], lower=True)
+            coefficients = linalg.cho_solve(chol, rhs[keep])
+            inverse_diag = np.diag(linalg.cho_solve(chol, np.eye(len(keep))))
+            rss[iteration] = y_centred_sq - np.sum(coefficients * rhs[keep]) - 1e-8 * np.sum(coefficients ** 2)
+            removal_idx = np.argmin(np.sum(coefficients.reshape(len(keep), -1) ** 2, axis=1) / inverse_diag)
+
+            removals[iteration] = keep[removal_idx]
+            keep = np.delete(keep, removal_idx)
+
+        return removals, np.maximum(rss, 0.)
+
     def _prune_bases(self,
                      x: Float[np.ndarray, "N d"],
-                     y: Float[np.ndarray, "N"],
+                     y: Float[np.ndarray, "N *k"],
                      lof: float) -> float:
         """
         Prune the bases to the best fitting subset of the basis functions by iteratively removing the basis
         that increases the lack of fit criterion the least. Equivalent to the backward pass in the Mars paper.
+        The data matrix and covariance matrix are built once, every removal is evaluated on the m x m system.
+        The normal equations of the pruned model are kept for partial_fit.
 
         Args:
             x: Predictor Variables.
@@ -739,97 +1831,902 @@ class OMAR:
         Returns:
             Lack of fit criterion.
         """
+        x = self._predictors(x)
+        y_centred_sq = np.sum((y - self.y_mean) ** 2)
         if self.backend is Backend.PYTHON:
-            best_nbases = self.nbases
-            best_mask = self.mask.copy()
-            best_lof = lof
-
-            prev_mask = self.mask.copy()
-
-            for iteration in range(self.nbases - 1):
-                best_lof_trim = np.inf
-                removal_idx = None
-
-                for basis_idx in self._active_base_indices():
-                    self.mask[:, basis_idx] = False
-                    self.nbases -= 1
-
-                    if self.nbases != 1:
-                        data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, self.coefficients, lof = self._fit(
-                            x, y)
-                    else:
-                        lof = self._generalised_cross_validation(y, np.empty(0), np.empty((0, 0)))
-
-                    if lof < best_lof_trim:
-                        best_lof_trim = lof
-                        removal_idx = basis_idx
-                    if lof < best_lof:
-                        best_lof = lof
-                        best_nbases = self.nbases
-                        best_mask = self.mask.copy()
-
-                    self.mask[:, basis_idx] = prev_mask[:, basis_idx]
-                    self.nbases += 1
-
-                self.mask[:, removal_idx] = False
-                self.nbases -= 1
-                prev_mask[:, removal_idx] = False
-
-            self.mask = best_mask
-            self.nbases = best_nbases
-            data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, self.coefficients, lof = \
-                self._fit(x, y)
+            _, data_matrix_mean, covariance_matrix, rhs, _, _, _ = self._fit(x, y)
+            keep = self._prune_normal_equations(covariance_matrix, rhs, y_centred_sq, len(y), lof)
+            lof = self._solve_kept(covariance_matrix, rhs, data_matrix_mean, keep, y_centred_sq, len(y))
+            covariance_matrix = covariance_matrix[np.ix_(keep, keep)]
+            rhs = rhs[keep]
         elif self.backend is Backend.FORTRAN:
             # Fortran indexes from 1
             self.mask = np.asfortranarray(self.mask)
             # Need mutable types for Fortran
             lof = np.array(lof, dtype=float)
             self.nbases = np.array(self.nbases, dtype=int)
-            self.coefficients, self.mask = fortran.backend.prune_bases(x, y, self.y_mean,
-                                                                       lof,
-                                                                       self.nbases,
-                                                                       self.mask,
-                                                                       self.truncated,
-                                                                       self.cov + 1,
-                                                                       self.root,
-                                                                       self.penalty)
+            coefficients, self.data_matrix_mean, covariance_matrix, rhs, self.mask = \
+                fortran.backend.prune_bases(x, as_columns(y), np.atleast_1d(self.y_mean), lof, self.nbases, self.mask,
+                                            self.parent + 1, self.truncated, self.cov + 1, self.root, self.penalty,
+                                            self._workspace(*as_columns(y).shape).buffer)
             # Fortran has a fixed output size, therefore requires trimming in case of early stopping
-            self.coefficients = self.coefficients[:self.nbases -1]
+            self.coefficients = like_response(coefficients[:self.nbases - 1], y)
+            self.data_matrix_mean = self.data_matrix_mean[:self.nbases - 1]
+            covariance_matrix = covariance_matrix[:self.nbases - 1, :self.nbases - 1]
+            rhs = like_response(rhs[:self.nbases - 1], y)
+        elif self.backend is Backend.NUMBA:
+            lof, self.nbases, coefficients, self.data_matrix_mean, self.mask, covariance_matrix, rhs = \
+                numba_backend.prune_bases(x, as_columns(y), np.atleast_1d(self.y_mean), lof, self.nbases, self.mask,
+                                          self.parent, self.truncated, self.cov, self.root, self.penalty)
+            self.coefficients, rhs = like_response(coefficients, y), like_response(rhs, y)
         else:
             raise NotImplementedError("Backend not implemented.")
 
+        self._keep_statistics(covariance_matrix, rhs, len(y), y_centred_sq, lof)
+
         return lof
 
-    def find_bases(self, x: Float[np.ndarray, "N d"], y: Float[np.ndarray, "N"]) -> float:
+    def find_bases(self,
+                   x: Float[np.ndarray, "N d"],
+                   y: Float[np.ndarray, "N *k"],
+                   sorted_indices: Integer[np.ndarray, "N d"] | None = None) -> float:
         """
-        Find the best fitting basis functions for the given data.
+        Find the best fitting basis functions for the given data. Several response variables share the basis
+        functions, which are selected by the lack of fit criterion summed over them, and get a column of coefficients
+        each. All of them are solved with one Cholesky decomposition, see find_bases_per_target for separate basis
+        functions.
 
         Args:
             x: Predictor Variables.
-            y: Response Variables.
+            y: Response Variables, one column per response variable of several.
+            sorted_indices: Indices sorting each column of x in descending order. Computed if not given.
 
         Returns:
             Lack of fit criterion.
         """
-        self.y_mean = y.mean()
+        self.y_mean = y.mean(axis=0)
+        x = self._predictors(x)
+        if sorted_indices is None:
+            sorted_indices = self._sort_predictors(x)
         if self.backend is Backend.PYTHON:
-            lof = self._expand_bases(x, y)
-            lof = self._prune_bases(x, y, lof)
+            basis_cache = self.basis_cache
+            if basis_cache is None:
+                self.basis_cache = BasisCache()
+            try:
+                lof = self._expand_bases(x, y, sorted_indices)
+                lof = self._prune_bases(x, y, lof)
+            finally:
+                self.basis_cache = basis_cache
         elif self.backend is Backend.FORTRAN:
-            (lof, self.nbases, self.mask, self.truncated, self.cov, self.root,
-             self.coefficients) = fortran.backend.find_bases(x, y, self.y_mean, self.max_nbases,
-                                                             self.max_ncandidates,
-                                                             self.aging_factor, self.penalty)
+            # Fortran indexes from 1
+            (lof, self.nbases, self.mask, self.parent, self.truncated, self.cov, self.root, self.coefficients,
+             self.data_matrix_mean, covariance_matrix, rhs) = \
+                fortran.backend.find_bases(x, as_columns(y), sorted_indices + 1, np.atleast_1d(self.y_mean),
+                                           self.max_nbases, self.max_ncandidates, self.aging_factor, self.penalty,
+                                           self.minspan, self.endspan, self.max_nknots or 0,
+                                           self._workspace(*as_columns(y).shape).buffer)
             # Fortran indexes from 1 and has a fixed output size, therefore requires trimming in case of early stopping
+            self.parent -= 1
             self.cov -= 1
-            self.coefficients = self.coefficients[:self.nbases - 1]
+            self.coefficients = like_response(self.coefficients[:self.nbases - 1], y)
+            self.data_matrix_mean = self.data_matrix_mean[:self.nbases - 1]
+            covariance_matrix = covariance_matrix[:self.nbases - 1, :self.nbases - 1]
+            rhs = like_response(rhs[:self.nbases - 1], y)
+        elif self.backend is Backend.NUMBA:
+            (lof, self.nbases, self.mask, self.parent, self.truncated, self.cov, self.root, self.coefficients,
+             self.data_matrix_mean, covariance_matrix, rhs) = \
+                numba_backend.find_bases(x, as_columns(y), sorted_indices, np.atleast_1d(self.y_mean),
+                                         self.max_nbases, self.max_ncandidates, self.aging_factor, self.penalty,
+                                         self.minspan, self.endspan, self.max_nknots or 0)
+            self.coefficients, rhs = like_response(self.coefficients, y), like_response(rhs, y)
         else:
             raise NotImplementedError("Backend not implemented.")
 
+        if self.backend is not Backend.PYTHON:
+            # The Python backend keeps the statistics in _prune_bases
+            self._keep_statistics(covariance_matrix, rhs, len(y), np.sum((y - self.y_mean) ** 2), lof)
+
+        return lof
+
+    def find_bases_per_target(self, x: Float[np.ndarray, "N d"], y: Float[np.ndarray, "N k"]) -> list[Self]:
+        """
+        Find separate basis functions for every response variable, unlike find_bases, which shares them. The work on
+        the predictor variables is shared: they are converted and sorted once, the Fortran backend reuses one
+        workspace, and the Python backend one basis cache, so a basis found for several response variables is
+        evaluated once.
+
+        Args:
+            x: Predictor Variables.
+            y: Response Variables, one column per response variable.
+
+        Returns:
+            Model for every response variable.
+        """
+        x = self._predictors(x)
+        sorted_indices = self._sort_predictors(x)
+        workspace = self.workspace
+        if self.backend is Backend.FORTRAN and workspace is None:
+            workspace = Workspace(len(y), self.max_nbases)
+        basis_cache = self.basis_cache
+        if self.backend is Backend.PYTHON and basis_cache is None:
+            basis_cache = BasisCache()
+
+        models = []
+        for target in y.T:
+            model = self._unfitted(workspace=workspace, basis_cache=basis_cache)
+            model.find_bases(x, np.ascontiguousarray(target), sorted_indices)
+            model.workspace = self.workspace
+            model.basis_cache = self.basis_cache
+            models.append(model)
+
+        return models
+
+    def fit_path(self,
+                 x: Float[np.ndarray, "N d"],
+                 y: Float[np.ndarray, "N *k"],
+                 penalties: Iterable[float],
+                 sizes: Iterable[int] | None = None) -> dict[tuple[float, int], Self]:
+        """
+        Find the best fitting basis functions for several penalties and maximum numbers of basis functions with a
+        single forward pass. The forward pass for a smaller maximum number of basis functions is a prefix of the one
+        for a larger, and the penalty leaves the removal order of the backward pass unchanged. So every prefix is
+        pruned once, and the lack of fit criterion of each penalty picks its subset from the same removal order.
+        The forward pass runs with the penalty of the model, the model holds its unpruned result afterwards.
+
+        Args:
+            x: Predictor Variables.
+            y: Response Variables.
+            penalties: Penalties of the generalised cross validation.
+            sizes: Maximum numbers of basis functions, odd and at most max_nbases. None uses max_nbases only.
+
+        Returns:
+            Pruned model for every penalty and maximum number of basis functions.
+        """
+        sizes = [self.max_nbases] if sizes is None else list(sizes)
+        penalties = list(penalties)
+        assert all(size % 2 == 1 and size <= self.max_nbases for size in sizes), \
+            "Sizes should be odd and at most \"max_nbases\"."
+
+        self.y_mean = y.mean(axis=0)
+        x = self._predictors(x)
+        y_centred_sq = np.sum((y - self.y_mean) ** 2)
+        basis_cache = self.basis_cache
+        if self.backend is Backend.PYTHON and basis_cache is None:
+            self.basis_cache = BasisCache()
+        try:
+            self._expand_bases(x, y)
+            data_matrix, self.data_matrix_mean, covariance_matrix, rhs, chol, self.coefficients, lof = \
+                self._fit(x, y)
+            self._keep_statistics(covariance_matrix, rhs, len(y), y_centred_sq, lof)
+
+            models = {}
+            active = self._active_base_indices()
+            for size in sizes:
+                # Bases are added in pairs, the first size ones are the forward pass of this size
+                keep = np.flatnonzero(active < size)
+                removals, rss = self._removal_path(covariance_matrix[np.ix_(keep, keep)], rhs[keep], y_centred_sq)
+
+                for penalty in penalties:
+                    model = self._unfitted(max_nbases=size, max_ncandidates=min(self.max_ncandidates, size),
+                                           penalty=penalty)
+                    lofs = [model._lack_of_fit(rss[nremovals], len(keep) - nremovals, len(y))
+                            for nremovals in range(len(keep) + 1)]
+                    nremovals = int(np.argmin(lofs))
+
+                    model.nbases = len(keep) - nremovals + 1
+                    model.mask[active[keep]] = True
+                    model.mask[active[keep[removals[:nremovals]]]] = False
+                    model.parent = self.parent[:size].copy()
+                    model.truncated = self.truncated[:size].copy()
+                    model.cov = self.cov[:size].copy()
+                    model.root = self.root[:size].copy()
+                    model.y_mean = self.y_mean
+
+                    # The subset is solved on its part of the unpruned normal equations, in the order of the bases
+                    subset = keep[np.sort(removals[nremovals:])]
+                    model._solve_kept(covariance_matrix, rhs, self.data_matrix_mean, subset, y_centred_sq, len(y))
+                    model._keep_statistics(covariance_matrix[np.ix_(subset, subset)], rhs[subset], len(y),
+                                           y_centred_sq, lofs[nremovals])
+                    models[(penalty, size)] = model
+        finally:
+            self.basis_cache = basis_cache
+
+        return models
+
+    def cross_validate(self,
+                       x: Float[np.ndarray, "N d"],
+                       y: Float[np.ndarray, "N *k"],
+                       folds: int = 5,
+                       nthreads: int | None = None) -> tuple[Float[np.ndarray, "{folds}"], list[Self]]:
+        """
+        Estimate the prediction error of the model configuration by k-fold cross validation. The folds are contiguous
+        blocks of rows, so ordered data should be shuffled beforehand. The predictors are sorted once, and every fold
+        derives the sorted order of its training rows by filtering it. The folds are fitted concurrently on a thread
+        pool, the backends release the GIL during a fit. The threads of the backend are split between the concurrent
+        folds, and every thread of the pool reuses one workspace for its folds. On the workqueue threading layer of
+        Numba, which isn't thread-safe, the folds are fitted one after another. The rows of a fold are copied once,
+        in the memory layout of the predictors.
+
+        Args:
+            x: Predictor Variables.
+            y: Response Variables.
+            folds: Number of folds.
+            nthreads: Number of folds fitted at once. None fits all folds at once.
+
+        Returns:
+            Mean squared error on the held out rows of every fold, model fitted on the other rows of every fold.
+        """
+        assert 2 <= folds <= len(y), "Parameter \"folds\" should be at least 2 and at most the number of samples."
+        assert nthreads is None or nthreads >= 1, "Parameter \"nthreads\" should be positive."
+
+        x = self._predictors(x)
+        sorted_indices = self._sort_predictors(x)
+        fold_of_row = np.arange(len(y)) * folds // len(y)
+        nworkers = min(nthreads or folds, folds)
+        # Asked on the calling thread, which also starts the thread pool of the Numba backend there, a pool started
+        # on a worker thread can hang the interpreter at exit
+        max_threads = self._max_threads()
+        if self.backend is Backend.NUMBA and not numba_backend.threadsafe():
+            # The workqueue threading layer aborts on parallel regions of several Python threads
+            nworkers = 1
+        threads_per_fold = max(1, max_threads // nworkers)
+        max_ntrain = len(y) - np.bincount(fold_of_row).min()
+        worker = threading.local()
+
+        def rows(selected: Bool[np.ndarray, "N"]) -> Float[np.ndarray, "n d"]:
+            # Indexing returns C-ordered rows, so Fortran-ordered predictors are copied column by column instead
+            if x.flags.c_contiguous or not x.flags.f_contiguous:
+                return x[selected]
+            subset = np.empty((np.count_nonzero(selected), x.shape[1]), dtype=x.dtype, order="F")
+            for cov_idx in range(x.shape[1]):
+                np.compress(selected, x[:, cov_idx], out=subset[:, cov_idx])
+            return subset
+
+        def fit_fold(fold: int) -> tuple[float, Self]:
+            if not hasattr(worker, "workspace"):
+                self._limit_threads(threads_per_fold)
+                worker.workspace = Workspace(max_ntrain, self.max_nbases, as_columns(y).shape[1]) \
+                    if self.backend is Backend.FORTRAN else None
+
+            train = fold_of_row != fold
+            # Filtering keeps the descending order, the kept rows are renumbered within the training rows
+            renumbered = np.cumsum(train) - 1
+            kept = train[sorted_indices]
+            fold_sorted_indices = renumbered[sorted_indices.T[kept.T]].reshape(x.shape[1], -1).T
+
+            model = self._unfitted(workspace=worker.workspace, basis_cache=None)
+            model.find_bases(rows(train), y[train], fold_sorted_indices)
+            model.workspace = self.workspace
+            return float(np.mean((model(rows(~train)) - y[~train]) ** 2)), model
+
+        with ThreadPoolExecutor(nworkers) as executor:
+            scores, models = zip(*executor.map(fit_fold, range(folds)))
+
+        return np.array(scores), list(models)
+
+    def _unfitted(self, **changes: Any) -> Self:
+        """
+        Create an unfitted model with the parameters of this one.
+
+        Args:
+            changes: Parameters of OMAR.__init__ that differ from this model.
+
+        Returns:
+            Unfitted model.
+        """
+        parameters = dict(max_nbases=self.max_nbases, max_ncandidates=self.max_ncandidates,
+                          aging_factor=self.aging_factor, penalty=self.penalty, minspan=self.minspan,
+                          endspan=self.endspan, max_nknots=self.max_nknots, workspace=self.workspace,
+                          basis_cache=self.basis_cache, dtype=self.dtype, copy_warning=self.copy_warning,
+                          backend=self.backend)
+        parameters.update(changes)
+        return OMAR(**parameters)
+
+    def compile(self, nthreads: int | None = None, dtype: type[np.floating] | None = None) -> "FrozenOMAR":
+        """
+        Freeze the fitted model for prediction. The frozen model predicts like the model, but it doesn't build the
+        data matrix.
+
+        Args:
+            nthreads: Number of threads of the prediction. None uses one per CPU.
+            dtype: Precision of the basis functions, np.float32 predicts from single precision predictor variables
+            without converting them on every backend. None uses the precision of the model.
+
+        Returns:
+            Frozen model.
+        """
+        assert self.mean_keys == self._active_basis_keys(), "The model should be fitted by find_bases first."
+
+        terms = [list(self._basis_key(basis_idx)) for basis_idx in self._active_base_indices()]
+        # The centring of the basis functions is a constant shift of the prediction
+        intercept = self.y_mean - self.data_matrix_mean @ self.coefficients
+        return FrozenOMAR(intercept, self.coefficients.copy(), terms, dtype or self.dtype, nthreads)
+
+    def _chunked_roots(self,
+                       chunks: Iterable[tuple[Float[np.ndarray, "n d"], Float[np.ndarray, "n *k"]]],
+                       n_samples: int) -> list[Float[np.ndarray, "k"]]:
+        """
+        Place the candidate roots of every covariate on a quantile grid of an evenly strided sample of the rows.
+
+        Args:
+            chunks: Row chunks of the predictor and response variables.
+            n_samples: Total number of samples.
+
+        Returns:
+            Ascending candidate roots per covariate.
+        """
+        stride = max(1, n_samples // KNOT_SAMPLE_SIZE)
+        offset = 0
+        samples = []
+        for x, y in chunks:
+            samples.append(np.asarray(x[(-offset) % stride::stride], dtype=float))
+            offset += len(y)
+        sample = np.sort(np.concatenate(samples), axis=0)
+
+        nknots = min(self.max_nknots or CHUNKED_NKNOTS, len(sample))
+        grid = np.arange(nknots)
+        return [np.unique(column[((2 * grid + 1) * len(sample)) // (2 * nknots)]) for column in sample.T]
+
+    def _chunked_basis_matrix(self, x: Float[np.ndarray, "n d"]) -> Float[np.ndarray, "n {self.nbases}-1"]:
+        """
+        Evaluate the active basis functions on a chunk, without centring.
+
+        Args:
+            x: Predictor variables of the chunk.
+
+        Returns:
+            Uncentred data matrix of the chunk.
+        """
+        if self.nbases == 1:
+            return np.empty((len(x), 0))
+        if self.backend in (Backend.FORTRAN, Backend.NUMBA):
+            # Chunks are transient, converting them is expected and not reported
+            x = np.asfortranarray(x, dtype=np.float64)
+        data_matrix, data_matrix_mean = self._data_matrix(x, self._active_base_indices())
+        return data_matrix + data_matrix_mean
+
+    def _expand_bases_chunked(self,
+                              chunks: Iterable[tuple[Float[np.ndarray, "n d"], Float[np.ndarray, "n *k"]]],
+                              roots: list[Float[np.ndarray, "k"]],
+                              n_samples: int,
+                              y_centred_sq: float) -> float:
+        """
+        Forward pass on row chunks. Every iteration traverses the chunks once and accumulates, per parent and
+        covariate pair, the sums of the parent times the data matrix, the covariate and the response variables
+        between neighbouring candidate roots. Cumulated from the largest root downwards, they yield the normal
+        equations of every root without revisiting the rows. The Cholesky decomposition of the current model is
+        computed once per iteration and bordered with the two new columns of every root, see _chunked_root_lofs.
+
+        Args:
+            chunks: Row chunks of the predictor and response variables.
+            roots: Ascending candidate roots per covariate.
+            n_samples: Total number of samples.
+            y_centred_sq: Squared norm of the centred response variables.
+
+        Returns:
+            Lack of fit criterion
+        """
+        self.nbases = 1
+        self.mask = np.zeros(self.max_nbases, dtype=bool)
+        self.parent = np.zeros(self.max_nbases, dtype=int)
+        self.truncated = np.zeros(self.max_nbases, dtype=bool)
+        self.cov = np.zeros(self.max_nbases, dtype=int)
+        self.root = np.zeros(self.max_nbases, dtype=float)
+
+        y_mean = np.atleast_1d(self.y_mean)
+        nresponses = len(y_mean)
+        lof = self._lack_of_fit(y_centred_sq, 0, n_samples)
+        candidate_queue = [0.]  # One for the constant function
+        for iteration in range(self.max_nbases // 2):
+            nprev = self.nbases - 1
+            # Sums per root interval: parent * data matrix * x, parent * data matrix, parent^2 * x^2,
+            # parent^2 * x, parent^2, parent * x, parent, parent * x * y, parent * y with one column per response
+            # variable each
+            nsums = 2 * nprev + 5 + 2 * nresponses
+
+            parent_order = np.argsort(candidate_queue)
+            parents = parent_order[:min(self.max_ncandidates, self.nbases)]
+            pairs = {cov_idx: [i for i, parent in enumerate(parents)
+                               if cov_idx not in {cov for cov, _, _ in self._basis_key(parent)}]
+                     for cov_idx in range(len(roots))}
+            sums = {cov_idx: np.zeros((len(roots[cov_idx]) + 1, nsums * len(indices)))
+                    for cov_idx, indices in pairs.items()}
+            basis_gram = np.zeros((nprev, nprev))
+            basis_sum = np.zeros(nprev)
+            basis_y = np.zeros((nprev, nresponses))
+
+            for x, y in chunks:
+                y = as_columns(y)
+                basis_matrix = self._chunked_basis_matrix(x)
+                basis_gram += double_precision_product(basis_matrix, basis_matrix)
+                basis_sum += basis_matrix.sum(axis=0, dtype=float)
+                basis_y += double_precision_product(basis_matrix, y)
+
+                for cov_idx, indices in pairs.items():
+                    if not indices:
+                        continue
+                    covariate = np.asarray(x[:, cov_idx], dtype=float)
+                    intervals = np.searchsorted(roots[cov_idx], covariate)
+                    indicator = sparse.csr_matrix((np.ones(len(y)), (intervals, np.arange(len(y)))),
+                                                  shape=(len(roots[cov_idx]) + 1, len(y)))
+                    columns = []
+                    for i in indices:
+                        parent_column = basis_matrix[:, parents[i] - 1] if parents[i] != 0 else np.ones(len(y))
+                        parent_x = parent_column * covariate
+                        columns.extend([parent_x[:, None] * basis_matrix, parent_column[:, None] * basis_matrix,
+                                        np.column_stack([parent_x ** 2, parent_column * parent_x,
+                                                         parent_column ** 2, parent_x, parent_column]),
+                                        parent_x[:, None] * y, parent_column[:, None] * y])
+                    sums[cov_idx] += indicator @ np.hstack(columns)
+
+            # Normal equations of the current model, shared by all pairs
+            chol = linalg.cholesky(basis_gram - np.outer(basis_sum, basis_sum) / n_samples + np.eye(nprev) * 1e-8,
+                                   lower=True)
+            solution = linalg.solve_triangular(chol, basis_y - np.outer(basis_sum, y_mean), lower=True)
+
+            best_lof = np.inf
+            best_cov = None
+            best_root = None
+            best_parent = None
+            basis_lofs = [np.inf] * len(parents)
+
+            for cov_idx, indices in pairs.items():
+                for k, i in enumerate(indices):
+                    root_lofs = self._chunked_root_lofs(sums[cov_idx][:, k * nsums:(k + 1) * nsums], roots[cov_idx],
+                                                        chol, solution, basis_sum, n_samples, y_centred_sq)
+                    root_idx = np.argmin(root_lofs)
+                    basis_lofs[i] = min(basis_lofs[i], root_lofs[root_idx])
+                    if root_lofs[root_idx] < best_lof:
+                        best_lof = root_lofs[root_idx]
+                        best_cov = cov_idx
+                        best_root = float(roots[cov_idx][root_idx])
+                        best_parent = parents[i]
+            for i in range(len(candidate_queue)):
+                if i < len(basis_lofs):
+                    candidate_queue[parent_order[i]] = basis_lofs[i] - best_lof
+                else:
+                    candidate_queue[parent_order[i]] -= self.aging_factor
+
+            if best_cov is not None:
+                self.nbases += 2
+                self._add_bases(int(best_parent), best_cov, best_root)
+                candidate_queue.extend([0, 0])
+                lof = best_lof
+            else:
+                print(f"Cannot find additional bases in iteration {iteration}.")
+                break
+
+        return lof
+
+    def _chunked_root_lofs(self,
+                           pair_sums: Float[np.ndarray, "r+1 s"],
+                           roots: Float[np.ndarray, "r"],
+                           chol: Float[np.ndarray, "m m"],
+                           solution: Float[np.ndarray, "m k"],
+                           basis_sum: Float[np.ndarray, "m"],
+                           n_samples: int,
+                           y_centred_sq: float) -> Float[np.ndarray, "r"]:
+        """
+        Calculate the lack of fit criterion of every root of a parent and covariate pair from the interval sums of
+        the chunked forward pass. The Cholesky decomposition of the current model is bordered by the two new columns,
+        like in _append_fit, for all roots at once: one triangular solve yields the border of every root, and the
+        2 x 2 Schur complements are factorised in closed form. This costs O(m^2) per root instead of O(m^3).
+
+        Args:
+            pair_sums: Sums of the pair per root interval, see _expand_bases_chunked.
+            roots: Ascending candidate roots of the covariate.
+            chol: Cholesky decomposition of the covariance matrix of the current model.
+            solution: Forward substitution of the right hand side of the current model, one column per response
+            variable.
+            basis_sum: Column sums of the uncentred data matrix of the current model.
+            n_samples: Total number of samples.
+            y_centred_sq: Squared norm of the centred response variables.
+
+        Returns:
+            Lack of fit criterion per root, infinite for roots outside the support of the parent.
+        """
+        nprev = len(basis_sum)
+        nresponses = solution.shape[1]
+        y_mean = np.atleast_1d(self.y_mean)
+        x2, px, p2, x1, p1 = range(2 * nprev, 2 * nprev + 5)
+        xy = slice(2 * nprev + 5, 2 * nprev + 5 + nresponses)
+        py = slice(2 * nprev + 5 + nresponses, 2 * nprev + 5 + 2 * nresponses)
+
+        total = pair_sums.sum(axis=0)
+        # Rows above each root, the first interval lies below all roots
+        above = np.cumsum(pair_sums[::-1], axis=0)[::-1][1:]
+        # Roots outside the support of the parent duplicate the linear basis function
+        valid = (above[:, p2] != 0) & (above[:, p2] != total[p2])
+
+        # Centred normal equations of the linear and the hinge column
+        linear_sum = total[x1]
+        hinge_sum = above[:, x1] - roots * above[:, p1]
+        linear_cross = total[:nprev] - basis_sum * linear_sum / n_samples
+        hinge_cross = (above[:, :nprev] - roots[:, None] * above[:, nprev:2 * nprev]
+                       - np.outer(hinge_sum, basis_sum) / n_samples)
+        linear_sq = total[x2] - linear_sum ** 2 / n_samples + 1e-8
+        cross = above[:, x2] - roots * above[:, px] - linear_sum * hinge_sum / n_samples
+        hinge_sq = (above[:, x2] - 2 * roots * above[:, px] + roots ** 2 * above[:, p2] - hinge_sum ** 2 / n_samples
+                    + 1e-8)
+        linear_rhs = total[xy] - linear_sum * y_mean
+        hinge_rhs = above[:, xy] - roots[:, None] * above[:, py] - np.outer(hinge_sum, y_mean)
+
+        # Border of the Cholesky decomposition and the 2 x 2 Schur complement per root
+        linear_border = linalg.solve_triangular(chol, linear_cross, lower=True)
+        hinge_border = linalg.solve_triangular(chol, hinge_cross.T, lower=True)
+        linear_diag_sq = linear_sq - linear_border @ linear_border
+        if linear_diag_sq <= 0:
+            return np.full(len(roots), np.inf)
+        linear_diag = np.sqrt(linear_diag_sq)
+        off_diag = (cross - linear_border @ hinge_border) / linear_diag
+        hinge_diag_sq = hinge_sq - np.sum(hinge_border ** 2, axis=0) - off_diag ** 2
+        valid &= hinge_diag_sq > 0
+        hinge_diag = np.sqrt(np.where(valid, hinge_diag_sq, 1.))
+
+        # Forward and backward substitution of the bordered system
+        linear_solution = (linear_rhs - linear_border @ solution) / linear_diag
+        hinge_solution = ((hinge_rhs - hinge_border.T @ solution - off_diag[:, None] * linear_solution)
+                          / hinge_diag[:, None])
+        hinge_coefficients = hinge_solution / hinge_diag[:, None]
+        linear_coefficients = (linear_solution - off_diag[:, None] * hinge_coefficients) / linear_diag
+        prev_solution = (solution[:, None, :] - linear_border[:, None, None] * linear_coefficients
+                         - hinge_border[:, :, None] * hinge_coefficients)
+        prev_coefficients = linalg.solve_triangular(chol, prev_solution.reshape(nprev, len(roots) * nresponses),
+                                                   lower=True, trans="T")
+
+        # The coefficients solve the normal equations, so coefficients^T rhs is the squared norm of the solution
+        rss = (y_centred_sq - np.sum(solution ** 2) - np.sum(linear_solution ** 2) - np.sum(hinge_solution ** 2, axis=1)
+               - 1e-8 * (np.sum(prev_coefficients.reshape(nprev, len(roots), nresponses) ** 2, axis=(0, 2))
+                         + np.sum(linear_coefficients ** 2, axis=1) + np.sum(hinge_coefficients ** 2, axis=1)))
+        lofs = self._lack_of_fit(np.maximum(rss, 0.), nprev + 2, n_samples)
+        return np.where(valid, lofs, np.inf)
+
+    def _normal_equations_chunked(self,
+                                  chunks: Iterable[tuple[Float[np.ndarray, "n d"], Float[np.ndarray, "n *k"]]],
+                                  n_samples: int) \
+            -> tuple[
+                Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
+                Float[np.ndarray, "{self.nbases}-1 *k"],
+                Float[np.ndarray, "{self.nbases}-1"]
+            ]:
+        """
+        Accumulate the normal equations of the active basis functions over row chunks.
+
+        Args:
+            chunks: Row chunks of the predictor and response variables.
+            n_samples: Total number of samples.
+
+        Returns:
+            Covariance matrix, right hand side of the normal equations, mean of the data matrix.
+        """
+        nbases = len(self._active_base_indices())
+        covariance_matrix = np.zeros((nbases, nbases))
+        basis_sum = np.zeros(nbases)
+        rhs = np.zeros((nbases,) + np.shape(self.y_mean))
+        for x, y in chunks:
+            basis_matrix = self._chunked_basis_matrix(x)
+            covariance_matrix += double_precision_product(basis_matrix, basis_matrix)
+            basis_sum += basis_matrix.sum(axis=0, dtype=float)
+            rhs += double_precision_product(basis_matrix, y)
+
+        covariance_matrix -= np.outer(basis_sum, basis_sum) / n_samples
+        covariance_matrix += np.eye(nbases) * 1e-8
+        rhs -= np.multiply.outer(basis_sum, self.y_mean)
+
+        return covariance_matrix, rhs, basis_sum / n_samples
+
+    def find_bases_chunked(self, chunks: Iterable[tuple[Float[np.ndarray, "n d"], Float[np.ndarray, "n *k"]]]) \
+            -> float:
+        """
+        Find the best fitting basis functions for data that does not fit into memory. Only sufficient statistics are
+        kept, every iteration of the forward pass and the backward pass traverse the chunks once. The candidate
+        roots are the quantiles of a row sample, max_nknots per covariate (100 if unset). Therefore, minspan and
+        endspan do not apply. The sums over the chunks are accumulated with NumPy on every backend, the backend
+        evaluates the basis functions on the chunks and prunes the normal equations.
+
+        Args:
+            chunks: Row chunks of the predictor and response variables, e.g. from row_chunks. It is traversed
+            repeatedly, so it has to be a collection rather than an iterator. Several response variables share the
+            basis functions like in find_bases.
+
+        Returns:
+            Lack of fit criterion.
+        """
+        assert not isinstance(chunks, Iterator), "Chunks are traversed repeatedly and cannot be an iterator."
+
+        n_samples = 0
+        y_sum = 0.
+        y_sq = 0.
+        for x, y in chunks:
+            n_samples += len(y)
+            y_sum = y_sum + y.sum(axis=0, dtype=float)
+            y_sq += np.sum(np.square(y, dtype=float))
+        self.y_mean = y_sum / n_samples
+        # Summed over the response variables
+        y_centred_sq = y_sq - n_samples * np.sum(self.y_mean ** 2)
+
+        roots = self._chunked_roots(chunks, n_samples)
+        lof = self._expand_bases_chunked(chunks, roots, n_samples, y_centred_sq)
+
+        covariance_matrix, rhs, data_matrix_mean = self._normal_equations_chunked(chunks, n_samples)
+        keep = self._prune_normal_equations(covariance_matrix, rhs, y_centred_sq, n_samples, lof)
+        lof = self._solve_kept(covariance_matrix, rhs, data_matrix_mean, keep, y_centred_sq, n_samples)
+        self._keep_statistics(covariance_matrix[np.ix_(keep, keep)], rhs[keep], n_samples, y_centred_sq, lof)
+
         return lof
 
+    def _keep_statistics(self,
+                         covariance_matrix: Float[np.ndarray, "{self.nbases}-1 {self.nbases}-1"],
+                         rhs: Float[np.ndarray, "{self.nbases}-1 *k"],
+                         n_samples: int,
+                         y_centred_sq: float,
+                         lof: float) -> None:
+        """
+        Keep the sufficient statistics of a basis search, which partial_fit updates with new samples. The training
+        means of the data matrix are set by then and belong to the active basis functions.
+
+        Args:
+            covariance_matrix: Covariance matrix of the active basis functions.
+            rhs: Right hand side of the normal equations.
+            n_samples: Number of samples.
+            y_centred_sq: Squared norm of the centred response variables.
+            lof: Lack of fit criterion of the search.
+        """
+        self.covariance_matrix = covariance_matrix
+        self.rhs = rhs
+        self.mean_keys = self._active_basis_keys()
+        self.n_samples = n_samples
+        self.y_centred_sq = float(y_centred_sq)
+        self.search_lof = float(lof)
+
+    def partial_fit(self, x: Float[np.ndarray, "n d"], y: Float[np.ndarray, "n *k"], drift: float = 0.1,
+                    min_samples: int = 50) -> float:
+        """
+        Update the fit with new samples without searching the basis functions again. The normal equations of the new
+        samples are merged into the kept ones, which costs O(n*m^2 + m^3) and doesn't need the previous samples.
+        If the lack of fit criterion grows by more than drift relative to the last basis search, the backward pass is
+        repeated on the accumulated normal equations, starting from the current basis functions. If the lack of fit
+        criterion still exceeds the threshold and the batch has at least min_samples samples, the forward pass
+        continues from the current basis functions on the new samples, followed by the backward pass. New basis
+        functions need the samples themselves, so the statistics then restart from the new samples. Smaller batches
+        keep the accumulated statistics, so a few outliers cannot discard the history. An unfitted model is fitted on
+        the new samples.
+
+        Args:
+            x: Predictor variables of the new samples.
+            y: Response variables of the new samples.
+            drift: Relative growth of the lack of fit criterion that triggers a new backward and forward pass.
+            min_samples: Minimum number of new samples for a new forward pass.
+
+        Returns:
+            Lack of fit criterion.
+        """
+        assert drift >= 0, "Parameter \"drift\" should be non-negative."
+        assert min_samples >= 1, "Parameter \"min_samples\" should be positive."
+        if self.n_samples == 0:
+            return self.find_bases(x, y)
+
+        x = self._predictors(x)
+        n_samples = self.n_samples + len(y)
+        y_mean = y.mean(axis=0)
+        y_shift = y_mean - self.y_mean
+        # Merge the centred sums of both sample sets, shifted to the common means
+        weight = self.n_samples * len(y) / n_samples
+        self.y_centred_sq += np.sum((y - y_mean) ** 2) + weight * np.sum(y_shift ** 2)
+        self.y_mean = self.y_mean + len(y) / n_samples * y_shift
+        self.n_samples = n_samples
+
+        active = self._active_base_indices()
+        if len(active) != 0:
+            data_matrix, data_matrix_mean = self._data_matrix(x, active)
+            mean_shift = data_matrix_mean - self.data_matrix_mean
+            self.covariance_matrix = (self.covariance_matrix + double_precision_product(data_matrix, data_matrix)
+                                      + weight * np.outer(mean_shift, mean_shift))
+            self.rhs = (self.rhs + double_precision_product(data_matrix, y - y_mean)
+                        + weight * np.multiply.outer(mean_shift, y_shift))
+            self.data_matrix_mean = self.data_matrix_mean + len(y) / n_samples * mean_shift
+
+            self.coefficients, chol = self._coefficients(self.covariance_matrix, self.rhs)
+            lof = self._fast_generalised_cross_validation(self.y_centred_sq, n_samples, self.rhs, chol)
+        else:
+            lof = self._lack_of_fit(self.y_centred_sq, 0, n_samples)
+
+        threshold = (1 + drift) * self.search_lof
+        if lof > threshold and len(active) != 0:
+            keep = self._prune_normal_equations(self.covariance_matrix, self.rhs, self.y_centred_sq, n_samples, lof)
+            lof = self._solve_kept(self.covariance_matrix, self.rhs, self.data_matrix_mean, keep, self.y_centred_sq,
+                                   n_samples)
+            self.covariance_matrix = self.covariance_matrix[np.ix_(keep, keep)]
+            self.rhs = self.rhs[keep]
+        if lof > threshold and len(y) >= min_samples:
+            self.y_mean = y.mean(axis=0)
+            basis_cache = self.basis_cache
+            if self.backend is Backend.PYTHON and basis_cache is None:
+                self.basis_cache = BasisCache()
+            try:
+                lof = self._expand_bases(x, y, warm_start=True)
+                lof = self._prune_bases(x, y, lof)
+            finally:
+                self.basis_cache = basis_cache
+
+        return lof
+
+
+class FrozenOMAR:
+    """
+    Fitted OMAR model compiled for prediction, see OMAR.compile. The basis functions are a table of their hinges, and
+    the means of the basis functions on the training data are folded into the intercept. Predictions are evaluated
+    in row tiles on a thread pool, so the memory doesn't grow with the number of rows and no data matrix is built.
+    """
+
+    def __init__(self,
+                 intercept: float | Float[np.ndarray, "k"],
+                 coefficients: Float[np.ndarray, "m *k"],
+                 terms: list[list[tuple[int, float, bool]]],
+                 dtype: type[np.floating] = np.float64,
+                 nthreads: int | None = None):
+        """
+        Initialize the frozen model.
+
+        Args:
+            intercept: Prediction if all basis functions are zero, one per response variable of several.
+            coefficients: Coefficients of the basis functions, one column per response variable of several.
+            terms: Covariate, root and truncation of every hinge of every basis function.
+            dtype: Precision of the basis functions, the prediction is accumulated in double precision.
+            nthreads: Number of threads. None uses one per CPU.
+        """
+        assert len(coefficients) == len(terms), "Every basis function should have a coefficient."
+        assert nthreads is None or nthreads >= 1, "Parameter \"nthreads\" should be positive."
+
+        self.intercept = intercept
+        self.coefficients = coefficients
+        self.terms = terms
+        self.dtype = dtype
+        self.nthreads = nthreads or os.cpu_count() or 1
+        # The pool lives as long as the model, its threads are started on the first prediction that needs them
+        self.executor = ThreadPoolExecutor(self.nthreads) if self.nthreads > 1 else None
+
+    def __getstate__(self) -> dict:
+        # The thread pool can't be pickled or copied, every copy starts its own
+        state = self.__dict__.copy()
+        del state["executor"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.executor = ThreadPoolExecutor(self.nthreads) if self.nthreads > 1 else None
+
+    def __call__(self, x: Float[np.ndarray, "N d"]) -> Float[np.ndarray, "N *k"]:
+        """
+        Predict the response variables for the given predictor variables.
+
+        Args:
+            x: Predictor variables.
+
+        Returns:
+            Predicted response variables.
+        """
+        x = x.astype(self.dtype, copy=False)
+        pred = np.empty((len(x),) + np.shape(self.intercept))
+        starts = range(0, len(x), PREDICTION_TILE_SIZE)
+        if self.executor is None or len(starts) <= 1:
+            for start in starts:
+                self._predict_tile(x, pred, start)
+        else:
+            # NumPy releases the GIL in the vector operations of the tiles
+            list(self.executor.map(functools.partial(self._predict_tile, x, pred), starts))
+        return pred
+
+    def _predict_tile(self, x: Float[np.ndarray, "N d"], pred: Float[np.ndarray, "N *k"], start: int) -> None:
+        """
+        Predict one tile of rows.
+
+        Args:
+            x: Predictor variables.
+            pred: Predicted response variables, the tile is written in place.
+            start: First row of the tile.
+        """
+        tile = x[start:start + PREDICTION_TILE_SIZE]
+        tile_pred = np.full((len(tile),) + np.shape(self.intercept), self.intercept)
+        basis = np.empty(len(tile), dtype=self.dtype)
+        hinge = np.empty(len(tile), dtype=self.dtype)
+        for coefficient, term in zip(self.coefficients, self.terms):
+            basis.fill(1)
+            for cov, root, truncated in term:
+                np.subtract(tile[:, cov], root, out=hinge)
+                if truncated:
+                    np.maximum(0, hinge, out=hinge)
+                basis *= hinge
+            tile_pred += np.multiply.outer(basis, coefficient)
+        pred[start:start + len(tile)] = tile_pred
+
+
+def row_chunks(x: Float[np.ndarray, "N d"], y: Float[np.ndarray, "N *k"], chunk_size: int = 2 ** 16) \
+        -> list[tuple[Float[np.ndarray, "n d"], Float[np.ndarray, "n *k"]]]:
+    """
+    Split the data into row chunks for OMAR.find_bases_chunked. The chunks are views, so memory-mapped arrays are only
+    read while a chunk is processed.
+
+    Args:
+        x: Predictor variables, e.g. a np.memmap.
+        y: Response variables, e.g. a np.memmap.
+        chunk_size: Number of rows per chunk.
+
+    Returns:
+        Row chunks of the predictor and response variables.
+    """
+    return [(x[start:start + chunk_size], y[start:start + chunk_size]) for start in range(0, len(y), chunk_size)]
+
+
+def double_precision_product(left: Float[np.ndarray, "N *a"], right: Float[np.ndarray, "N *b"]) \
+        -> Float[np.ndarray, "..."]:
+    """
+    Calculate left.T @ right in double precision. Single precision operands are widened block by block, so they are
+    read from memory at their own width without accumulating the sum in single precision.
+
+    Args:
+        left: Left operand, a matrix or a vector.
+        right: Right operand, a matrix or a vector.
+
+    Returns:
+        Product of the transposed left and the right operand.
+    """
+    if left.dtype == np.float64 and right.dtype == np.float64:
+        return left.T @ right
+
+    product = np.zeros(left.shape[1:] + right.shape[1:])
+    for start in range(0, left.shape[0], ROW_BLOCK_SIZE):
+        block = slice(start, start + ROW_BLOCK_SIZE)
+        product += left[block].T.astype(float) @ right[block].astype(float)
+    return product
+
+
+def as_columns(array: Float[np.ndarray, "n *k"]) -> Float[np.ndarray, "n k"]:
+    """
+    View the response variables, or an array with an entry for each of them, as one column per response variable,
+    the layout of the compiled backends. A single response variable becomes a view with one column, so the backends
+    still update it in place.
+
+    Args:
+        array: Array of one or several response variables.
+
+    Returns:
+        Two-dimensional view of the array.
+    """
+    return array if array.ndim == 2 else array[:, np.newaxis]
+
+
+def like_response(array: Float[np.ndarray, "n k"], y: Float[np.ndarray, "N *k"]) -> Float[np.ndarray, "n *k"]:
+    """
+    View an array with one column per response variable in the shape of the response variables, the inverse of
+    as_columns.
+
+    Args:
+        array: Array with one column per response variable.
+        y: Response variables.
+
+    Returns:
+        The array, one-dimensional for a single response variable.
+    """
+    return array if y.ndim == 2 else array[:, 0]
+
+
+def lower_triangle(matrix: Float[np.ndarray, "m m"]) -> Float[np.ndarray, "m m"]:
+    """
+    Zero the upper triangle of a Cholesky decomposition in place. Unlike np.tril, the memory layout is kept, so
+    Fortran-ordered factors are passed to the next update without a copy.
+
+    Args:
+        matrix: Square matrix.
+
+    Returns:
+        The matrix with zeros above the diagonal.
+    """
+    matrix[np.triu_indices_from(matrix, 1)] = 0
+    return matrix
+
 
-@njit(cache=True, fastmath=True, error_model="numpy")
+@lazy_njit(cache=True, fastmath=True, error_model="numpy")
 def decompose_addition(covariance_addition: Float[np.ndarray, "{self.nbases}-1"]) \
         -> tuple[Float[np.ndarray, "2"], Float[np.ndarray, "2 {self.nbases}-1"]]:
     """
@@ -859,7 +2756,7 @@ def decompose_addition(covariance_addition: Float[np.ndarray, "{self.nbases}-1"]
     return eigenvalues, eigenvectors
 
 
-@njit(cache=True, error_model="numpy", fastmath=True, parallel=False)
+@lazy_njit(cache=True, error_model="numpy", fastmath=True, parallel=False)
 def update_cholesky(chol: Float[np.ndarray, "{self.nbases} {self.nbases}"],
                     update_vector: Float[np.ndarray, "{self.nbases}"],
                     multiplier: float) -> Float[np.ndarray, "{self.nbases} {self.nbases}"]:
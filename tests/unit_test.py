@@ -1,4 +1,10 @@
+import os
+import subprocess
+import sys
+import warnings
+
 import numpy as np
+import pytest
 from scipy.linalg import cho_factor
 from copy import deepcopy
 
@@ -34,6 +40,80 @@ def test_getitem():
     assert model[0] == model
 
 
+def test_predictors():
+    x, y, y_true = utils.generate_data()
+
+    model = omar.OMAR(backend=omar.Backend.FORTRAN)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        fortran_x = model._predictors(x)
+        assert model._predictors(fortran_x) is fortran_x, "Passed through"
+    assert fortran_x.flags.f_contiguous and fortran_x.dtype == np.float64, "Layout"
+    assert np.array_equal(fortran_x, x), "Values"
+
+    model = omar.OMAR(copy_warning=True, backend=omar.Backend.FORTRAN)
+    with pytest.warns(UserWarning, match="Copying predictor variables"):
+        model._predictors(x)
+
+    model = omar.OMAR(dtype=np.float32, backend=omar.Backend.PYTHON)
+    assert model._predictors(x).dtype == np.float32, "Precision"
+
+
+def test_lazy_import():
+    # A fresh interpreter, since the test session has imported everything already
+    code = """
+import sys
+import numpy as np
+import omar
+
+model = omar.OMAR(backend=omar.Backend.PYTHON)
+model.nbases = 3
+model.mask[1:3] = True
+model.truncated[2] = True
+model.root[2] = 2.
+model.coefficients = np.ones(2)
+model(np.random.normal(2, 1, size=(10, 2)))
+print(" ".join(name for name in sys.modules if name.split(".")[0] in ("numba", "scipy") or "fortran_backend" in name))
+"""
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "", f"Prediction imported {result.stdout}"
+
+
+def test_lazy_import_error():
+    module = omar.LazyModule("omar_missing_backend", "omar_missing_build.backend")
+    with pytest.raises(ImportError, match="omar_missing_backend") as error:
+        module.load()
+    assert "omar_missing_build" in str(error.value), "Messages of all candidates"
+    assert isinstance(error.value.__cause__, ModuleNotFoundError), "Chained cause"
+    assert error.value.__cause__.name == "omar_missing_backend", "Preferred candidate"
+
+
+def test_production_mode():
+    # Fresh interpreters import the package with and without production mode
+    code = """
+import numpy as np
+import OMAR
+
+model = OMAR.OMAR()
+for name, call in (("public", lambda: model(np.ones(10))), ("private", lambda: model._predictors(np.ones(10)))):
+    try:
+        call()
+        print(name, "unchecked")
+    except Exception as error:
+        print(name, type(error).__name__)
+"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    outcomes = {}
+    for production in ("0", "1"):
+        env = dict(os.environ, OMAR_PRODUCTION=production, PYTHONPATH=root)
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env,
+                                cwd=root)
+        outcomes[production] = dict(line.split() for line in result.stdout.strip().splitlines())
+
+    assert outcomes["1"] == {"public": "TypeCheckError", "private": "unchecked"}, f"Production {outcomes['1']}"
+    assert outcomes["0"]["public"] != "TypeCheckError", f"Default {outcomes['0']}"
+
+
 def test_active_base_indices():
     model = utils.reference_model(utils.generate_data()[0])
 
@@ -123,6 +203,27 @@ def test_generalised_cross_validation():
         assert gcv[backend] < 1.0, f"{backend} Backend"
 
     assert np.allclose(gcv[omar.Backend.FORTRAN], gcv[omar.Backend.PYTHON]), "Unaligned Backends"
+    assert np.allclose(gcv[omar.Backend.NUMBA], gcv[omar.Backend.PYTHON]), "Unaligned Backends"
+
+
+def test_fast_generalised_cross_validation():
+    x, y, y_true = utils.generate_data()
+    model = utils.reference_model(x)
+    ref_data_matrix, ref_data_matrix_mean = utils.reference_data_matrix(x)
+    ref_rhs = utils.reference_rhs(y, ref_data_matrix)
+    ref_cov_matrix = utils.reference_covariance_matrix(ref_data_matrix)
+    ref_chol = np.tril(cho_factor(ref_cov_matrix, lower=True)[0])
+    ref_coefficients = np.linalg.solve(ref_cov_matrix, ref_rhs)
+
+    model.y_mean = y.mean()
+    model.coefficients = ref_coefficients
+    y_centred_sq = np.sum((y - y.mean()) ** 2)
+
+    for backend in omar.Backend:
+        model.backend = backend
+        ref_gcv = model._generalised_cross_validation(y, ref_data_matrix, ref_chol)
+        gcv = model._fast_generalised_cross_validation(y_centred_sq, len(y), ref_rhs, ref_chol)
+        assert np.allclose(ref_gcv, gcv), f"{backend} Backend"
 
 
 def test_fit():
@@ -147,6 +248,41 @@ def test_fit():
         assert np.allclose(ref_coefficients, coefficients), f"{backend} Backend: Coefficients"
 
 
+def test_append_fit():
+    x, y, y_true = utils.generate_data()
+    model = utils.reference_model(x)
+    model.y_mean = y.mean()
+    y_centred_sq = np.sum((y - y.mean()) ** 2)
+
+    for backend in omar.Backend:
+        model.backend = backend
+        for nbases in [3, 5]:
+            full_model = deepcopy(model)
+            full_model.nbases = nbases
+            full_model.mask[nbases:] = False
+            prev_model = deepcopy(full_model)
+            prev_model.nbases = nbases - 2
+            prev_model.mask[nbases - 2:] = False
+
+            prev_data_matrix, prev_data_matrix_mean, prev_covariance_matrix, prev_rhs, prev_chol, _, _ = \
+                prev_model._fit(x, y)
+            data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, coefficients, lof = \
+                full_model._append_fit(prev_data_matrix, prev_data_matrix_mean, prev_covariance_matrix, prev_rhs,
+                                       prev_chol, x, y, y_centred_sq)
+            coefficients = coefficients.copy()
+            ref_data_matrix, ref_data_matrix_mean, ref_covariance_matrix, ref_rhs, ref_chol, ref_coefficients, \
+                ref_lof = full_model._fit(x, y)
+
+            assert np.allclose(ref_data_matrix, data_matrix), f"{backend} Backend {nbases}: Data matrix"
+            assert np.allclose(ref_data_matrix_mean, data_matrix_mean), f"{backend} Backend {nbases}: Data matrix Mean"
+            assert np.allclose(ref_covariance_matrix, covariance_matrix), \
+                f"{backend} Backend {nbases}: Covariance matrix"
+            assert np.allclose(ref_rhs, rhs), f"{backend} Backend {nbases}: RHS"
+            assert np.allclose(ref_chol, chol), f"{backend} Backend {nbases}: Chol"
+            assert np.allclose(ref_coefficients, coefficients), f"{backend} Backend {nbases}: Coefficients"
+            assert np.allclose(ref_lof, lof), f"{backend} Backend {nbases}: Generalised Cross Validation"
+
+
 def test_update():
     x, y, y_true = utils.generate_data()
     model = utils.reference_model(x)
@@ -162,17 +298,17 @@ def test_update():
         model.backend = backend
 
         prev_root = x[np.argmin(np.abs(x[:, 1] - 0.8)), 1]
-        model.root[2, 4] = prev_root
+        model.root[4] = prev_root
         next_roots = sorted([value for value in x[:, 1] if value < prev_root], reverse=True)[:3]
 
-        data_matrix = ref_data_matrix.copy()
+        data_matrix = np.array(ref_data_matrix, order="F")
         data_matrix_mean = ref_data_matrix_mean.copy()
-        covariance_matrix = ref_cov_matrix.copy()
+        covariance_matrix = np.array(ref_cov_matrix, order="F")
         rhs = ref_rhs.copy()
-        chol = ref_chol.copy()
+        chol = np.array(ref_chol, order="F")
         model.coefficients = ref_coefficients.copy()
         for i, next_root in enumerate(next_roots):
-            model.root[2, 4] = next_root
+            model.root[4] = next_root
             (data_matrix,
              data_matrix_mean,
              covariance_matrix,
@@ -201,6 +337,103 @@ def test_update():
             prev_root = next_root
 
 
+def test_sweep_fit():
+    x, y, y_true = utils.generate_data()
+    model = utils.reference_model(x)
+    model.y_mean = y.mean()
+    y_centred_sq = np.sum((y - y.mean()) ** 2)
+
+    for backend in omar.Backend:
+        model.backend = backend
+        sorted_indices = model._sort_predictors(x)[:, 1]
+        roots = x[sorted_indices, 1][x[sorted_indices, 1] < 0.8][:3]
+
+        model.root[4] = x[np.argmin(np.abs(x[:, 1] - 0.8)), 1]
+        data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, coefficients, lof = model._fit(x, y)
+        sweep_sums = np.zeros(3 * model.nbases + 1)
+        sweep_position = 0
+        for i, root in enumerate(roots):
+            model.root[4] = root
+            covariance_matrix, rhs, chol, coefficients, sweep_position, lof = \
+                model._sweep_fit(data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, sweep_sums,
+                                 sweep_position, x, y, sorted_indices, 2, y_centred_sq)
+            coefficients = coefficients.copy()
+
+            comp_data_matrix, comp_data_matrix_mean = model._data_matrix(x, model._active_base_indices())
+            comp_covariance_matrix = model._covariance_matrix(comp_data_matrix)
+            comp_rhs = model._rhs(y, comp_data_matrix)
+            comp_coefficients, comp_chol = model._coefficients(comp_covariance_matrix, comp_rhs)
+            comp_lof = model._generalised_cross_validation(y, comp_data_matrix, comp_chol)
+
+            assert sweep_position == np.sum(x[:, 1] >= root), f"{backend} Backend {i}: Position"
+            assert np.allclose(covariance_matrix, comp_covariance_matrix), f"{backend} Backend {i}: Covariance matrix"
+            assert np.allclose(rhs, comp_rhs), f"{backend} Backend {i}: RHS"
+            assert np.allclose(chol, comp_chol), f"{backend} Backend {i}: Chol"
+            assert np.allclose(coefficients, comp_coefficients), f"{backend} Backend {i}: Coefficients"
+            assert np.allclose(lof, comp_lof), f"{backend} Backend {i}: Generalised Cross Validation"
+
+
+def test_sweep_lofs():
+    x, y, y_true = utils.generate_data()
+    model = utils.reference_model(x)
+    model.backend = omar.Backend.PYTHON
+    model.y_mean = y.mean()
+    y_centred_sq = np.sum((y - y.mean()) ** 2)
+
+    sorted_indices = model._sort_predictors(x)[:, 1]
+    roots = x[sorted_indices, 1][x[sorted_indices, 1] < 0.8][:5]
+
+    model.root[4] = roots[0]
+    data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, coefficients, lof = model._fit(x, y)
+    lofs = model._sweep_lofs(data_matrix, data_matrix_mean, rhs, chol, x, y, sorted_indices, 2, roots, y_centred_sq)
+
+    for i, root in enumerate(roots):
+        model.root[4] = root
+        comp_data_matrix, comp_data_matrix_mean = model._data_matrix(x, model._active_base_indices())
+        comp_covariance_matrix = model._covariance_matrix(comp_data_matrix)
+        comp_rhs = model._rhs(y, comp_data_matrix)
+        comp_coefficients, comp_chol = model._coefficients(comp_covariance_matrix, comp_rhs)
+        comp_lof = model._generalised_cross_validation(y, comp_data_matrix, comp_chol)
+
+        assert np.allclose(lofs[i], comp_lof), f"Root {i}: Generalised Cross Validation"
+
+
+def test_sort_predictors():
+    x, y, y_true = utils.generate_data()
+
+    sorted_indices = {}
+    for backend in omar.Backend:
+        model = omar.OMAR(backend=backend)
+        sorted_indices[backend] = model._sort_predictors(x)
+        assert np.all(np.diff(np.take_along_axis(x, sorted_indices[backend], axis=0), axis=0) <= 0), \
+            f"{backend} Backend"
+
+    assert np.array_equal(sorted_indices[omar.Backend.FORTRAN], sorted_indices[omar.Backend.PYTHON]), \
+        "Unaligned Backends"
+    assert np.array_equal(sorted_indices[omar.Backend.NUMBA], sorted_indices[omar.Backend.PYTHON]), \
+        "Unaligned Backends"
+
+
+def test_select_roots():
+    x, y, y_true = utils.generate_data()
+    eligible_roots = np.round(np.sort(x[:, 0])[::-1], 1)
+
+    roots = {}
+    for backend in omar.Backend:
+        model = omar.OMAR(backend=backend)
+        assert np.array_equal(model._select_roots(eligible_roots), np.unique(eligible_roots)[::-1]), \
+            f"{backend} Backend: Unique roots"
+
+        model = omar.OMAR(minspan=3, endspan=5, max_nknots=7, backend=backend)
+        roots[backend] = model._select_roots(eligible_roots)
+        assert len(roots[backend]) <= 7, f"{backend} Backend: Number of roots"
+        assert np.all(np.diff(roots[backend]) < 0), f"{backend} Backend: Order of roots"
+        assert np.all(np.isin(roots[backend], eligible_roots[5:-5])), f"{backend} Backend: Endspan"
+
+    assert np.array_equal(roots[omar.Backend.FORTRAN], roots[omar.Backend.PYTHON]), "Unaligned Backends"
+    assert np.array_equal(roots[omar.Backend.NUMBA], roots[omar.Backend.PYTHON]), "Unaligned Backends"
+
+
 def test_expand_bases():
     x, y, y_true = utils.generate_data()
     model = utils.reference_model(x)
@@ -208,7 +441,7 @@ def test_expand_bases():
 
     model.mask = np.zeros_like(model.mask)
     model.nbases = 3
-    model.mask[1, 1:3] = True
+    model.mask[1:3] = True
     ref_first_lof = model._fit(x, y)[-1]
 
     models = {}
@@ -221,7 +454,7 @@ def test_expand_bases():
 
         models[backend].mask = np.zeros_like(model.mask)
         models[backend].nbases = 3
-        models[backend].mask[1, 1:3] = True
+        models[backend].mask[1:3] = True
         first_lof = models[backend]._fit(x, y)[-1]
 
         assert full_lof < 1, f"{backend} Backend: Full LOF"
@@ -229,28 +462,85 @@ def test_expand_bases():
 
     assert models[omar.Backend.FORTRAN].nbases == models[omar.Backend.PYTHON].nbases, "Unaligned Backends"
 
-def test_prune_bases():
+
+def test_removal_lofs():
     x, y, y_true = utils.generate_data()
     model = utils.reference_model(x)
     model.y_mean = y.mean()
 
+    data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, coefficients, lof = model._fit(x, y)
+    y_centred_sq = np.sum((y - y.mean()) ** 2)
+
+    ref_lofs = []
+    for basis_idx in model._active_base_indices():
+        trimmed_model = deepcopy(model)
+        trimmed_model.mask[basis_idx] = False
+        trimmed_model.nbases -= 1
+        ref_lofs.append(trimmed_model._fit(x, y)[-1])
+
+    for backend in omar.Backend:
+        model.backend = backend
+        lofs = model._removal_lofs(covariance_matrix, rhs, y_centred_sq, len(y))
+        assert np.allclose(ref_lofs, lofs), f"{backend} Backend"
+
+
+def test_prune_bases():
+    # Noise can make a random hinge worth keeping, the seed fixes data on which pruning recovers the reference model
+    rng = np.random.default_rng(0)
+    x, y, y_true = utils.generate_data(rng=rng)
+    model = utils.reference_model(x)
+    model.y_mean = y.mean()
+
     ref_lof = model._fit(x, y)[-1]
 
     for backend in omar.Backend:
         test_model = deepcopy(model)
 
-        test_model.mask[:, 5:] = np.random.choice(a=[False, True], size=test_model.mask[:, 5:].shape)
-        test_model.mask[1, 5:] = True
+        test_model.mask[5:] = True
         test_model.nbases = 11
-        test_model.truncated[:, 5:] = np.random.choice(a=[False, True], size=test_model.truncated[:, 5:].shape)
-        test_model.root[:, 5:] = np.random.choice(a=x[:, 0], size=test_model.root[:, 5:].shape)
-        test_lof = test_model._fit(x,y)[-1]
+        # A chain of products of random hinges on top of the last basis of the reference model
+        test_model.parent[5:] = np.arange(4, 10)
+        test_model.truncated[5:] = rng.choice(a=[False, True], size=test_model.truncated[5:].shape)
+        test_model.root[5:] = rng.choice(a=x[:, 0], size=test_model.root[5:].shape)
+        test_lof = test_model._fit(x, y)[-1]
 
         test_model.backend = backend
         test_lof = test_model._prune_bases(x, y, test_lof)
 
         assert test_model == model, f"{backend} Backend: \n {model} \n vs. \n {test_model}"
 
+
+def test_prune_bases_row_tiles():
+    # Several row tiles and a partial last one, the compiled backends build the normal equations tile by tile
+    rng = np.random.default_rng(1)
+    x, y, y_true = utils.generate_data(1000, rng=rng)
+    model = utils.reference_model(x)
+    model.y_mean = y.mean()
+    model.mask[5:] = True
+    model.nbases = 11
+    model.parent[5:] = np.arange(4, 10)
+    model.truncated[5:] = rng.choice(a=[False, True], size=model.truncated[5:].shape)
+    model.root[5:] = rng.choice(a=x[:, 0], size=model.root[5:].shape)
+    lof = model._fit(x, y)[-1]
+
+    ref_model = deepcopy(model)
+    ref_model.backend = omar.Backend.PYTHON
+    ref_lof = ref_model._prune_bases(x, y, lof)
+
+    for backend in omar.Backend:
+        test_model = deepcopy(model)
+        test_model.backend = backend
+        test_lof = test_model._prune_bases(x, y, lof)
+
+        assert test_model == ref_model, f"{backend} Backend: Bases"
+        assert np.allclose(test_lof, ref_lof), f"{backend} Backend: LOF"
+        assert np.allclose(test_model.coefficients, ref_model.coefficients), f"{backend} Backend: Coefficients"
+        assert np.allclose(test_model.data_matrix_mean, ref_model.data_matrix_mean), f"{backend} Backend: Mean"
+        assert np.allclose(test_model.covariance_matrix, ref_model.covariance_matrix), \
+            f"{backend} Backend: Covariance matrix"
+        assert np.allclose(test_model.rhs, ref_model.rhs), f"{backend} Backend: Right hand side"
+
+
 def test_find_bases():
     x, y, y_true = utils.generate_data()
     model = utils.reference_model(x)
@@ -258,7 +548,7 @@ def test_find_bases():
 
     model.mask = np.zeros_like(model.mask)
     model.nbases = 3
-    model.mask[1, 1:3] = True
+    model.mask[1:3] = True
     ref_first_lof = model._fit(x, y)[-1]
 
     models = {}
@@ -268,10 +558,392 @@ def test_find_bases():
 
         models[backend].mask = np.zeros_like(model.mask)
         models[backend].nbases = 3
-        models[backend].mask[1, 1:3] = True
+        models[backend].mask[1:3] = True
         first_lof = models[backend]._fit(x, y)[-1]
 
         assert full_lof < 1, f"{backend} Backend: Full LOF"
         assert first_lof <= ref_first_lof, f"{backend} Backend: First LOF"
 
-    assert models[omar.Backend.FORTRAN].nbases == models[omar.Backend.PYTHON].nbases, "Unaligned Backends"
\ No newline at end of file
+    assert models[omar.Backend.FORTRAN].nbases == models[omar.Backend.PYTHON].nbases, "Unaligned Backends"
+
+
+def test_multiple_targets():
+    x, y, y_true = utils.generate_data()
+    ys = np.column_stack([y, y_true, x[:, 1] ** 2])
+
+    # Equivalent bases, like a repeated linear basis, may be swapped by rounding
+    model = omar.OMAR(backend=omar.Backend.PYTHON)
+    lof = model.find_bases(x, y)
+    comp_model = omar.OMAR(backend=omar.Backend.PYTHON)
+    comp_lof = comp_model.find_bases(x, np.column_stack([y, y]))
+
+    assert np.allclose(2 * lof, comp_lof), "Identical targets: Generalised Cross Validation"
+    assert np.allclose(comp_model(x), np.column_stack([model(x)] * 2)), "Identical targets: Prediction"
+
+    model = omar.OMAR(backend=omar.Backend.PYTHON)
+    lof = model.find_bases(x, ys)
+    assert model.coefficients.shape == (model.nbases - 1, 3), "Coefficients"
+    assert model(x).shape == ys.shape, "Prediction"
+    assert np.allclose(model.compile()(x), model(x)), "Compiled prediction"
+
+    sweep_model = deepcopy(model)
+    sweep_model.y_mean = ys.mean(axis=0)
+    assert np.allclose(sweep_model._fit(x, ys)[-1], lof), "Generalised Cross Validation"
+    for i in range(ys.shape[1]):
+        sweep_model.y_mean = ys[:, i].mean()
+        coefficients = sweep_model._fit(x, ys[:, i])[5]
+        assert np.allclose(model.coefficients[:, i], coefficients), f"Target {i}: Coefficients"
+
+    # The batched sweep sums the lack of fit criterion over the targets
+    sweep_model = utils.reference_model(x)
+    sweep_model.backend = omar.Backend.PYTHON
+    sweep_model.y_mean = ys.mean(axis=0)
+    y_centred_sq = np.sum((ys - ys.mean(axis=0)) ** 2)
+    sorted_indices = sweep_model._sort_predictors(x)[:, 1]
+    roots = x[sorted_indices, 1][x[sorted_indices, 1] < 0.8][:5]
+
+    sweep_model.root[4] = roots[0]
+    data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, coefficients, _ = sweep_model._fit(x, ys)
+    lofs = sweep_model._sweep_lofs(data_matrix, data_matrix_mean, rhs, chol, x, ys, sorted_indices, 2, roots,
+                                   y_centred_sq)
+    for i, root in enumerate(roots):
+        sweep_model.root[4] = root
+        assert np.allclose(lofs[i], sweep_model._fit(x, ys)[-1]), f"Root {i}: Generalised Cross Validation"
+
+    for backend in omar.Backend:
+        model = omar.OMAR(backend=backend)
+        lof = model.find_bases(x, y)
+        comp_model = omar.OMAR(backend=backend)
+        comp_lof = comp_model.find_bases(x, np.column_stack([y, y]))
+        assert np.allclose(2 * lof, comp_lof), f"{backend} Backend: Identical targets: Generalised Cross Validation"
+        assert np.allclose(comp_model(x), np.column_stack([model(x)] * 2)), \
+            f"{backend} Backend: Identical targets: Prediction"
+
+        model = omar.OMAR(backend=backend)
+        lof = model.find_bases(x, ys)
+        assert model.coefficients.shape == (model.nbases - 1, 3), f"{backend} Backend: Coefficients"
+        assert model(x).shape == ys.shape, f"{backend} Backend: Prediction"
+        assert np.allclose(model._fit(x, ys)[-1], lof), f"{backend} Backend: Generalised Cross Validation"
+
+        # The sweep sums hold one running sum of every response variable
+        sweep_model.backend = backend
+        sweep_model.root[4] = roots[0]
+        data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, coefficients, _ = sweep_model._fit(x, ys)
+        sweep_sums = np.zeros(3 * sweep_model.nbases - 1 + 2 * ys.shape[1])
+        sweep_position = 0
+        for i, root in enumerate(roots[1:]):
+            sweep_model.root[4] = root
+            covariance_matrix, rhs, chol, coefficients, sweep_position, lof = \
+                sweep_model._sweep_fit(data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, sweep_sums,
+                                       sweep_position, x, ys, sorted_indices, 2, y_centred_sq)
+            fit = sweep_model._fit(x, ys)
+            assert np.allclose(rhs, fit[3]), f"{backend} Backend {i}: RHS"
+            assert np.allclose(lof, fit[-1]), f"{backend} Backend {i}: Generalised Cross Validation"
+
+        models = omar.OMAR(backend=backend).fit_path(x, ys, [3])
+        assert all(model(x).shape == ys.shape for model in models.values()), f"{backend} Backend: Fit path"
+        model = omar.OMAR(backend=backend)
+        model.partial_fit(x[:50], ys[:50])
+        model.partial_fit(x[50:], ys[50:])
+        assert model.rhs.shape == (model.nbases - 1, 3), f"{backend} Backend: Partial fit"
+
+
+def test_find_bases_per_target():
+    x, y, y_true = utils.generate_data()
+    ys = np.column_stack([y, y_true])
+
+    for backend in omar.Backend:
+        models = omar.OMAR(backend=backend).find_bases_per_target(x, ys)
+        assert len(models) == 2, f"{backend} Backend: Number of models"
+
+        for i, model in enumerate(models):
+            comp_model = omar.OMAR(backend=backend)
+            comp_model.find_bases(x, ys[:, i])
+            assert model == comp_model, f"{backend} Backend {i}: Bases"
+            assert np.allclose(model.coefficients, comp_model.coefficients), f"{backend} Backend {i}: Coefficients"
+
+
+def test_fit_path():
+    x, y, y_true = utils.generate_data()
+
+    for backend in omar.Backend:
+        path = omar.OMAR(backend=backend).fit_path(x, y, [1., 3.], [5, 11])
+        assert set(path) == {(1., 5), (1., 11), (3., 5), (3., 11)}, f"{backend} Backend: Keys"
+
+        for (penalty, size), model in path.items():
+            comp_model = omar.OMAR(max_nbases=size, max_ncandidates=size, penalty=penalty, backend=backend)
+            comp_model.find_bases(x, y)
+
+            assert model.nbases == comp_model.nbases, f"{backend} Backend {penalty} {size}: Number of bases"
+            assert np.allclose(model(x), comp_model(x)), f"{backend} Backend {penalty} {size}: Prediction"
+
+
+def test_cross_validate():
+    x, y, y_true = utils.generate_data()
+    test = np.arange(len(y)) * 4 // len(y) == 1
+
+    for backend in omar.Backend:
+        scores, models = omar.OMAR(backend=backend).cross_validate(x, y, folds=4, nthreads=2)
+
+        comp_model = omar.OMAR(backend=backend)
+        comp_model.find_bases(x[~test], y[~test])
+        comp_score = np.mean((comp_model(x[test]) - y[test]) ** 2)
+
+        assert len(scores) == len(models) == 4, f"{backend} Backend: Number of folds"
+        assert models[1] == comp_model, f"{backend} Backend: Model"
+        assert np.allclose(scores[1], comp_score), f"{backend} Backend: Score"
+
+    # The folds of Fortran-ordered predictors reach the Fortran backend without another copy
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        omar.OMAR(backend=omar.Backend.FORTRAN).cross_validate(np.asfortranarray(x), y, folds=4)
+
+    # A fresh interpreter, since the threading layer of Numba is chosen once per process
+    code = """
+import numpy as np
+import omar
+
+x = np.random.normal(size=(200, 2))
+scores, models = omar.OMAR(backend=omar.Backend.NUMBA).cross_validate(x, x[:, 0] ** 2, folds=4)
+print(len(scores))
+"""
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            env={**os.environ, "NUMBA_THREADING_LAYER": "workqueue"})
+    assert result.returncode == 0 and result.stdout.strip() == "4", f"Workqueue threading layer {result.stderr}"
+
+
+def test_partial_fit():
+    x, y, y_true = utils.generate_data(4 * utils.N_SAMPLES)
+    batches = np.split(np.arange(len(y)), 4)
+
+    for backend in omar.Backend:
+        model = omar.OMAR(backend=backend)
+        model.find_bases(x[batches[0]], y[batches[0]])
+        comp_model = deepcopy(model)
+        for batch in batches[1:]:
+            lof = model.partial_fit(x[batch], y[batch], drift=np.inf)
+
+        comp_model.y_mean = y.mean()
+        data_matrix, data_matrix_mean, covariance_matrix, rhs, chol, coefficients, comp_lof = comp_model._fit(x, y)
+
+        assert model == comp_model, f"{backend} Backend: Bases"
+        assert model.n_samples == len(y), f"{backend} Backend: Number of samples"
+        assert np.allclose(model.y_mean, y.mean()), f"{backend} Backend: Mean"
+        assert np.allclose(model.data_matrix_mean, data_matrix_mean), f"{backend} Backend: Data matrix mean"
+        assert np.allclose(model.covariance_matrix, covariance_matrix), f"{backend} Backend: Covariance matrix"
+        assert np.allclose(model.coefficients, coefficients), f"{backend} Backend: Coefficients"
+        assert np.allclose(lof, comp_lof), f"{backend} Backend: Generalised Cross Validation"
+
+        # A changed relationship prunes the bases on all samples, then continues the basis search on the new ones
+        keys = {model._basis_key(basis_idx) for basis_idx in model._active_base_indices()}
+        y_new = 4 * np.maximum(0, 2.5 - x[batches[0], 1]) + 0.12 * np.random.normal(size=len(batches[0]))
+        lof = model.partial_fit(x[batches[0]], y_new)
+        new_keys = {model._basis_key(basis_idx) for basis_idx in model._active_base_indices()}
+        assert new_keys - keys, f"{backend} Backend: New bases"
+        assert model.n_samples == len(batches[0]), f"{backend} Backend: Restarted samples"
+        assert np.allclose(model.y_mean, y_new.mean()), f"{backend} Backend: Restarted mean"
+        assert model.search_lof == lof, f"{backend} Backend: Search LOF"
+        assert len(model.coefficients) == len(model.rhs) == len(model._active_base_indices()), \
+            f"{backend} Backend: Statistics"
+        assert np.allclose(model.covariance_matrix @ model.coefficients, model.rhs), \
+            f"{backend} Backend: Search coefficients"
+        assert np.mean((model(x[batches[0]]) - y_new) ** 2) < 0.05, f"{backend} Backend: New relationship"
+
+        # A small drifting batch only prunes the accumulated normal equations and keeps the history
+        small_model = omar.OMAR(backend=backend)
+        small_model.find_bases(x[batches[0]], y[batches[0]])
+        small_model.partial_fit(x[batches[1]], y[batches[1]], drift=np.inf)
+        keys = {small_model._basis_key(basis_idx) for basis_idx in small_model._active_base_indices()}
+        small = batches[0][:10]
+        small_model.partial_fit(x[small], y_new[:10], drift=0.)
+        new_keys = {small_model._basis_key(basis_idx) for basis_idx in small_model._active_base_indices()}
+        y_seen = np.concatenate([y[batches[0]], y[batches[1]], y_new[:10]])
+        assert new_keys <= keys, f"{backend} Backend: Small batch: Bases"
+        assert small_model.n_samples == len(y_seen), f"{backend} Backend: Small batch: Number of samples"
+        assert np.allclose(small_model.y_mean, y_seen.mean()), f"{backend} Backend: Small batch: Mean"
+        assert np.allclose(small_model.y_centred_sq, np.sum((y_seen - y_seen.mean()) ** 2)), \
+            f"{backend} Backend: Small batch: Squared norm"
+        assert np.allclose(small_model.covariance_matrix @ small_model.coefficients, small_model.rhs), \
+            f"{backend} Backend: Small batch: Coefficients"
+
+
+def test_workspace():
+    x, y, y_true = utils.generate_data()
+    workspace = omar.Workspace(len(y), 11)
+
+    assert workspace.fits(len(y), 11)
+    assert not workspace.fits(2 * len(y), 11)
+
+    model = omar.OMAR(workspace=workspace)
+    ref_model = omar.OMAR()
+    for i in range(2):
+        lof = model.find_bases(x, y)
+        ref_lof = ref_model.find_bases(x, y)
+
+        assert model == ref_model, f"Fit {i}"
+        assert np.allclose(lof, ref_lof), f"Fit {i}"
+
+
+def test_parent_chain():
+    x, y, y_true = utils.generate_data()
+    model = utils.reference_model(x)
+    x1 = x[np.argmin(np.abs(x[:, 0] - 1)), 0]
+    x08 = x[np.argmin(np.abs(x[:, 1] - 0.8)), 1]
+
+    assert model._basis_key(1) == ((0, 0., False),), "Linear basis"
+    assert model._basis_key(4) == ((0, x1, True), (1, x08, True)), "Parent chain"
+
+    # The model is stored in arrays of length max_nbases
+    model = omar.OMAR(max_nbases=2001)
+    for array in (model.mask, model.parent, model.truncated, model.cov, model.root):
+        assert array.shape == (2001,), "Size"
+
+
+def test_basis_cache():
+    x, y, y_true = utils.generate_data()
+    model = utils.reference_model(x)
+    model.backend = omar.Backend.PYTHON
+    ref_data_matrix, ref_data_matrix_mean = model._data_matrix(x, model._active_base_indices())
+
+    model.basis_cache = omar.BasisCache()
+    data_matrix, data_matrix_mean = model._data_matrix(x, model._active_base_indices())
+    assert np.allclose(ref_data_matrix, data_matrix), "Data matrix"
+    assert np.allclose(ref_data_matrix_mean, data_matrix_mean), "Data matrix mean"
+    # The parent chains share the hinges of the first covariate
+    assert len(model.basis_cache.columns) == 4, "Cached columns"
+
+    model.basis_cache = omar.BasisCache(2 * x[:, 0].nbytes)
+    data_matrix, data_matrix_mean = model._data_matrix(x, model._active_base_indices())
+    assert np.allclose(ref_data_matrix, data_matrix), "Eviction"
+    assert model.basis_cache.nbytes <= model.basis_cache.max_bytes, "Memory cap"
+
+    model.basis_cache.column(x.copy(), model._basis_key(1))
+    assert len(model.basis_cache.columns) == 1, "New dataset"
+
+    model.basis_cache = omar.BasisCache()
+    changed_x = x.copy()
+    model._data_matrix(changed_x, model._active_base_indices())
+    changed_x[:] = changed_x[::-1]
+    data_matrix, data_matrix_mean = model._data_matrix(changed_x, model._active_base_indices())
+    assert np.allclose(ref_data_matrix[::-1], data_matrix), "Changed in place"
+
+    model = omar.OMAR(backend=omar.Backend.PYTHON, basis_cache=omar.BasisCache())
+    ref_model = omar.OMAR(backend=omar.Backend.PYTHON)
+    lof = model.find_bases(x, y)
+    ref_lof = ref_model.find_bases(x, y)
+    assert np.allclose(lof, ref_lof), "Find bases"
+    assert np.allclose(model(x), ref_model(x)), "Prediction"
+
+
+def test_dtype():
+    x, y, y_true = utils.generate_data()
+    model = utils.reference_model(x)
+    model.y_mean = y.mean()
+    model.backend = omar.Backend.PYTHON
+    ref_fit = model._fit(x, y)
+
+    single_model = deepcopy(model)
+    single_model.dtype = np.float32
+    single_fit = single_model._fit(x.astype(np.float32), y)
+
+    assert single_fit[0].dtype == np.float32, "Data matrix"
+    for ref_result, single_result in zip(ref_fit[2:6], single_fit[2:6]):
+        assert single_result.dtype == np.float64, "Normal equations"
+        assert np.allclose(ref_result, single_result, rtol=1e-4, atol=1e-4)
+    assert np.isclose(ref_fit[-1], single_fit[-1], rtol=1e-4)
+
+    ref_lof = omar.OMAR(backend=omar.Backend.PYTHON).find_bases(x, y)
+    single_model = omar.OMAR(dtype=np.float32, backend=omar.Backend.PYTHON)
+    single_lof = single_model.find_bases(x.astype(np.float32), y)
+
+    assert np.isclose(ref_lof, single_lof, rtol=0.2)
+    assert np.allclose(single_model(x.astype(np.float32)), y_true, atol=0.5)
+
+    for backend in omar.Backend:
+        if backend is not omar.Backend.PYTHON:
+            with pytest.raises(ValueError, match="Single precision"):
+                omar.OMAR(dtype=np.float32, backend=backend)
+            single_model.backend = backend
+            with pytest.raises(ValueError, match="Single precision"):
+                single_model.find_bases(x, y)
+
+    model = omar.OMAR()
+    model.find_bases(x, y)
+    single_pred = model.compile(dtype=np.float32)(x.astype(np.float32))
+    assert single_pred.dtype == np.float64, "Accumulated in double precision"
+    assert np.allclose(single_pred, model.compile()(x), rtol=1e-4, atol=1e-4), "Frozen single precision"
+
+
+def test_compile():
+    x, y, y_true = utils.generate_data()
+    new_x, _, _ = utils.generate_data(50)
+    # Several tiles
+    large_x = np.tile(x, (400, 1))
+
+    for backend in omar.Backend:
+        model = omar.OMAR(backend=backend)
+        model.find_bases(x, y)
+        frozen_model = model.compile()
+
+        assert np.allclose(frozen_model(x), model(x)), f"{backend} Backend: Prediction"
+        assert np.allclose(frozen_model(new_x), model(new_x)), f"{backend} Backend: New rows"
+        assert np.allclose(model(new_x[:1]), model(new_x)[:1]), f"{backend} Backend: Single row"
+        assert np.allclose(frozen_model(large_x), np.tile(model(x), 400)), f"{backend} Backend: Tiles"
+        assert np.allclose(model.compile(nthreads=1)(large_x), frozen_model(large_x)), f"{backend} Backend: Threads"
+
+    model = omar.OMAR(backend=omar.Backend.PYTHON)
+    model.find_bases_chunked(omar.row_chunks(x, y, 7))
+    assert np.allclose(model.compile()(x), model(x)), "Chunked"
+
+    # The thread pool is created once and every copy starts its own
+    frozen_model = model.compile(nthreads=2)
+    executor = frozen_model.executor
+    frozen_model(large_x)
+    assert frozen_model.executor is executor, "Persistent pool"
+    frozen_copy = deepcopy(frozen_model)
+    assert frozen_copy.executor is not executor and np.allclose(frozen_copy(large_x), frozen_model(large_x)), "Copy"
+
+    # Means of other basis functions of the same number are not used
+    basis_idx = model._active_base_indices()[-1]
+    model.root[basis_idx] += 0.5
+    data_matrix, data_matrix_mean = model._data_matrix(x, model._active_base_indices())
+    assert np.allclose(model(x), model.y_mean + (data_matrix + data_matrix_mean) @ model.coefficients), "Edited"
+    with pytest.raises(AssertionError):
+        model.compile()
+
+
+def test_find_bases_chunked():
+    x, y, y_true = utils.generate_data()
+
+    for backend in omar.Backend:
+        model = omar.OMAR(backend=backend)
+        lof = model.find_bases_chunked(omar.row_chunks(x, y, 7))
+
+        ref_model = omar.OMAR(backend=backend)
+        ref_lof = ref_model.find_bases_chunked(omar.row_chunks(x, y))
+
+        assert lof < 1, f"{backend} Backend: LOF"
+        # Equivalent bases can swap places in the backward pass, so the predictions are compared
+        assert np.allclose(model(x), ref_model(x)), f"{backend} Backend: Chunk size"
+        assert np.allclose(lof, ref_lof), f"{backend} Backend: Chunk size"
+        assert np.allclose(lof, model._fit(x, y)[-1]), f"{backend} Backend: Sufficient statistics"
+
+        # The bordered normal equations of the forward pass give the lack of fit criterion of a refit
+        chunks = omar.row_chunks(x, y, 7)
+        forward_lof = model._expand_bases_chunked(chunks, model._chunked_roots(chunks, len(y)), len(y),
+                                                  np.sum((y - y.mean()) ** 2))
+        assert np.allclose(forward_lof, model._fit(x, y)[-1]), f"{backend} Backend: Forward pass"
+
+        # Several response variables share the basis functions, with one column of sums each
+        comp_model = omar.OMAR(backend=backend)
+        comp_lof = comp_model.find_bases_chunked(omar.row_chunks(x, np.column_stack([y, y]), 7))
+        assert np.allclose(2 * ref_lof, comp_lof), f"{backend} Backend: Identical targets: LOF"
+        assert np.allclose(comp_model(x), np.column_stack([ref_model(x)] * 2)), \
+            f"{backend} Backend: Identical targets: Prediction"
+
+        ys = np.column_stack([y, y_true])
+        multi_model = omar.OMAR(backend=backend)
+        multi_lof = multi_model.find_bases_chunked(omar.row_chunks(x, ys, 7))
+        assert multi_model.coefficients.shape == (multi_model.nbases - 1, 2), f"{backend} Backend: Coefficients"
+        assert multi_model(x).shape == ys.shape, f"{backend} Backend: Prediction"
+        assert np.allclose(multi_lof, multi_model._fit(x, ys)[-1]), f"{backend} Backend: Several targets: LOF"
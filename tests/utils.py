@@ -8,18 +8,19 @@ N_SAMPLES = 100
 DIM = 2
 
 
-def generate_data(n_samples: int = N_SAMPLES, dim: int = DIM) \
+def generate_data(n_samples: int = N_SAMPLES, dim: int = DIM, rng: np.random.Generator | None = None) \
         -> tuple[
             Float[np.ndarray, "{n_samples} {dim}"],
             Float[np.ndarray, "{n_samples}"],
             Float[np.ndarray, "{n_samples}"]
         ]:
-    x = np.random.normal(2, 1, size=(n_samples, dim))
+    rng = np.random if rng is None else rng
+    x = rng.normal(2, 1, size=(n_samples, dim))
     y_true = (x[:, 0] +
               np.maximum(0, (x[:, 0] - 1)) +
               np.maximum(0, (x[:, 0] - 1)) * x[:, 1] +
               np.maximum(0, (x[:, 0] - 1)) * np.maximum(0, (x[:, 1] - 0.8)))
-    y = y_true + 0.12 * np.random.normal(size=n_samples)
+    y = y_true + 0.12 * rng.normal(size=n_samples)
     return x, y, y_true
 
 
@@ -30,14 +31,13 @@ def reference_model(x: Float[np.ndarray, "n_samples"]) -> OMAR:
     x08 = x[np.argmin(np.abs(x[:, 1] - 0.8)), 1]
 
     model.nbases = 5
-    model.mask[1, 1:3] = True
-    model.mask[1:3, 3:5] = [True, True]
-    model.truncated[1, 2:5] = True
-    model.truncated[2, 4] = True
-    model.cov[1, 1:5] = 0
-    model.cov[2, 3:5] = 1
-    model.root[1, 2:5] = x1
-    model.root[2, 4] = x08
+    model.mask[1:5] = True
+    model.parent[3:5] = 2
+    model.truncated[[2, 4]] = True
+    model.cov[1:3] = 0
+    model.cov[3:5] = 1
+    model.root[2] = x1
+    model.root[4] = x08
 
     model.coefficients = np.array([1, 1, 1, 1, 1])
 